@@ -0,0 +1,125 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Deterministic payloads for benchmarks, sized like production traffic
+"""
+
+import wave
+
+from io import BytesIO
+from random import Random
+from tempfile import mkdtemp
+from time import time
+from typing import Sequence
+
+from neon_utils.configuration_utils import get_neon_user_config
+
+LANGS = ("en-us", "uk-ua", "de-de")
+GENDERS = ("female", "male")
+SAMPLE_RATE = 16000
+BROWSER_SAMPLE_RATE = 44100
+# openWakeWord expects 80 ms frames
+WW_FRAME_SAMPLES = 1280
+
+
+def get_pcm(duration: float, sample_rate: int = SAMPLE_RATE,
+            seed: int = 0) -> bytes:
+    """
+    Get 16-bit mono noise. Noise is used rather than silence so payloads are
+    not unrealistically compressible.
+    :param duration: length of the audio in seconds
+    :param sample_rate: audio sample rate
+    :param seed: random seed
+    :returns: raw PCM audio
+    """
+    num_bytes = 2 * int(duration * sample_rate)
+    return Random(seed).getrandbits(8 * num_bytes).to_bytes(num_bytes,
+                                                           "little")
+
+
+def get_wav(duration: float = 10.0, sample_rate: int = SAMPLE_RATE,
+            seed: int = 0) -> bytes:
+    """
+    Get a 16-bit mono WAV file
+    :param duration: length of the audio in seconds
+    :param sample_rate: audio sample rate
+    :param seed: random seed
+    :returns: WAV file contents
+    """
+    wav_io = BytesIO()
+    with wave.open(wav_io, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(get_pcm(duration, sample_rate, seed))
+    return wav_io.getvalue()
+
+
+def get_profile() -> dict:
+    """
+    Get a default user profile
+    """
+    return get_neon_user_config(mkdtemp()).content
+
+
+def get_klat_response(audio: bytes, langs: Sequence[str] = LANGS,
+                      genders: Sequence[str] = GENDERS) -> dict:
+    """
+    Get a `klat.response` with TTS audio in multiple languages and genders
+    :param audio: TTS audio for every language and gender
+    :param langs: response languages
+    :param genders: TTS voice genders
+    :returns: serializable message
+    """
+    responses = dict()
+    for lang in langs:
+        response = {"sentence": f"The time is 10:15 AM ({lang}).",
+                    "translated": lang != langs[0],
+                    "genders": list(genders),
+                    "audio": dict()}
+        for gender in genders:
+            response[gender] = f"{gender}.wav"
+            response["audio"][gender] = audio
+        responses[lang] = response
+    now = time()
+    return {"msg_type": "klat.response",
+            "data": {"responses": responses},
+            "context": {"client_name": "benchmark",
+                        "client": "mq_api",
+                        "ident": str(now),
+                        "username": "benchmark",
+                        "user_profiles": [get_profile()],
+                        "neon_should_respond": True,
+                        "mq": {"routing_key": "benchmark",
+                               "message_id": "benchmark"},
+                        "timing": {"client_sent": now - 1.5,
+                                   "wait_in_queue": 0.002,
+                                   "iris_input_handling": 0.01,
+                                   "transcribed": now - 1.2,
+                                   "text_parsers": 0.05,
+                                   "speech_start": now - 0.6,
+                                   "response_sent": now - 0.01}}}
@@ -0,0 +1,397 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Micro-benchmarks for the hot paths of a Neon Iris client. Each benchmark
+reports per-call latency and memory allocated by a single call. Results may be
+saved as a baseline and later runs checked against it, i.e.:
+
+    python benchmarks/run_benchmarks.py --save
+    python benchmarks/run_benchmarks.py --check
+"""
+
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+from contextlib import ExitStack
+from datetime import datetime
+from os.path import dirname, join, realpath
+from statistics import median
+from tempfile import mkdtemp
+from timeit import Timer
+from typing import Any, Callable, Dict, List, Optional
+from unittest.mock import Mock, patch
+
+import click
+
+from pika import BasicProperties
+from pika.spec import Basic
+
+sys.path.append(dirname(dirname(realpath(__file__))))
+from benchmarks.fixtures import BROWSER_SAMPLE_RATE, GENDERS, LANGS, \
+    SAMPLE_RATE, WW_FRAME_SAMPLES, get_klat_response, get_pcm, get_wav
+from neon_iris.client import NeonAIClient
+from neon_iris.testing.fake_mq import fake_mq_connection
+from neon_iris.serialization import LEGACY_CODEC, audio_to_bytes, \
+    get_codec_by_name
+from ovos_utils.log import LOG
+
+DEFAULT_BASELINE = join(dirname(realpath(__file__)), "baselines",
+                        "baseline.json")
+
+_benchmarks: Dict[str, Callable[["Fixtures"], Callable[[], Any]]] = dict()
+
+
+class BenchmarkSkipped(Exception):
+    """
+    Raised by a benchmark setup if its optional dependencies are missing
+    """
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function accepts Fixtures and returns
+    the callable to be measured.
+    :param name: unique benchmark name
+    """
+    def wrapper(setup: Callable[["Fixtures"], Callable[[], Any]]):
+        _benchmarks[name] = setup
+        return setup
+    return wrapper
+
+
+class _Channel:
+    def basic_ack(self, delivery_tag: int):
+        pass
+
+
+class Fixtures:
+    """
+    Lazily-created objects shared between benchmarks
+    """
+    def __init__(self, stack: ExitStack):
+        self._stack = stack
+        self._client = None
+        self._wav_file = None
+        self._klat_response = None
+
+    @property
+    def client(self) -> NeonAIClient:
+        """
+        NeonAIClient connected to an in-process broker
+        """
+        if not self._client:
+            stack = self._stack
+            stack.enter_context(fake_mq_connection())
+            with patch("neon_iris.client.Configuration",
+                       Mock(return_value={"iris": {}})), \
+                    patch("neon_iris.client.xdg_cache_home",
+                          Mock(return_value=mkdtemp())):
+                self._client = NeonAIClient({"server": "localhost"},
+                                            mkdtemp())
+            stack.callback(self._client.shutdown)
+        return self._client
+
+    @property
+    def wav_file(self) -> str:
+        """
+        Path to a 10 second WAV file
+        """
+        if not self._wav_file:
+            self._wav_file = join(mkdtemp(), "input.wav")
+            with open(self._wav_file, "wb") as f:
+                f.write(get_wav(10))
+        return self._wav_file
+
+    @property
+    def klat_response(self) -> dict:
+        """
+        `klat.response` with 10 seconds of TTS audio in each language and
+        gender
+        """
+        if not self._klat_response:
+            self._klat_response = get_klat_response(get_wav(10, seed=1))
+        return self._klat_response
+
+
+def _get_msgpack_codec():
+    codec = get_codec_by_name("msgpack")
+    if not codec:
+        raise BenchmarkSkipped("msgpack is not installed")
+    return codec
+
+
+@benchmark("build_message")
+def _build_message(fixtures: Fixtures):
+    client = fixtures.client
+    context = {"session": {"session_id": "benchmark"}}
+    return lambda: client._serialize_utterance("what time is it", "en-us",
+                                               None, None, context)
+
+
+@benchmark("user_config")
+def _user_config(fixtures: Fixtures):
+    client = fixtures.client
+    return lambda: client.user_config["speech"]["stt_language"]
+
+
+@benchmark("user_config_to_dict")
+def _user_config_to_dict(fixtures: Fixtures):
+    client = fixtures.client
+    return lambda: client.user_config.to_dict()
+
+
+@benchmark("serialize_audio_legacy")
+def _serialize_audio_legacy(fixtures: Fixtures):
+    client = fixtures.client
+    wav_file = fixtures.wav_file
+    return lambda: LEGACY_CODEC.encode(
+        client._serialize_audio(wav_file, "en-us", None, None))
+
+
+@benchmark("serialize_audio_msgpack")
+def _serialize_audio_msgpack(fixtures: Fixtures):
+    codec = _get_msgpack_codec()
+    client = fixtures.client
+    wav_file = fixtures.wav_file
+    return lambda: codec.encode(
+        client._serialize_audio(wav_file, "en-us", None, None))
+
+
+@benchmark("decode_response_legacy")
+def _decode_response_legacy(fixtures: Fixtures):
+    body = LEGACY_CODEC.encode(fixtures.klat_response)
+    return lambda: LEGACY_CODEC.decode(body)
+
+
+@benchmark("decode_response_msgpack")
+def _decode_response_msgpack(fixtures: Fixtures):
+    codec = _get_msgpack_codec()
+    body = codec.encode(fixtures.klat_response)
+    return lambda: codec.decode(body)
+
+
+@benchmark("handle_neon_response")
+def _handle_neon_response(fixtures: Fixtures):
+    client = fixtures.client
+    body = LEGACY_CODEC.encode(fixtures.klat_response)
+    channel = _Channel()
+    method = Basic.Deliver(delivery_tag=1, routing_key=client.uid)
+    properties = BasicProperties()
+    return lambda: client.handle_neon_response(channel, method, properties,
+                                               body)
+
+
+@benchmark("decode_tts_audio")
+def _decode_tts_audio(fixtures: Fixtures):
+    responses = LEGACY_CODEC.decode(LEGACY_CODEC.encode(
+        fixtures.klat_response))["data"]["responses"]
+
+    def _decode():
+        for lang in LANGS:
+            for gender in GENDERS:
+                audio_to_bytes(responses[lang]["audio"][gender])
+    return _decode
+
+
+@benchmark("audio_cache_hit")
+def _audio_cache_hit(fixtures: Fixtures):
+    cache = fixtures.client.audio_cache
+    response = LEGACY_CODEC.decode(LEGACY_CODEC.encode(
+        fixtures.klat_response))["data"]["responses"]["en-us"]
+    audio = response["audio"]["female"]
+    sentence = response["sentence"]
+    cache.put("en-us", "female", sentence, audio)
+    return lambda: cache.put("en-us", "female", sentence, audio)
+
+
+@benchmark("resample_ww_frame")
+def _resample_ww_frame(_: Fixtures):
+    try:
+        import numpy as np
+        from neon_iris.resample import StreamResampler
+    except ImportError as e:
+        raise BenchmarkSkipped(e)
+    # Browser audio covering one openWakeWord frame
+    num_samples = WW_FRAME_SAMPLES * BROWSER_SAMPLE_RATE // SAMPLE_RATE
+    audio_bytes = get_pcm(num_samples / BROWSER_SAMPLE_RATE,
+                          BROWSER_SAMPLE_RATE)
+    resampler = StreamResampler(BROWSER_SAMPLE_RATE, SAMPLE_RATE)
+
+    def _resample():
+        audio_data = np.frombuffer(audio_bytes, dtype=np.int16)
+        return resampler.process(audio_data)
+    return _resample
+
+
+@benchmark("oww_predict")
+def _oww_predict(_: Fixtures):
+    try:
+        import numpy as np
+        from neon_iris.wakeword import WakeWordModel
+        model = WakeWordModel([join(
+            dirname(dirname(realpath(__file__))), "neon_iris",
+            "wakeword_models", "hey_neon", "hey_neon_high.onnx")])
+    except Exception as e:
+        raise BenchmarkSkipped(e)
+    stream = model.create_stream()
+    audio_data = np.frombuffer(get_pcm(WW_FRAME_SAMPLES / SAMPLE_RATE),
+                               dtype=np.int16)
+    return lambda: model.predict(stream, audio_data)
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> dict:
+    """
+    Measure the latency and memory allocation of a callable
+    :param func: callable to measure
+    :param repeat: number of timed rounds of at least 0.2 seconds each
+    :returns: dict median and min per-call latency in microseconds, peak
+        memory allocated during one call and memory retained after one call
+        in KiB
+    """
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat, number)]
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"median_us": round(median(times) * 1e6, 3),
+            "min_us": round(min(times) * 1e6, 3),
+            "iterations": number * repeat,
+            "peak_kib": round((peak - start) / 1024, 3),
+            "retained_kib": round((current - start) / 1024, 3)}
+
+
+def run_benchmarks(names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    Run benchmarks
+    :param names: names of benchmarks to run (default all)
+    :returns: dict of benchmark name to `measure` results. Skipped benchmarks
+        are omitted.
+    """
+    results = dict()
+    with ExitStack() as stack:
+        fixtures = Fixtures(stack)
+        for name, setup in _benchmarks.items():
+            if names and name not in names:
+                continue
+            try:
+                func = setup(fixtures)
+            except BenchmarkSkipped as e:
+                click.echo(f"{name:<28} skipped ({e})")
+                continue
+            results[name] = measure(func)
+            result = results[name]
+            click.echo(f"{name:<28} {result['median_us']:>12.1f} us "
+                       f"{result['peak_kib']:>12.1f} KiB peak "
+                       f"{result['retained_kib']:>10.1f} KiB retained")
+    return results
+
+
+def compare_results(results: Dict[str, dict], baseline: Dict[str, dict],
+                    time_tolerance: float = 0.5,
+                    memory_tolerance: float = 0.1) -> List[str]:
+    """
+    Compare benchmark results to a baseline
+    :param results: results of `run_benchmarks`
+    :param baseline: results of a previous run
+    :param time_tolerance: allowed fractional increase in min latency
+    :param memory_tolerance: allowed fractional increase in peak memory
+    :returns: list of regression descriptions
+    """
+    regressions = list()
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # The fastest round is least affected by other load on the machine
+        if result["min_us"] > base["min_us"] * (1 + time_tolerance):
+            regressions.append(f"{name}: min {result['min_us']}us > "
+                               f"baseline {base['min_us']}us")
+        # Allow 1 KiB of noise for benchmarks that allocate very little
+        if result["peak_kib"] > \
+                base["peak_kib"] * (1 + memory_tolerance) + 1:
+            regressions.append(f"{name}: peak {result['peak_kib']}KiB > "
+                               f"baseline {base['peak_kib']}KiB")
+    return regressions
+
+
+def _get_environment() -> dict:
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+@click.command(help="Run Neon Iris micro-benchmarks")
+@click.option("--benchmark", "-b", "names", multiple=True,
+              type=click.Choice(list(_benchmarks)),
+              help="Benchmark to run (default all)")
+@click.option("--baseline", default=DEFAULT_BASELINE,
+              help="Path to baseline results")
+@click.option("--save", is_flag=True, default=False,
+              help="Save results as the baseline")
+@click.option("--check", is_flag=True, default=False,
+              help="Exit with an error if results regressed from baseline")
+@click.option("--time-tolerance", default=0.5,
+              help="Allowed fractional increase in latency")
+@click.option("--memory-tolerance", default=0.1,
+              help="Allowed fractional increase in peak memory")
+def main(names, baseline, save, check, time_tolerance, memory_tolerance):
+    # Per-response logging would dominate the measured time
+    LOG.set_level("ERROR")
+    results = run_benchmarks(list(names))
+    if check:
+        with open(baseline) as f:
+            saved = json.load(f)
+        if saved.get("environment") != _get_environment():
+            click.echo(f"Baseline environment differs: "
+                       f"{saved.get('environment')}")
+        regressions = compare_results(results, saved["results"],
+                                      time_tolerance, memory_tolerance)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+    if save:
+        os.makedirs(dirname(baseline), exist_ok=True)
+        with open(baseline, "w") as f:
+            json.dump({"created": datetime.now().isoformat(),
+                       "environment": _get_environment(),
+                       "results": results}, f, indent=2)
+        click.echo(f"Saved baseline to {baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from inspect import isawaitable
+from typing import List, Optional
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+from neon_iris.client import NeonAIClient
+from neon_iris.futures import ResponseFuture
+from neon_iris.mq_connection import MQConnectionHub
+
+
+class AsyncNeonAIClient(NeonAIClient):
+    """
+    NeonAIClient for use within an asyncio event loop. Sending methods are
+    awaitable and never block the loop, and handler methods (i.e.
+    `handle_klat_response`) may be defined as coroutines. Responses received
+    on MQ consumer threads are handled on the event loop.
+    """
+    def __init__(self, mq_config: dict = None, config_dir: str = None,
+                 hub: Optional[MQConnectionHub] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        :param mq_config: MQ configuration
+        :param config_dir: path to user configuration directory
+        :param hub: MQConnectionHub to share with other clients
+        :param loop: event loop to handle responses on. If not specified, the
+            loop running the first awaited call to this client is used
+        """
+        self._loop = loop
+        # MQ connections are not thread-safe; publish from a single thread
+        self._publisher = ThreadPoolExecutor(max_workers=1,
+                                             thread_name_prefix="iris_mq")
+        NeonAIClient.__init__(self, mq_config, config_dir, hub)
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """
+        Event loop responses are handled on, if one has been bound
+        """
+        return self._loop
+
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Bind this client to an event loop. Responses received before a loop
+        is bound are handled on the thread that received them.
+        :param loop: event loop to bind to (default the running loop)
+        """
+        self._loop = loop or asyncio.get_running_loop()
+
+    async def _run_in_publisher(self, func, *args, **kwargs):
+        if not self._loop:
+            self.bind_loop()
+        # `run_in_executor` does not propagate context (i.e. the active
+        # tracing span) to the executor thread
+        return await self._loop.run_in_executor(
+            self._publisher, partial(copy_context().run, func, *args,
+                                     **kwargs))
+
+    async def send_utterance(self, utterance: str, lang: str = "en-us",
+                             username: Optional[str] = None,
+                             user_profiles: Optional[list] = None,
+                             context: Optional[dict] = None) -> \
+            ResponseFuture:
+        """
+        Emit a text input without blocking the event loop
+        :param utterance: utterance to submit to skills module
+        :param lang: language code associated with request
+        :param username: username associated with request
+        :param user_profiles: user profiles expecting a response
+        :param context: Optional dict context to add to emitted message
+        :returns: ResponseFuture to pass to `wait_for_response`
+        """
+        return await self._run_in_publisher(self._send_utterance, utterance,
+                                            lang, username, user_profiles,
+                                            context)
+
+    async def send_audio(self, audio_file: str, lang: str = "en-us",
+                         username: Optional[str] = None,
+                         user_profiles: Optional[list] = None,
+                         context: Optional[dict] = None) -> ResponseFuture:
+        """
+        Emit an audio input without blocking the event loop
+        :param audio_file: path to audio file to send to speech module
+        :param lang: language code associated with request
+        :param username: username associated with request
+        :param user_profiles: user profiles expecting a response
+        :param context: Optional dict context to add to emitted message
+        :returns: ResponseFuture to pass to `wait_for_response`
+        """
+        return await self._run_in_publisher(self._send_audio, audio_file,
+                                            lang, username, user_profiles,
+                                            context)
+
+    async def send_utterances(self, utterances: List[str],
+                              lang: str = "en-us",
+                              username: Optional[str] = None,
+                              user_profiles: Optional[list] = None,
+                              context: Optional[dict] = None) -> \
+            List[ResponseFuture]:
+        """
+        Emit many text inputs with publisher confirms without blocking the
+        event loop
+        :param utterances: utterances to submit to skills module
+        :param lang: language code associated with requests
+        :param username: username associated with requests
+        :param user_profiles: user profiles expecting responses
+        :param context: Optional dict context to add to emitted messages
+        :returns: list of ResponseFuture to pass to `wait_for_response`
+        """
+        return await self._run_in_publisher(
+            NeonAIClient.send_utterances, self, utterances, lang, username,
+            user_profiles, context)
+
+    async def send_audio_batch(self, audio_files: List[str],
+                               lang: str = "en-us",
+                               username: Optional[str] = None,
+                               user_profiles: Optional[list] = None,
+                               context: Optional[dict] = None) -> \
+            List[ResponseFuture]:
+        """
+        Emit many audio inputs with publisher confirms without blocking the
+        event loop
+        :param audio_files: paths to audio files to send to speech module
+        :param lang: language code associated with requests
+        :param username: username associated with requests
+        :param user_profiles: user profiles expecting responses
+        :param context: Optional dict context to add to emitted messages
+        :returns: list of ResponseFuture to pass to `wait_for_response`
+        """
+        return await self._run_in_publisher(
+            NeonAIClient.send_audio_batch, self, audio_files, lang, username,
+            user_profiles, context)
+
+    async def wait_for_response(self, future: ResponseFuture,
+                                timeout: Optional[float] = 30) -> \
+            Optional[Message]:
+        """
+        Wait for the final response to an emitted request
+        :param future: ResponseFuture returned by a `send_` method
+        :param timeout: max seconds to wait for a response
+        :returns: final response Message, or None if no response was received
+        """
+        self._pending.expire_stale()
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          timeout)
+        except asyncio.TimeoutError:
+            self._pending.discard(future.message_id)
+            self._metrics.timeouts.inc()
+            return None
+        except Exception as e:
+            LOG.error(f"Request {future.message_id} failed: {e}")
+            return None
+
+    def _handle_message(self, message: Message, error: bool = False):
+        """
+        Schedule handling of a response on the bound event loop.
+        :param message: Message received from Neon
+        :param error: True if `message` was received on the error queue
+        """
+        if self._loop and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(
+                self._handle_message_async(message, error), self._loop)
+        else:
+            asyncio.run(self._handle_message_async(message, error))
+
+    async def _handle_message_async(self, message: Message, error: bool):
+        try:
+            if error:
+                result = self.handle_error_response(message)
+            else:
+                result = self._dispatch_message(message)
+            if isinstance(result, Future):
+                await asyncio.wrap_future(result)
+            elif isawaitable(result):
+                await result
+        except Exception as e:
+            LOG.exception(f"Error handling {message.msg_type}: {e}")
+        finally:
+            self._pending.resolve(message, final=error or None)
+
+    def shutdown(self):
+        """
+        Cleanly shuts down the MQ connection associated with this client
+        """
+        NeonAIClient.shutdown(self)
+        self._publisher.shutdown(wait=False)
@@ -0,0 +1,199 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from collections import OrderedDict
+from hashlib import sha256
+from os import listdir, makedirs, remove, replace
+from os.path import getsize, isfile, join, splitext
+from tempfile import NamedTemporaryFile
+from threading import RLock
+from typing import Optional, Union
+
+from ovos_utils.log import LOG
+
+from neon_iris.serialization import audio_to_bytes
+
+
+class AudioCache:
+    """
+    Size-bounded cache of TTS audio files, keyed by a hash of the language,
+    gender, and text they were generated from. Least recently used files are
+    removed when the cache exceeds `max_bytes`.
+    """
+    index_file = "index.json"
+
+    def __init__(self, cache_dir: str, max_bytes: int = 100 * 1024 * 1024):
+        """
+        :param cache_dir: directory to write audio files to
+        :param max_bytes: max total size of cached audio files
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = RLock()
+        self._index = OrderedDict()
+        self._size = 0
+        makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @property
+    def size(self) -> int:
+        """
+        Total size in bytes of cached audio files
+        """
+        return self._size
+
+    @staticmethod
+    def get_key(lang: str, gender: str, text: str) -> str:
+        """
+        Get the cache key for some TTS audio
+        :param lang: language of the audio
+        :param gender: voice gender of the audio
+        :param text: text spoken in the audio
+        :returns: hex digest identifying the audio
+        """
+        return sha256(json.dumps([lang, gender, text]).encode()).hexdigest()
+
+    def get(self, lang: str, gender: str, text: str,
+            username: Optional[str] = None) -> Optional[str]:
+        """
+        Get a cached audio file
+        :param lang: language of the audio
+        :param gender: voice gender of the audio
+        :param text: text spoken in the audio
+        :param username: user requesting the audio
+        :returns: path to the cached audio file, if cached
+        """
+        key = self.get_key(lang, gender, text)
+        with self._lock:
+            entry = self._index.get(key)
+            if not entry:
+                return None
+            path = join(self.cache_dir, entry['file'])
+            if not isfile(path):
+                LOG.warning(f"Cached audio removed: {path}")
+                self._remove(key)
+                return None
+            self._index.move_to_end(key)
+            if username and username not in entry['users']:
+                entry['users'].append(username)
+            return path
+
+    def put(self, lang: str, gender: str, text: str,
+            audio_data: Union[str, bytes], ext: str = ".wav",
+            username: Optional[str] = None) -> str:
+        """
+        Add audio to the cache. If the audio is already cached, `audio_data`
+        is not decoded or written again.
+        :param lang: language of the audio
+        :param gender: voice gender of the audio
+        :param text: text spoken in the audio
+        :param audio_data: raw bytes or base64-encoded string audio
+        :param ext: file extension of the audio (i.e. `.mp3`)
+        :param username: user requesting the audio
+        :returns: path to the cached audio file
+        """
+        with self._lock:
+            path = self.get(lang, gender, text, username)
+            if path:
+                return path
+            key = self.get_key(lang, gender, text)
+            filename = f"{key}{ext}"
+            audio_bytes = audio_to_bytes(audio_data)
+            self._write_file(filename, audio_bytes)
+            self._index[key] = {"file": filename, "size": len(audio_bytes),
+                                "users": [username] if username else []}
+            self._size += len(audio_bytes)
+            self._evict()
+            self._save_index()
+            return join(self.cache_dir, filename)
+
+    def clear(self, username: Optional[str] = None):
+        """
+        Remove cached audio
+        :param username: if specified, only remove audio not requested by
+            any other user
+        """
+        with self._lock:
+            for key, entry in list(self._index.items()):
+                if username:
+                    if username not in entry['users']:
+                        continue
+                    entry['users'].remove(username)
+                    if entry['users']:
+                        continue
+                self._remove(key)
+            self._save_index()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            LOG.debug(f"Evicting cached audio: {key}")
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._index.pop(key)
+        self._size -= entry['size']
+        try:
+            remove(join(self.cache_dir, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def _write_file(self, filename: str, data: bytes):
+        with NamedTemporaryFile("wb", dir=self.cache_dir, suffix=".tmp",
+                                delete=False) as f:
+            f.write(data)
+        replace(f.name, join(self.cache_dir, filename))
+
+    def _save_index(self):
+        index = json.dumps(list(self._index.items())).encode()
+        self._write_file(self.index_file, index)
+
+    def _load_index(self):
+        index_path = join(self.cache_dir, self.index_file)
+        try:
+            with open(index_path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = []
+        except Exception as e:
+            LOG.warning(f"Resetting invalid audio cache index: {e}")
+            entries = []
+        for key, entry in entries:
+            path = join(self.cache_dir, entry['file'])
+            if isfile(path):
+                entry['size'] = getsize(path)
+                self._index[key] = entry
+                self._size += entry['size']
+        # Track files written by other processes sharing this directory
+        for file in listdir(self.cache_dir):
+            key = splitext(file)[0]
+            if len(key) == 64 and key not in self._index:
+                size = getsize(join(self.cache_dir, file))
+                self._index[key] = {"file": file, "size": size, "users": []}
+                self._size += size
+        self._evict()
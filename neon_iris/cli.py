@@ -38,6 +38,48 @@ from neon_iris.util import load_config_file
 from neon_iris.version import __version__
 
 
+def _write_metrics(path: str):
+    from neon_iris.metrics import REGISTRY
+    with open(expanduser(path), "w") as f:
+        f.write(REGISTRY.to_prometheus())
+    click.echo(f"Wrote metrics to {path}")
+
+
+def _profile_options(func):
+    """
+    Add options to enable profiling to a command
+    """
+    func = click.option(
+        '--profile-port', type=int, envvar="IRIS_PROFILE_PORT",
+        help="Serve profiles on this localhost port")(func)
+    func = click.option(
+        '--profile-dir', envvar="IRIS_PROFILE_DIR",
+        default="~/.cache/neon/neon_iris/profiles", show_default=True,
+        help="Directory to write profiles to on SIGUSR1")(func)
+    func = click.option(
+        '--profile-interval', type=float, envvar="IRIS_PROFILE_INTERVAL",
+        default=0.005, show_default=True,
+        help="Seconds between profiler samples")(func)
+    func = click.option(
+        '--profile', is_flag=True, default=False, envvar="IRIS_PROFILE",
+        help="Enable the sampling profiler and handler timers")(func)
+    return func
+
+
+def _start_profiler(profile: bool, profile_interval: float, profile_dir: str,
+                    profile_port: int):
+    if not profile:
+        return
+    from neon_iris.profiler import PROFILER
+    PROFILER.enable(profile_interval)
+    PROFILER.dump_on_signal(profile_dir)
+    click.echo(f"Profiling enabled; send SIGUSR1 to write profiles to "
+               f"{profile_dir}")
+    if profile_port is not None:
+        port = PROFILER.serve(profile_port)
+        click.echo(f"Serving profiles at http://127.0.0.1:{port}/profile")
+
+
 def _print_config():
     from ovos_config.config import Configuration
     config = Configuration().get('MQ')
@@ -65,7 +107,8 @@ def neon_iris_cli(version: bool = False):
               help="Language to accept input in")
 @click.option('--audio', '-a', is_flag=True, default=False,
               help="Flag to enable audio playback")
-def start_client(mq_config, user_config, lang, audio):
+@click.option('--metrics', help="Path to write Prometheus metrics to on exit")
+def start_client(mq_config, user_config, lang, audio, metrics):
     from neon_iris.client import CLIClient
     _print_config()
     if mq_config:
@@ -84,7 +127,8 @@ def start_client(mq_config, user_config, lang, audio):
     client.audio_enabled = audio
     click.echo("Enter '!{lang}' to change language\n"
                "Enter '!quit' to quit.\n"
-               "Enter '!mute' or '!unmute' to change audio playback")
+               "Enter '!mute' or '!unmute' to change audio playback\n"
+               "Enter '!metrics' to print metrics")
     try:
         while True:
             query = click.prompt("Query")
@@ -97,30 +141,43 @@ def start_client(mq_config, user_config, lang, audio):
                 elif query == "!unmute":
                     click.echo("Enabling Audio Playback")
                     client.audio_enabled = True
+                elif query == "!metrics":
+                    from neon_iris.metrics import REGISTRY
+                    click.echo(REGISTRY.to_prometheus())
                 else:
                     query = query.lstrip('!')
                     query = expanduser(query)
                     if isfile(query):
-                        client.send_audio(query, lang, client.username,
-                                          client.user_profiles)
+                        with client.tracer.span("cli.input", None,
+                                                {"input": "audio"}):
+                            client.send_audio(query, lang, client.username,
+                                              client.user_profiles)
                     else:
                         lang = query.split()[0]
-                        client.user_profiles[0]["speech"]["secondary_tts_language"] = lang
+                        profile = client.user_config.to_dict()
+                        profile["speech"]["secondary_tts_language"] = lang
+                        client.update_user_config(profile, persist=False)
                         click.echo(f"Language set to {lang}")
             else:
-                client.send_utterance(query, lang)
+                with client.tracer.span("cli.input", None,
+                                        {"input": "text"}):
+                    client.send_utterance(query, lang)
                 # Pad prompt for multiple responses
                 sleep(1)
     except Exception as e:
         click.echo(e)
     click.echo("Shutting Down Client")
     client.shutdown()
+    if metrics:
+        _write_metrics(metrics)
 
 
 @neon_iris_cli.command(help="Create an MQ listener session")
-def start_listener():
+@_profile_options
+def start_listener(**profile_options):
     from neon_iris.voice_client import NeonVoiceClient
     from ovos_utils import wait_for_exit_signal
+    _start_profiler(**profile_options)
     client = NeonVoiceClient()
     _print_config()
     wait_for_exit_signal()
@@ -128,9 +185,11 @@ def start_listener():
 
 
 @neon_iris_cli.command(help="Create a GradIO Client session")
-def start_gradio():
+@_profile_options
+def start_gradio(**profile_options):
     from neon_iris.web_client import GradIOClient
     _print_config()
+    _start_profiler(**profile_options)
     try:
         chat = GradIOClient()
         chat.run()
@@ -141,9 +200,11 @@ def start_gradio():
 @neon_iris_cli.command(help="Create a Web Voice Satellite session")
 @click.option("--port", "-p", default=8000, help="Port to run on, defaults to 8000")
 @click.option("--host", default="0.0.0.0", help="Host to run on, defaults to 0.0.0.0")
-def start_websat(port, host):
+@_profile_options
+def start_websat(port, host, **profile_options):
     from neon_iris.web_sat_client import app
     _print_config()
+    _start_profiler(**profile_options)
     try:
         import uvicorn
         uvicorn.run(app, host=host, port=port)
@@ -151,6 +212,84 @@ def start_websat(port, host):
         click.echo("Unable to connect to MQ server")
 
 
+@neon_iris_cli.command(help="Measure response latency under load")
+@click.option('--users', '-n', default=1,
+              help="Number of concurrent simulated users")
+@click.option('--rate', '-r', type=float, default=None,
+              help="Inputs per second to send across all users. If not "
+                   "specified, each user sends an input when its previous "
+                   "input completes")
+@click.option('--duration', '-d', default=60.0,
+              help="Max seconds to send inputs for")
+@click.option('--requests', type=int, default=None,
+              help="Max number of inputs to send")
+@click.option('--utterance', '-u', multiple=True,
+              help="Text input to send (may be repeated)")
+@click.option('--audio', '-a', multiple=True,
+              help="Path to audio input to send (may be repeated)")
+@click.option('--lang', '-l', default="en-us",
+              help="Language of inputs")
+@click.option('--timeout', '-t', default=30.0,
+              help="Seconds to wait for each response")
+@click.option('--output', '-o', help="Path to write JSON results to")
+@click.option('--compare', '-c',
+              help="Path to JSON results of a previous run to compare to")
+@click.option('--fake', is_flag=True, default=False,
+              help="Send inputs to an in-process fake Neon Core instead of MQ")
+@click.option('--fake-latency', default=0.0,
+              help="Response latency in seconds of the fake Neon Core")
+@click.option('--metrics', help="Path to write Prometheus metrics to")
+def bench(users, rate, duration, requests, utterance, audio, lang, timeout,
+          output, compare, fake, fake_latency, metrics):
+    import json
+    from contextlib import ExitStack
+    from neon_iris.client import NeonAIClient
+    from neon_iris.load_generator import LoadGenerator, compare_summaries, \
+        format_summary, get_inputs
+    from neon_iris.mq_connection import MQConnectionHub
+    inputs = get_inputs(utterance or ("what time is it",), audio)
+    LOG.init({"level": logging.WARNING})
+    with ExitStack() as stack:
+        if fake:
+            from neon_iris.testing.fake_mq import FakeNeonCore, \
+                fake_mq_connection
+            broker = stack.enter_context(fake_mq_connection())
+            stack.enter_context(FakeNeonCore(broker, latency=fake_latency))
+            mq_config = {"server": "localhost"}
+        else:
+            from ovos_config.config import Configuration
+            _print_config()
+            mq_config = Configuration().get("MQ")
+        # Simulated users share one MQ connection
+        hub = MQConnectionHub(mq_config)
+        stack.callback(hub.shutdown)
+        hub.wait_for_connection(timeout)
+        clients = list()
+        for _ in range(users):
+            clients.append(NeonAIClient(mq_config, hub=hub))
+            stack.callback(clients[-1].shutdown)
+        click.echo(f"Sending {'closed loop' if rate is None else f'{rate}/s'}"
+                   f" from {users} users")
+        results = LoadGenerator(clients, inputs, lang, rate, duration,
+                                requests, timeout).run()
+    summary = results["summary"]
+    click.echo("\n".join(format_summary(summary)))
+    if compare:
+        with open(expanduser(compare)) as f:
+            previous = json.load(f)["summary"]
+        click.echo("\n".join(compare_summaries(previous, summary)))
+    if output:
+        results["config"] = {"users": users, "rate": rate,
+                             "duration": duration, "requests": requests,
+                             "inputs": inputs, "lang": lang,
+                             "timeout": timeout, "fake": fake}
+        with open(expanduser(output), "w") as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"Wrote results to {output}")
+    if metrics:
+        _write_metrics(metrics)
+
+
 @neon_iris_cli.command(help="Query Neon Core for supported languages")
 def get_languages():
     from neon_iris.util import query_neon
@@ -25,67 +25,125 @@
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import json
-import shutil
 import subprocess
 
-from abc import abstractmethod
-from os import makedirs
-from os.path import join, isfile
+from concurrent.futures import Future
+from functools import partial
+from os import makedirs, replace
+from os.path import join, splitext
 from pprint import pformat
-from queue import Queue
 from threading import Event, Thread
 from time import time
-from typing import Optional
+from typing import Any, Callable, List, Optional
 from uuid import uuid4
 from ovos_bus_client.message import Message
+from pika.exceptions import AMQPError
 from ovos_utils.json_helper import merge_dict
-from pika.exceptions import StreamLostError
 from neon_utils.configuration_utils import get_neon_user_config
 from neon_utils.metrics_utils import Stopwatch
 from neon_utils.mq_utils import NeonMQHandler
-from neon_utils.socket_utils import b64_to_dict
-from neon_utils.file_utils import decode_base64_string_to_file, \
-    encode_file_to_base64_string
 from neon_utils.logger import LOG
 from ovos_utils.xdg_utils import xdg_config_home, xdg_cache_home
 from ovos_config.config import Configuration
 
+from neon_iris.audio_cache import AudioCache
+from neon_iris.futures import PendingRequests, ResponseFuture, \
+    get_message_id
+from neon_iris.handlers import MessageHandlerRegistry
+from neon_iris.metrics import ClientMetrics, get_timing_durations
+from neon_iris.mq_connection import MQConnectionHub, MQConnectionManager, \
+    PrefetchMQHandler, forward_error, is_forwarded_error, \
+    set_consumer_prefetch
+from neon_iris.outbox import Outbox
+from neon_iris.profiler import profiled
+from neon_iris.profile import ProfileReferences, ProfileSnapshot, \
+    profile_digest, thaw
+from neon_iris.serialization import LEGACY_CODEC, MessageCodec, \
+    get_body_patterns, get_codec, get_codec_by_name, supported_content_types
+from neon_iris.tracing import Span, get_tracer
+
 _stopwatch = Stopwatch()
 
 
 class NeonAIClient:
-    def __init__(self, mq_config: dict = None, config_dir: str = None):
+    def __init__(self, mq_config: dict = None, config_dir: str = None,
+                 hub: Optional[MQConnectionHub] = None):
+        """
+        :param mq_config: MQ configuration
+        :param config_dir: path to user configuration directory
+        :param hub: MQConnectionHub to share with other clients. If not
+            specified, this client will open its own MQ connection
+        """
         self._uid = str(uuid4())
+        self._error_patterns = get_body_patterns(self._uid)
         self._vhost = "/neon_chat_api"
         self._client = "mq_api"
         self.client_name = "unknown"
         self._config = mq_config or dict(Configuration()).get("MQ")
-        self._connection = self._init_mq_connection()
+        config = Configuration().get("iris", {})
+        self._pending = PendingRequests(
+            max_in_flight=config.get("max_in_flight", 0))
+        self._metrics = ClientMetrics()
+        self.tracer = get_tracer(config)
+        self._in_flight_wait = config.get("in_flight_wait", 0)
+        self._response_prefetch = config.get("response_prefetch")
+        self._codec_mode = config.get("mq_codec", "auto")
+        self._codec = get_codec_by_name(self._codec_mode) or LEGACY_CODEC
+        self._profile_refs = ProfileReferences() if \
+            config.get("profile_by_reference") else None
+        self._handlers = MessageHandlerRegistry(
+            config.get("handler_workers", 4))
+        self._register_default_handlers()
+        self._outbox = Outbox(
+            partial(self._publish, "neon_chat_api_request"),
+            self._handle_dropped_message,
+            max_size=config.get("outbox_max_size", 1000),
+            timeout=config.get("outbox_timeout", 30),
+            spill_dir=join(xdg_cache_home(), "neon", "neon_iris", "outbox",
+                           self.uid) if config.get("outbox_spill") else None,
+            retry_exceptions=(AMQPError, OSError))
+        self._metrics.in_flight.add_function(self._pending.__len__)
+        self._metrics.buffered.add_function(self._outbox.__len__)
         self._languages = dict()
         self._language_init = Event()
+        self._language_cache_ttl = config.get("language_cache_ttl", 86400)
         config_dir = config_dir or join(xdg_config_home(), "neon", "neon_iris")
 
         self._user_config = get_neon_user_config(config_dir)
         self._user_config["user"]["username"] = \
             self._user_config["user"]["username"] or self._uid
+        self._profile = ProfileSnapshot(self._user_config.content)
 
         self.audio_cache_dir = join(xdg_cache_home(), "neon", "neon_iris")
         makedirs(self.audio_cache_dir, exist_ok=True)
-
-        config = Configuration().get("iris", {})
+        self.audio_cache = AudioCache(
+            join(self.audio_cache_dir, "tts"),
+            config.get("audio_cache_max_bytes", 100 * 1024 * 1024))
+
+        # Responses may be received as soon as the client is connected, so
+        # connect only after everything handlers use is initialized
+        self._hub = hub
+        if hub:
+            self._connection_manager = hub.connection_manager
+            hub.register(self.uid, self.handle_neon_response,
+                         self._handle_error_message)
+        else:
+            self._connection_manager = MQConnectionManager(
+                self._init_mq_connection, config.get("mq_max_channels", 4))
 
         # Collect supported languages
         if config.get("enable_lang_api"):
-            message = self._build_message("neon.languages.get", {})
-            self._send_message(message)
-
-            if self._language_init.wait(30):
-                LOG.debug(f"Got language support: {self._languages}")
+            cached = self._load_language_cache()
+            if cached:
+                self._languages = cached
+                self._language_init.set()
+                LOG.debug(f"Using cached language support: {cached}")
+            # Refresh in the background so startup isn't blocked on MQ
+            Thread(target=self._request_languages, daemon=True).start()
 
         if not self._languages:
             lang_config = config.get('languages') or []
-            self._languages['stt'] = lang_config
-            self._languages['tts'] = lang_config
+            self._languages = {"stt": lang_config, "tts": lang_config}
             LOG.debug(f"Using supported langs configuration: {self._languages}")
 
     @property
@@ -97,60 +155,110 @@ class NeonAIClient:
 
     @property
     def default_username(self) -> str:
-        return self._user_config["user"]["username"]
+        return self._profile["user"]["username"]
 
     @property
-    def user_config(self) -> dict:
+    def user_config(self) -> ProfileSnapshot:
+        """
+        Read-only, JSON-parsable dict user configuration. Use `to_dict()` to
+        get a mutable copy.
+        """
+        return self._profile
+
+    def update_user_config(self, profile: dict, persist: bool = True):
         """
-        JSON-parsable dict user configuration
+        Replace the user configuration
+        :param profile: new user configuration
+        :param persist: if True, write the configuration to disk; else the
+            change only applies to this client until it is shut down
         """
-        return json.loads(json.dumps(self._user_config.content))
+        if not persist:
+            self._profile = ProfileSnapshot(thaw(profile))
+            return
+        self._user_config.from_dict(thaw(profile))
+        self._profile = ProfileSnapshot(self._user_config.content)
+
+    @property
+    def _connection(self) -> NeonMQHandler:
+        """
+        The current NeonMQHandler, without checking connection health
+        """
+        return self._connection_manager.mq_handler
 
     @property
     def connection(self) -> NeonMQHandler:
         """
         Returns a connected NeonMQHandler object
         """
-        if not self._connection.connection.is_open:
-            LOG.warning("Connection closed")
-            self._connection.stop()
-            self._connection = self._init_mq_connection()
-        try:
-            self._connection.connection.channel()
-        except StreamLostError:
-            LOG.warning("Connection unexpectedly closed, recreating")
-            self._connection.stop()
-            self._connection = self._init_mq_connection()
+        return self._connection_manager.get_handler()
+
+    @property
+    def _accept_content_types(self) -> list:
+        """
+        Response content types to advertise to the remote
+        """
+        if self._codec_mode == "legacy":
+            return []
+        return supported_content_types()
+
+    @property
+    def pending_requests(self) -> int:
+        """
+        Number of emitted requests that have not yet received a final response
+        """
+        return len(self._pending)
+
+    @property
+    def flow_stats(self) -> dict:
+        """
+        Current request flow state, for sizing `max_in_flight` and prefetch:
+        `in_flight`: requests awaiting a response
+        `max_in_flight`: max requests awaiting a response (0 for no limit)
+        `occupancy`: fraction of `max_in_flight` awaiting a response
+        `buffered`: messages waiting to be published
+        """
+        return {"in_flight": len(self._pending),
+                "max_in_flight": self._pending.max_in_flight,
+                "occupancy": self._pending.occupancy,
+                "buffered": len(self._outbox)}
 
-        return self._connection
+    def get_queue_depths(self) -> dict:
+        """
+        Get the number of messages waiting in MQ for Neon (`request`) and for
+        this client (`response`). This requires a round-trip to the broker.
+        """
+        manager = self._connection_manager
+        return {"request": manager.get_queue_depth("neon_chat_api_request"),
+                "response": manager.get_queue_depth(self.uid)}
 
     def shutdown(self):
         """
         Cleanly shuts down the MQ connection associated with this client
         """
-        try:
-            self._connection.stop()
-        except Exception as e:
-            LOG.error(e)
-            try:
-                self._connection.stop_sync_thread()
-            except Exception as x:
-                LOG.exception(x)
-                LOG.error("Sync Thread not shutdown")
-            try:
-                self._connection.stop_consumers()
-            except Exception as x:
-                LOG.exception(x)
-                LOG.error("Consumers not shutdown")
+        self._metrics.in_flight.remove_function(self._pending.__len__)
+        self._metrics.buffered.remove_function(self._outbox.__len__)
+        self._outbox.shutdown()
+        self._pending.cancel_all()
+        self._handlers.shutdown()
+        if self._hub:
+            self._hub.unregister(self.uid)
+        else:
+            self._connection_manager.stop()
 
-    def handle_neon_response(self, channel, method, _, body):
+    @profiled("handle_neon_response")
+    def handle_neon_response(self, channel, method, properties, body):
         """
         Override this method to handle Neon Responses
         """
+        if is_forwarded_error(properties):
+            # Error response passed on by another consumer of the error queue
+            self.handle_neon_error(channel, method, properties, body)
+            return
         channel.basic_ack(delivery_tag=method.delivery_tag)
         recv_time = time()
+        codec = self._get_response_codec(properties)
         with _stopwatch:
-            response = b64_to_dict(body)
+            response = codec.decode(body)
         LOG.debug(f"Message deserialized in {_stopwatch.time}s")
         message = Message(response.get('msg_type'), response.get('data'),
                           response.get('context'))
@@ -166,66 +274,198 @@ class NeonAIClient:
                                                                   recv_time)
         LOG.info(f"{message.msg_type} handled in {handling_time}")
         LOG.debug(f"{pformat(message.context['timing'])}")
-        if message.msg_type == "klat.response":
-            LOG.info("Handling klat response event")
-            self.handle_klat_response(message)
-        elif message.msg_type == "complete.intent.failure":
-            self.handle_complete_intent_failure(message)
-        elif message.msg_type == "neon.profile_update":
-            self._handle_profile_update(message)
-        elif message.msg_type == "neon.clear_data":
-            self._handle_clear_data(message)
-        elif message.msg_type == "klat.error":
-            self.handle_error_response(message)
-        elif message.msg_type == "neon.languages.get.response":
-            self._handle_supported_languages(message)
-        elif message.msg_type.endswith(".response"):
-            self.handle_api_response(message)
+        self._metrics.on_response(
+            message, handling_time if 'client_sent' in
+            message.context['timing'] else None)
+        parent = self._get_trace_parent(message)
+        if not parent:
+            self._handle_message(message)
+            return
+        self._record_response_spans(message, parent, recv_time,
+                                    recv_time + _stopwatch.time)
+        with self.tracer.span("iris.handle", parent,
+                              {"msg_type": message.msg_type}):
+            self._handle_message(message)
+
+    def _get_trace_parent(self, message: Message):
+        """
+        Get the span a response should be traced under
+        :param message: Message received from Neon
+        :returns: Span of the pending request, else the `traceparent` from
+            the response context, if any
+        """
+        if not self.tracer.enabled:
+            return None
+        future = self._pending.get(get_message_id(message))
+        if future and future.span:
+            return future.span
+        return message.context.get('traceparent')
+
+    def _record_response_spans(self, message: Message, parent,
+                               recv_time: float, decoded_time: float):
+        """
+        Record spans for the stages of a request reported in a response
+        :param message: Message received from Neon
+        :param parent: Span or `traceparent` to record spans under
+        :param recv_time: epoch time the response was received
+        :param decoded_time: epoch time the response was deserialized
+        """
+        timing = message.context['timing']
+        if 'client_sent' in timing and 'response_sent' in timing:
+            # Core does not report when it received the request, so this
+            # includes MQ transit time of the request
+            self.tracer.record_span("neon.core", timing['client_sent'],
+                                    timing['response_sent'], parent,
+                                    get_timing_durations(timing))
+            self.tracer.record_span("mq.response", timing['response_sent'],
+                                    recv_time, parent)
+        self.tracer.record_span("iris.decode", recv_time, decoded_time,
+                                parent, {"msg_type": message.msg_type})
+
+    def _handle_message(self, message: Message, error: bool = False):
+        """
+        Pass a deserialized response to its handler and then resolve any
+        pending request it responds to.
+        :param message: Message received from Neon
+        :param error: True if `message` was received on the error queue
+        """
+        final = error or None
+        try:
+            if error:
+                result = self.handle_error_response(message)
+            else:
+                result = self._dispatch_message(message)
+        except Exception:
+            self._pending.resolve(message, final)
+            raise
+        if isinstance(result, Future):
+            # Threaded handler; resolve once it has completed
+            result.add_done_callback(
+                lambda _: self._pending.resolve(message, final))
         else:
-            LOG.warning(f"Message not handled: {message.msg_type}")
+            self._pending.resolve(message, final)
+
+    def _dispatch_message(self, message: Message):
+        """
+        Route a deserialized response to the appropriate handler method
+        :param message: Message received from Neon
+        :returns: the return value of the handler method, or a Future if the
+            handler is threaded
+        """
+        return self._handlers.dispatch(message)
+
+    def _register_default_handlers(self):
+        """
+        Register handler methods for the messages handled by every client
+        """
+        self.register_handler(self.handle_klat_response, "klat.response")
+        self.register_handler(self.handle_complete_intent_failure,
+                              "complete.intent.failure")
+        self.register_handler(self._handle_profile_update,
+                              "neon.profile_update")
+        self.register_handler(self._handle_clear_data, "neon.clear_data")
+        self.register_handler(self.handle_error_response, "klat.error")
+        self.register_handler(self._handle_supported_languages,
+                              "neon.languages.get.response")
+        self.register_handler(self._handle_profile_request,
+                              "neon.profile.request")
+        self.register_handler(self.handle_api_response, suffix=".response")
+
+    def register_handler(self, handler: Callable[[Message], Any],
+                         msg_type: Optional[str] = None,
+                         prefix: Optional[str] = None,
+                         suffix: Optional[str] = None,
+                         threaded: bool = False):
+        """
+        Register a handler for received messages, replacing any handler
+        previously registered for the same `msg_type`, `prefix`, or `suffix`.
+        :param handler: callable accepting a Message
+        :param msg_type: exact msg_type to handle
+        :param prefix: msg_type prefix to handle
+        :param suffix: msg_type suffix to handle
+        :param threaded: if True, run the handler on a worker thread so the
+            MQ consumer thread is not blocked (i.e. for audio playback)
+        """
+        self._handlers.register(handler, msg_type, prefix, suffix, threaded)
 
-    def handle_neon_error(self, channel, method, _, body):
+    def handle_neon_error(self, channel, method, properties, body):
         """
         Override this method to handle Neon Error Responses
         """
-        response = b64_to_dict(body)
-        if response.get("context").get("routing_key") == self.uid:
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-            message = Message(response.get('msg_type'), response.get('data'),
-                              response.get('context'))
-            self.handle_error_response(message)
+        if not self._is_own_error(properties, body):
+            forward_error(channel, method, properties, body)
+            return
+        response = self._get_response_codec(properties).decode(body)
+        routing_key = response.get("context").get("routing_key")
+        if routing_key != self.uid:
+            forward_error(channel, method, properties, body, routing_key)
+            return
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        message = Message(response.get('msg_type'), response.get('data'),
+                          response.get('context'))
+        self._handle_error_message(message)
+
+    def _handle_error_message(self, message: Message):
+        """
+        Handle a deserialized message from the error queue
+        :param message: error Message routed to this client
+        """
+        self._metrics.on_response(message, error=True)
+        self._handle_message(message, error=True)
+
+    def _is_own_error(self, properties, body: bytes) -> bool:
+        """
+        Check if a message on the shared error queue may be for this client
+        without decoding it
+        :param properties: pika BasicProperties of the message
+        :param body: serialized message
+        :returns: False if the message is not for this client
+        """
+        headers = getattr(properties, "headers", None) or dict()
+        if "routing_key" in headers:
+            return headers["routing_key"] == self.uid
+        return any(p in body for p in self._error_patterns)
+
+    def _get_response_codec(self, properties) -> MessageCodec:
+        """
+        Get the codec for a received message. In `auto` mode, the first
+        response serialized with a binary codec indicates the remote supports
+        it and that codec is used for subsequent requests.
+        :param properties: AMQP properties of the received message
+        :returns: MessageCodec to deserialize the message with
+        """
+        codec = get_codec(getattr(properties, "content_type", None))
+        if self._codec_mode == "auto" and codec.binary and \
+                codec is not self._codec:
+            LOG.info(f"Remote supports {codec.name}, using it for requests")
+            self._codec = codec
+        return codec
 
-    @abstractmethod
     def handle_klat_response(self, message: Message):
         """
         Override this method to handle Neon Klat Responses
         """
 
-    @abstractmethod
     def handle_complete_intent_failure(self, message: Message):
         """
         Override this method to handle Neon Intent Failures
         """
 
-    @abstractmethod
     def handle_api_response(self, message: Message):
         """
         Override this method to handle API method responses (ie neon.get_stt)
         """
 
-    @abstractmethod
     def handle_error_response(self, message: Message):
         """
         Override this method to handle error responses from Neon
         """
 
-    @abstractmethod
     def clear_caches(self, message: Message):
         """
         Override this method to handle requests to clear caches
         """
 
-    @abstractmethod
     def clear_media(self, message: Message):
         """
         Override this method to handle requests to clear media (photos, etc)
@@ -235,27 +475,48 @@ class NeonAIClient:
         updated_profile = message.data["profile"]
         if updated_profile['user']['username'] == \
                 self.user_config['user']['username']:
-            self._user_config.from_dict(updated_profile)
+            self.update_user_config(updated_profile)
             LOG.info("Updated user profile")
         else:
             LOG.warning(f"Ignoring update for other user: {updated_profile}")
 
-    def _handle_clear_data(self, message: Message):
-        def _clear_audio_cache():
-            shutil.rmtree(self.audio_cache_dir)
-            makedirs(self.audio_cache_dir, exist_ok=True)
+    def _handle_profile_request(self, message: Message):
+        """
+        Handle a request from Neon for user profiles that were sent by
+        reference but are not cached by Neon. The referenced request is
+        re-sent with full profiles included.
+        """
+        if not self._profile_refs:
+            LOG.warning("Profile requested but profiles are not sent by "
+                        "reference")
+            return
+        future = self._pending.get(get_message_id(message))
+        if not future or not future.request:
+            LOG.warning(f"Requested profile for unknown request: "
+                        f"{message.context.get('mq')}")
+            return
+        context = dict(future.request['context'])
+        profiles = self._profile_refs.get_profiles(
+            context['user_profile_refs']) or [self.user_config]
+        context['user_profiles'] = profiles
+        context['user_profile_refs'] = [
+            {"username": p['user']['username'], "digest": profile_digest(p)}
+            for p in profiles]
+        LOG.info(f"Re-sending {future.msg_type} with full profiles")
+        self._outbox.send({**future.request, "context": context})
 
+    def _handle_clear_data(self, message: Message):
         request_user = message.data.get("username")
         if request_user != self.user_config['user']['username']:
             return
         requested_data = message.data.get("data_to_remove")
         if "ALL_DATA" in requested_data:
-            _clear_audio_cache()
+            self.audio_cache.clear(request_user)
             self.clear_caches(message)
             self.clear_media(message)
             return
         if "CACHES" in requested_data:
-            _clear_audio_cache()
+            self.audio_cache.clear(request_user)
             self.clear_caches(message)
         if "ALL_MEDIA" in requested_data:
             self.clear_media(message)
@@ -264,17 +525,80 @@ class NeonAIClient:
         # ALL_MEDIA, ALL_UNITS, ALL_LANGUAGE
 
     def _handle_supported_languages(self, message: Message):
-        self._languages = message.data
-        if not all((x in self._languages for x in ("stt", "tts"))):
-            LOG.warning(f"Language support incomplete response: {self._languages}")
-        self._languages['stt'].sort()
-        self._languages['tts'].sort()
+        languages = dict(message.data)
+        if not all((x in languages for x in ("stt", "tts"))):
+            LOG.warning(f"Language support incomplete response: {languages}")
+            return
+        languages['stt'] = sorted(languages['stt'])
+        languages['tts'] = sorted(languages['tts'])
+        self._languages = languages
         self._language_init.set()
+        LOG.debug(f"Got language support: {languages}")
+        self._save_language_cache(languages)
+
+    def _request_languages(self):
+        """
+        Request supported languages from Neon. The response is handled
+        asynchronously by `_handle_supported_languages`.
+        """
+        try:
+            message = self._build_message("neon.languages.get", {})
+            self._send_message(message)
+        except Exception as e:
+            LOG.error(f"Failed to request supported languages: {e}")
+
+    @property
+    def _language_cache_file(self) -> str:
+        return join(self.audio_cache_dir, "languages.json")
+
+    @property
+    def _language_cache_key(self) -> str:
+        mq_config = self._config.get("MQ") or self._config
+        return f"{mq_config.get('server')}:{mq_config.get('port')}" \
+               f"{self._vhost}"
+
+    def _load_language_cache(self) -> Optional[dict]:
+        """
+        Load supported languages cached for this MQ server
+        :returns: dict of cached `stt` and `tts` languages, if not expired
+        """
+        try:
+            with open(self._language_cache_file) as f:
+                cached = json.load(f).get(self._language_cache_key)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            LOG.warning(f"Failed to read language cache: {e}")
+            return None
+        if not cached or time() - cached['time'] > self._language_cache_ttl:
+            return None
+        return cached['languages']
+
+    def _save_language_cache(self, languages: dict):
+        """
+        Cache supported languages for this MQ server
+        :param languages: dict of supported `stt` and `tts` languages
+        """
+        try:
+            try:
+                with open(self._language_cache_file) as f:
+                    cache = json.load(f)
+            except (FileNotFoundError, ValueError):
+                cache = dict()
+            cache[self._language_cache_key] = {"time": time(),
+                                               "languages": languages}
+            makedirs(self.audio_cache_dir, exist_ok=True)
+            tmp_file = f"{self._language_cache_file}.{self.uid}"
+            with open(tmp_file, "w") as f:
+                json.dump(cache, f)
+            replace(tmp_file, self._language_cache_file)
+        except Exception as e:
+            LOG.warning(f"Failed to write language cache: {e}")
 
     def send_utterance(self, utterance: str, lang: str = "en-us",
                        username: Optional[str] = None,
                        user_profiles: Optional[list] = None,
-                       context: Optional[dict] = None):
+                       context: Optional[dict] = None) -> ResponseFuture:
         """
         Optionally override this to queue text inputs or do any pre-parsing
         :param utterance: utterance to submit to skills module
@@ -282,13 +606,15 @@ class NeonAIClient:
         :param username: username associated with request
         :param user_profiles: user profiles expecting a response
         :param context: Optional dict context to add to emitted message
+        :returns: ResponseFuture resolved with the response to this request
         """
-        self._send_utterance(utterance, lang, username, user_profiles, context)
+        return self._send_utterance(utterance, lang, username, user_profiles,
+                                    context)
 
     def send_audio(self, audio_file: str, lang: str = "en-us",
                    username: Optional[str] = None,
                    user_profiles: Optional[list] = None,
-                   context: Optional[dict] = None):
+                   context: Optional[dict] = None) -> ResponseFuture:
         """
         Optionally override this to queue audio inputs or do any pre-parsing
         :param audio_file: path to audio file to send to speech module
@@ -296,8 +622,10 @@ class NeonAIClient:
         :param username: username associated with request
         :param user_profiles: user profiles expecting a response
         :param context: Optional dict context to add to emitted message
+        :returns: ResponseFuture resolved with the response to this request
         """
-        self._send_audio(audio_file, lang, username, user_profiles, context)
+        return self._send_audio(audio_file, lang, username, user_profiles,
+                                context)
 
     def _build_message(self, msg_type: str, data: dict,
                        username: Optional[str] = None,
@@ -305,78 +633,278 @@ class NeonAIClient:
                        ident: str = None) -> Message:
         user_profiles = user_profiles or [self.user_config]
         username = username or user_profiles[0]['user']['username']
-        return Message(msg_type, data,
-                       {"client_name": self.client_name,
-                        "client": self._client,
-                        "ident": ident or str(time()),
-                        "username": username,
-                        "user_profiles": user_profiles,
-                        "neon_should_respond": True,
-                        "timing": {},
-                        "mq": {"routing_key": self.uid,
-                               "message_id": self.connection.create_unique_id()}
-                        })
+        context = {"client_name": self.client_name,
+                   "client": self._client,
+                   "ident": ident or str(time()),
+                   "username": username,
+                   "user_profiles": user_profiles,
+                   "neon_should_respond": True,
+                   "timing": {},
+                   "mq": {"routing_key": self.uid,
+                          "message_id": NeonMQHandler.create_unique_id(),
+                          "accept": self._accept_content_types}
+                   }
+        if self._profile_refs:
+            # Only include profiles Neon has not already received
+            context["user_profiles"], context["user_profile_refs"] = \
+                self._profile_refs.get_context(user_profiles)
+        return Message(msg_type, data, context)
+
+    def send_utterances(self, utterances: List[str], lang: str = "en-us",
+                        username: Optional[str] = None,
+                        user_profiles: Optional[list] = None,
+                        context: Optional[dict] = None) -> \
+            List[ResponseFuture]:
+        """
+        Send many text inputs at once. Messages are published together with
+        publisher confirms; `accepted` is set on each returned ResponseFuture
+        to indicate if the broker accepted that message.
+        :param utterances: utterances to submit to skills module
+        :param lang: language code associated with requests
+        :param username: username associated with requests
+        :param user_profiles: user profiles expecting responses
+        :param context: Optional dict context to add to emitted messages
+        :returns: list of ResponseFuture for each utterance, in order
+        """
+        return self._send_serialized_batch(
+            [self._serialize_utterance(utterance, lang, username,
+                                       user_profiles, context)
+             for utterance in utterances])
+
+    def send_audio_batch(self, audio_files: List[str], lang: str = "en-us",
+                         username: Optional[str] = None,
+                         user_profiles: Optional[list] = None,
+                         context: Optional[dict] = None) -> \
+            List[ResponseFuture]:
+        """
+        Send many audio inputs at once. Messages are published together with
+        publisher confirms; `accepted` is set on each returned ResponseFuture
+        to indicate if the broker accepted that message.
+        :param audio_files: paths to audio files to send to speech module
+        :param lang: language code associated with requests
+        :param username: username associated with requests
+        :param user_profiles: user profiles expecting responses
+        :param context: Optional dict context to add to emitted messages
+        :returns: list of ResponseFuture for each audio file, in order
+        """
+        return self._send_serialized_batch(
+            [self._serialize_audio(audio_file, lang, username,
+                                   user_profiles, context)
+             for audio_file in audio_files])
 
     def _send_utterance(self, utterance: str, lang: str,
                         username: str, user_profiles: list,
-                        context: Optional[dict] = None):
+                        context: Optional[dict] = None) -> ResponseFuture:
+        span = self.tracer.start_span("iris.request")
+        with self.tracer.span("iris.serialize", span):
+            serialized = self._serialize_utterance(utterance, lang, username,
+                                                   user_profiles, context)
+        return self._send_serialized_message(serialized, span)
+
+    def _send_audio(self, audio_file: str, lang: str,
+                    username: Optional[str], user_profiles: Optional[list],
+                    context: Optional[dict] = None) -> ResponseFuture:
+        span = self.tracer.start_span("iris.request")
+        with self.tracer.span("iris.serialize", span):
+            serialized = self._serialize_audio(audio_file, lang, username,
+                                               user_profiles, context)
+        return self._send_serialized_message(serialized, span)
+
+    def _serialize_utterance(self, utterance: str, lang: str,
+                             username: Optional[str],
+                             user_profiles: Optional[list],
+                             context: Optional[dict] = None) -> dict:
         context = context or dict()
         username = username or self.default_username
         user_profiles = user_profiles or [self.user_config]
         message = self._build_message("recognizer_loop:utterance",
                                       {"utterances": [utterance],
                                        "lang": lang}, username, user_profiles)
-        serialized = {"msg_type": message.msg_type,
-                      "data": message.data,
-                      "context": merge_dict(message.context, context,
-                                            new_only=True)}
-        self._send_serialized_message(serialized)
-
-    def _send_audio(self, audio_file: str, lang: str,
-                    username: Optional[str], user_profiles: Optional[list],
-                    context: Optional[dict] = None):
+        return {"msg_type": message.msg_type,
+                "data": message.data,
+                "context": merge_dict(message.context, context,
+                                      new_only=True)}
+
+    def _serialize_audio(self, audio_file: str, lang: str,
+                         username: Optional[str],
+                         user_profiles: Optional[list],
+                         context: Optional[dict] = None) -> dict:
         context = context or dict()
-        audio_data = encode_file_to_base64_string(audio_file)
+        with open(audio_file, "rb") as f:
+            audio_data = f.read()
         message = self._build_message("neon.audio_input",
                                       {"lang": lang,
                                        "audio_data": audio_data,
                                        "utterances": []},
                                       # TODO: `utterances` patching mq connector
                                       username, user_profiles)
-        serialized = {"msg_type": message.msg_type,
-                      "data": message.data,
-                      "context": merge_dict(message.context, context,
-                                            new_only=True)}
-        self._send_serialized_message(serialized)
+        return {"msg_type": message.msg_type,
+                "data": message.data,
+                "context": merge_dict(message.context, context,
+                                      new_only=True)}
 
-    def _send_message(self, message: Message):
+    def _send_message(self, message: Message) -> ResponseFuture:
         serialized = {"msg_type": message.msg_type,
                       "data": message.data,
                       "context": message.context}
-        self._send_serialized_message(serialized)
+        return self._send_serialized_message(serialized)
 
-    def _send_serialized_message(self, serialized: dict):
+    def _send_serialized_message(self, serialized: dict,
+                                 span: Optional[Span] = None) -> \
+            ResponseFuture:
+        """
+        Emit a serialized message and track it until a response is received
+        :param serialized: dict message to emit
+        :param span: Span to trace the request with; if None, one is started
+        :returns: ResponseFuture resolved with the final response
+        """
+        message_id = serialized['context']['mq']['message_id']
+        span = span or self.tracer.start_span("iris.request")
+        try:
+            future = self._pending.add(message_id, serialized['msg_type'],
+                                       self._in_flight_wait)
+        except BufferError as e:
+            span.set_error(e)
+            span.end()
+            raise
+        self._metrics.on_request(future, serialized['msg_type'])
+        self._trace_request(future, serialized, span)
+        if serialized['context'].get('user_profile_refs'):
+            # Keep the request in case Neon needs it re-sent with profiles
+            future.request = serialized
         try:
             serialized['context']['timing']['client_sent'] = time()
             if serialized['context']['timing'].get('gradio_sent'):
                 serialized['context']['timing']['iris_input_handling'] = \
                     serialized['context']['timing']['client_sent'] - \
                     serialized['context']['timing']['gradio_sent']
-            self.connection.emit_mq_message(
-                self._connection.connection,
-                queue="neon_chat_api_request",
-                request_data=serialized)
+            self._outbox.send(serialized)
             LOG.debug(f"emitted {serialized.get('msg_type')}")
         except Exception as e:
             LOG.exception(e)
-            self.shutdown()
+            self._pending.fail(message_id, e)
+        return future
+
+    def _send_serialized_batch(self, messages: List[dict]) -> \
+            List[ResponseFuture]:
+        """
+        Emit serialized messages with publisher confirms and track them until
+        responses are received. If the connection is unavailable, messages
+        are buffered for publishing like individual messages.
+        :param messages: dict messages to emit
+        :returns: list of ResponseFuture resolved with the final responses
+        """
+        futures = list()
+        sent = time()
+        for message in messages:
+            try:
+                future = self._pending.add(
+                    message['context']['mq']['message_id'],
+                    message['msg_type'], self._in_flight_wait)
+            except BufferError:
+                for future in futures:
+                    self._pending.discard(future.message_id)
+                raise
+            if message['context'].get('user_profile_refs'):
+                future.request = message
+            message['context']['timing']['client_sent'] = sent
+            futures.append(future)
+        for future, message in zip(futures, messages):
+            self._metrics.on_request(future, future.msg_type)
+            self._trace_request(future, message,
+                                self.tracer.start_span("iris.request",
+                                                       start_time=sent))
+        try:
+            accepted = self._connection_manager.publish_batch(
+                "neon_chat_api_request", messages, codec=self._codec)
+            published = time()
+            for future in futures:
+                self.tracer.record_span("mq.publish", sent, published,
+                                        future.span, {"batch": len(messages)})
+        except (AMQPError, OSError) as e:
+            LOG.warning(f"Batch publish failed, buffering messages: {e}")
+            for future, message in zip(futures, messages):
+                try:
+                    self._outbox.send(message)
+                except Exception as x:
+                    self._pending.fail(future.message_id, x)
+            return futures
+        except Exception as e:
+            LOG.exception(e)
+            for future in futures:
+                self._pending.fail(future.message_id, e)
+            return futures
+        for future, ok in zip(futures, accepted):
+            future.accepted = ok
+            if not ok:
+                self._pending.fail(future.message_id, ConnectionError(
+                    "Message was not accepted by the MQ broker"))
+        LOG.debug(f"emitted {accepted.count(True)}/{len(messages)} messages")
+        return futures
+
+    def _trace_request(self, future: ResponseFuture, serialized: dict,
+                       span: Span):
+        """
+        Add trace context for a request to its message and end the request's
+        span when the request completes
+        :param future: ResponseFuture tracking the request
+        :param serialized: dict message to emit
+        :param span: Span tracing the request
+        """
+        future.span = span
+        if not span.recording:
+            return
+        span.set_attribute("msg_type", future.msg_type)
+        span.set_attribute("message_id", future.message_id)
+        serialized['context']['traceparent'] = span.traceparent
+        future.add_done_callback(self._end_request_span)
+
+    @staticmethod
+    def _end_request_span(future: ResponseFuture):
+        if future.cancelled():
+            future.span.set_error("cancelled")
+        elif future.exception():
+            future.span.set_error(future.exception())
+        future.span.end()
+
+    def _publish(self, queue: str, serialized: dict):
+        """
+        Publish a serialized message with the negotiated codec
+        :param queue: name of the queue to publish to
+        :param serialized: dict message to publish
+        """
+        context = serialized.get('context') or dict()
+        parent = context.get('traceparent')
+        if not parent or not self.tracer.enabled:
+            self._connection_manager.publish(queue, serialized,
+                                             codec=self._codec)
+            return
+        # Time spent waiting in the outbox, including any publish retries
+        start = time()
+        self.tracer.record_span("iris.queue", context['timing'].get(
+            'client_sent', start), start, parent)
+        with self.tracer.span("mq.publish", parent, {"queue": queue}):
+            self._connection_manager.publish(queue, serialized,
+                                             codec=self._codec)
+
+    def _handle_dropped_message(self, serialized: dict, error: Exception):
+        """
+        Fail the request for a message that could not be published
+        :param serialized: dict message that was not published
+        :param error: reason the message was not published
+        """
+        self._pending.fail(serialized['context']['mq']['message_id'], error)
 
     def _init_mq_connection(self):
         mq_config = self._config.get("MQ") or self._config
-        mq_connection = NeonMQHandler(mq_config, "mq_handler", self._vhost)
+        mq_connection = PrefetchMQHandler(mq_config, "mq_handler",
+                                          self._vhost)
         mq_connection.register_consumer("neon_response_handler", self._vhost,
                                         self.uid, self.handle_neon_response,
                                         auto_ack=False)
+        if self._response_prefetch:
+            set_consumer_prefetch(mq_connection, "neon_response_handler",
+                                  self._response_prefetch)
         mq_connection.register_consumer("neon_error_handler", self._vhost,
                                         "neon_chat_api_error",
                                         self.handle_neon_error,
@@ -396,15 +924,17 @@ class CLIClient(NeonAIClient):
         self.username = self.user_config["user"]["username"]
         self.client_name = "cli"
         self.audio_enabled = True
-        self._response_event = Event()
-        self._request_queue = Queue()
-
-        Thread(target=self._handle_next_request, daemon=True).start()
 
     @property
     def user_profiles(self) -> list:
         return [self.user_config]
 
+    def _register_default_handlers(self):
+        NeonAIClient._register_default_handlers(self)
+        # Audio playback blocks; keep it off of the MQ consumer thread
+        self.register_handler(self.handle_klat_response, "klat.response",
+                              threaded=True)
+
     @staticmethod
     def _play_audio(audio_file: str):
         """
@@ -416,42 +946,29 @@ class CLIClient(NeonAIClient):
                          stdout=subprocess.DEVNULL,
                          stderr=subprocess.DEVNULL).wait()
 
-    def _handle_next_request(self):
-        """
-        Threaded process to continue handling queued requests
-        """
-        while True:
-            request = self._request_queue.get()
-            if not request:
-                break
-            utterance, lang = request
-            self._response_event.clear()
-            self._send_utterance(utterance, lang, self.username,
-                                 self.user_profiles)
-            self._response_event.wait(30)
-
     def handle_klat_response(self, message):
         """
         Handle an MQ Neon response message.
         This may include API responses, profile updates, and error responses
         """
         resp_data = message.data["responses"]
+        username = message.context.get("username")
         files = []
         sentences = []
         for lang, response in resp_data.items():
             sentences.append(response.get("sentence"))
             if response.get("audio"):
                 for gender, data in response["audio"].items():
-                    filepath = "/".join([self.audio_cache_dir] +
-                                        response[gender].split('/')[-4:])
+                    with self.tracer.span("iris.audio_decode"):
+                        filepath = self.audio_cache.put(
+                            lang, gender, response.get("sentence"), data,
+                            splitext(response[gender])[1], username)
                     files.append(filepath)
-                    if not isfile(filepath):
-                        decode_base64_string_to_file(data, filepath)
         print(f"{pformat(sentences)}\n{pformat(files)}\n")
         if self.audio_enabled:
             for file in files:
-                self._play_audio(file)
-        self._response_event.set()
+                with self.tracer.span("iris.playback"):
+                    self._play_audio(file)
 
     def handle_error_response(self, message: Message):
         """
@@ -461,7 +978,6 @@ class CLIClient(NeonAIClient):
 
     def handle_complete_intent_failure(self, message: Message):
         print("No Intent Matched")
-        self._response_event.set()
 
     def handle_api_response(self, message: Message):
         pass
@@ -475,32 +991,25 @@ class CLIClient(NeonAIClient):
     def send_utterance(self, utterance: str, lang: str = "en-us",
                        _=None, __=None):
         """
-        Queue a string request for skills processing
+        Send a string request for skills processing and wait for a response
         :param utterance: User utterance to submit
         :param lang: language of utterance
         """
-        self._response_event.clear()
-        self._request_queue.put((utterance, lang))
-        if not self._response_event.wait(30):
+        future = self._send_utterance(utterance, lang, self.username,
+                                      self.user_profiles)
+        if not future.wait_for_response(30):
             print(f"No repsonse to: {utterance}")
-        while not self._request_queue.empty():
-            self._response_event.wait(30)
+        return future
 
     def send_audio(self, audio_file: str, lang: str = "en-us",
                    _=None, __=None):
         """
-        Send an audio file for skills processing
+        Send an audio file for skills processing and wait for a response
         :param audio_file: Audio File to submit for STT processing
         :param lang: language of audio
         """
-        self._response_event.clear()
-        self._send_audio(audio_file, lang, self.username, self.user_profiles)
-        if not self._response_event.wait(30):
+        future = self._send_audio(audio_file, lang, self.username,
+                                  self.user_profiles)
+        if not future.wait_for_response(30):
             print(f"No response to: {audio_file}")
-
-    def shutdown(self):
-        """
-        Shutdown the client
-        """
-        self._request_queue.put(None)
-        super().shutdown()
+        return future
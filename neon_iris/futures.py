@@ -0,0 +1,321 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from concurrent.futures import Future, TimeoutError
+from threading import Condition, Lock
+from time import time
+from typing import Dict, List, Optional
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+# Responses that always complete the request they are routed to
+_FINAL_RESPONSE_TYPES = ("klat.response", "complete.intent.failure",
+                         "klat.error")
+# User inputs that are completed by one of `_FINAL_RESPONSE_TYPES`
+_INPUT_MSG_TYPES = ("recognizer_loop:utterance", "neon.audio_input")
+
+
+def get_message_id(message: Message) -> Optional[str]:
+    """
+    Get the MQ correlation ID for a message
+    :param message: Message emitted by or routed to a client
+    :returns: `context.mq.message_id` if defined, else None
+    """
+    return (message.context.get("mq") or {}).get("message_id")
+
+
+def get_response_text(message: Optional[Message]) -> str:
+    """
+    Get the text to display for a response to a user input
+    :param message: final response to a user input, if one was received
+    :returns: response sentences in all requested languages, else "ERROR"
+    """
+    if not message or message.msg_type != "klat.response":
+        return "ERROR"
+    return "\n".join(response.get("sentence") for response in
+                     message.data["responses"].values())
+
+
+def get_transcription(responses: List[Message]) -> Optional[str]:
+    """
+    Get the transcription of an audio input
+    :param responses: all responses received for an audio input
+    :returns: transcribed utterance, if a transcription was received
+    """
+    for message in responses:
+        if message.msg_type == "neon.audio_input.response":
+            return message.data.get("transcripts", [""])[0]
+    return None
+
+
+class ResponseFuture(Future):
+    """
+    Future resolved with the final response to a message emitted by a client.
+    Intermediate responses (i.e. a transcription of an audio input) are
+    collected in `responses` as they are received. For messages published
+    with publisher confirms, `accepted` indicates if the broker accepted the
+    message. `span` is the tracing Span of the request, if traced.
+    `pending` is the PendingRequests table tracking the request, if any.
+    """
+    def __init__(self, message_id: str, msg_type: str):
+        Future.__init__(self)
+        self.message_id = message_id
+        self.msg_type = msg_type
+        self.created = time()
+        self.responses: List[Message] = list()
+        self.request: Optional[dict] = None
+        self.accepted: Optional[bool] = None
+        self.span = None
+        self.pending: Optional["PendingRequests"] = None
+
+    def is_final_response(self, message: Message) -> bool:
+        """
+        Check if the specified message completes this request
+        :param message: Response message routed to this request
+        :returns: True if no more responses are expected
+        """
+        if message.msg_type in _FINAL_RESPONSE_TYPES:
+            return True
+        if self.msg_type in _INPUT_MSG_TYPES:
+            return False
+        return message.msg_type == f"{self.msg_type}.response"
+
+    def wait_for_response(self, timeout: Optional[float] = 30) -> \
+            Optional[Message]:
+        """
+        Block until a final response is received
+        :param timeout: max seconds to wait for a response
+        :returns: final response Message, or None if no response was received
+        """
+        if self.pending:
+            self.pending.expire_stale()
+        try:
+            return self.result(timeout)
+        except TimeoutError:
+            if self.pending:
+                # Fail the request so it is recorded as timed out and is no
+                # longer tracked
+                self.pending.expire(self.message_id)
+            return None
+        except Exception as e:
+            LOG.error(f"Request {self.message_id} failed: {e}")
+            return None
+
+
+class PendingRequests:
+    """
+    Thread-safe table of requests awaiting a response, keyed by
+    `context.mq.message_id`.
+    """
+    def __init__(self, timeout: float = 60, max_in_flight: int = 0):
+        """
+        :param timeout: seconds after which a pending request is expired
+        :param max_in_flight: max number of pending requests; 0 for no limit
+        """
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._lock = Condition(Lock())
+        self._requests: Dict[str, ResponseFuture] = dict()
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._requests
+
+    @property
+    def occupancy(self) -> float:
+        """
+        Fraction of `max_in_flight` currently pending (0.0 if unlimited)
+        """
+        if not self.max_in_flight:
+            return 0.0
+        return len(self._requests) / self.max_in_flight
+
+    def add(self, message_id: str, msg_type: str,
+            wait: float = 0) -> ResponseFuture:
+        """
+        Register a new request awaiting a response
+        :param message_id: unique ID of the emitted message
+        :param msg_type: msg_type of the emitted message
+        :param wait: max seconds to wait for a pending request to complete if
+            `max_in_flight` requests are already pending
+        :returns: ResponseFuture to be resolved with the final response
+        :raises BufferError: if `max_in_flight` requests are still pending
+            after `wait` seconds
+        """
+        future = ResponseFuture(message_id, msg_type)
+        future.pending = self
+        future.add_done_callback(self._on_done)
+        expired = list()
+        try:
+            with self._lock:
+                expired.extend(self._pop_expired())
+                if self.max_in_flight:
+                    deadline = time() + wait
+                    while len(self._requests) >= self.max_in_flight:
+                        remaining = deadline - time()
+                        if remaining <= 0:
+                            raise BufferError(f"{len(self._requests)} "
+                                              f"requests already in flight")
+                        self._lock.wait(remaining)
+                        expired.extend(self._pop_expired())
+                self._requests[message_id] = future
+        finally:
+            self._fail_expired(expired)
+        return future
+
+    def get(self, message_id: str) -> Optional[ResponseFuture]:
+        """
+        Get a pending request by ID
+        :param message_id: unique ID of the emitted message
+        :returns: ResponseFuture if the request is still pending, else None
+        """
+        self.expire_stale()
+        return self._requests.get(message_id)
+
+    def discard(self, message_id: str) -> Optional[ResponseFuture]:
+        """
+        Stop tracking a request. Any later responses will not be correlated.
+        :param message_id: unique ID of the emitted message
+        :returns: removed ResponseFuture, if it was pending
+        """
+        with self._lock:
+            future = self._requests.pop(message_id, None)
+            self._lock.notify()
+            return future
+
+    def resolve(self, message: Message,
+                final: Optional[bool] = None) -> Optional[ResponseFuture]:
+        """
+        Correlate a response with a pending request, resolving the request's
+        future if `message` is a final response.
+        :param message: Response message received by the client
+        :param final: if set, override the check for a final response
+        :returns: ResponseFuture the message was correlated with, if any
+        """
+        message_id = get_message_id(message)
+        if not message_id:
+            return None
+        self.expire_stale()
+        with self._lock:
+            future = self._requests.get(message_id)
+            if not future:
+                return None
+            future.responses.append(message)
+            if final is None:
+                final = future.is_final_response(message)
+            if not final:
+                return future
+            self._requests.pop(message_id)
+            self._lock.notify()
+        if future.set_running_or_notify_cancel():
+            future.set_result(message)
+        return future
+
+    def fail(self, message_id: str, error: Exception):
+        """
+        Fail a pending request, i.e. if the message could not be emitted
+        :param message_id: unique ID of the emitted message
+        :param error: Exception to raise to anything awaiting a response
+        """
+        future = self.discard(message_id)
+        if future and future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+    def expire(self, message_id: str):
+        """
+        Fail a pending request with a TimeoutError, i.e. if a caller stopped
+        waiting for its response
+        :param message_id: unique ID of the emitted message
+        """
+        future = self.discard(message_id)
+        if future and future.set_running_or_notify_cancel():
+            future.set_exception(self._get_timeout_error(future))
+
+    def cancel_all(self):
+        """
+        Cancel all pending requests, i.e. when the client is shut down
+        """
+        with self._lock:
+            requests = list(self._requests.values())
+            self._requests.clear()
+            self._lock.notify_all()
+        for future in requests:
+            future.cancel()
+
+    def expire_stale(self):
+        """
+        Fail any requests that have been pending longer than `timeout`. This
+        is done whenever requests are added or resolved.
+        """
+        with self._lock:
+            expired = self._pop_expired()
+        self._fail_expired(expired)
+
+    def _pop_expired(self) -> List[ResponseFuture]:
+        """
+        Stop tracking requests that have been pending longer than `timeout`.
+        Caller must hold `_lock` and pass the result to `_fail_expired` once
+        it is released.
+        :returns: list of expired requests
+        """
+        expiration = time() - self.timeout
+        # Requests are ordered by creation time
+        expired = list()
+        for message_id, future in self._requests.items():
+            if future.created >= expiration:
+                break
+            expired.append(message_id)
+        if expired:
+            self._lock.notify_all()
+        return [self._requests.pop(message_id) for message_id in expired]
+
+    def _fail_expired(self, expired: List[ResponseFuture]):
+        """
+        Fail expired requests. This must be called without holding `_lock`,
+        since done callbacks of the futures may use this object.
+        :param expired: requests returned by `_pop_expired`
+        """
+        for future in expired:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(self._get_timeout_error(future))
+
+    def _get_timeout_error(self, future: ResponseFuture) -> TimeoutError:
+        return TimeoutError(f"No response to {future.msg_type} after "
+                            f"{time() - future.created:.1f}s")
+
+    def _on_done(self, future: ResponseFuture):
+        """
+        Stop tracking a request when its future is cancelled (i.e. by a
+        caller that stopped awaiting it)
+        """
+        if future.cancelled():
+            with self._lock:
+                if self._requests.get(future.message_id) is future:
+                    del self._requests[future.message_id]
+                    self._lock.notify()
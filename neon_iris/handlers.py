@@ -0,0 +1,181 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+Handler = Callable[[Message], Any]
+
+# Max msg_types to cache pattern lookups for
+_MAX_RESOLVED = 1024
+
+
+class MessageHandlerRegistry:
+    """
+    Registry of handlers for received messages. Handlers are registered for
+    an exact `msg_type` or for a `msg_type` prefix or suffix. Exact matches
+    take precedence over patterns, and longer patterns take precedence over
+    shorter ones, whether prefix or suffix; a prefix takes precedence over a
+    suffix of the same length. Pattern lookups for recently received
+    msg_types are cached so dispatch is a dict lookup.
+    """
+    def __init__(self, max_workers: int = 4):
+        """
+        :param max_workers: max threads to run `threaded` handlers on
+        """
+        self.max_workers = max_workers
+        self._lock = Lock()
+        self._exact: Dict[str, Tuple[Handler, bool]] = dict()
+        self._prefixes: List[Tuple[str, Handler, bool]] = list()
+        self._suffixes: List[Tuple[str, Handler, bool]] = list()
+        self._resolved: Dict[str, Optional[Tuple[Handler, bool]]] = dict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, handler: Handler, msg_type: Optional[str] = None,
+                 prefix: Optional[str] = None, suffix: Optional[str] = None,
+                 threaded: bool = False):
+        """
+        Register a handler. Exactly one of `msg_type`, `prefix`, or `suffix`
+        must be specified; a new handler replaces any existing handler for
+        the same key.
+        :param handler: callable accepting a Message
+        :param msg_type: exact msg_type to handle
+        :param prefix: msg_type prefix to handle
+        :param suffix: msg_type suffix to handle
+        :param threaded: if True, run the handler on a worker thread so the
+            thread receiving messages is not blocked
+        """
+        if sum(x is not None for x in (msg_type, prefix, suffix)) != 1:
+            raise ValueError("Specify exactly one of: msg_type, prefix, "
+                             "suffix")
+        with self._lock:
+            if msg_type is not None:
+                self._exact[msg_type] = (handler, threaded)
+            elif prefix is not None:
+                self._prefixes = self._add_pattern(self._prefixes, prefix,
+                                                   handler, threaded)
+            else:
+                self._suffixes = self._add_pattern(self._suffixes, suffix,
+                                                   handler, threaded)
+            self._resolved.clear()
+
+    def unregister(self, msg_type: Optional[str] = None,
+                   prefix: Optional[str] = None,
+                   suffix: Optional[str] = None):
+        """
+        Remove a handler registered with the same arguments
+        :param msg_type: exact msg_type to stop handling
+        :param prefix: msg_type prefix to stop handling
+        :param suffix: msg_type suffix to stop handling
+        """
+        with self._lock:
+            if msg_type is not None:
+                self._exact.pop(msg_type, None)
+            if prefix is not None:
+                self._prefixes = [p for p in self._prefixes
+                                  if p[0] != prefix]
+            if suffix is not None:
+                self._suffixes = [s for s in self._suffixes
+                                  if s[0] != suffix]
+            self._resolved.clear()
+
+    def get_handler(self, msg_type: str) -> Optional[Handler]:
+        """
+        Get the handler for a msg_type
+        :param msg_type: msg_type to look up
+        :returns: registered handler, if any
+        """
+        entry = self._get_entry(msg_type)
+        return entry[0] if entry else None
+
+    def dispatch(self, message: Message) -> Any:
+        """
+        Pass a message to its registered handler
+        :param message: Message to handle
+        :returns: the handler's return value, or a Future if the handler is
+            `threaded`
+        """
+        entry = self._get_entry(message.msg_type)
+        if not entry:
+            LOG.warning(f"Message not handled: {message.msg_type}")
+            return None
+        handler, threaded = entry
+        if threaded:
+            # Run in a copy of this context so the handler is traced as part
+            # of the span handling this message
+            return self._get_executor().submit(copy_context().run, handler,
+                                               message)
+        return handler(message)
+
+    def shutdown(self):
+        """
+        Stop the worker threads used for `threaded` handlers
+        """
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_entry(self, msg_type: str) -> Optional[Tuple[Handler, bool]]:
+        entry = self._exact.get(msg_type)
+        if entry:
+            return entry
+        try:
+            return self._resolved[msg_type]
+        except KeyError:
+            pass
+        with self._lock:
+            # Patterns are sorted longest first
+            prefix = next((p for p in self._prefixes
+                           if msg_type.startswith(p[0])), None)
+            suffix = next((s for s in self._suffixes
+                           if msg_type.endswith(s[0])), None)
+            if suffix and (not prefix or len(suffix[0]) > len(prefix[0])):
+                prefix = suffix
+            entry = prefix[1:] if prefix else None
+            if len(self._resolved) >= _MAX_RESOLVED:
+                # msg_types are arbitrary; drop the oldest lookup
+                self._resolved.pop(next(iter(self._resolved)))
+            self._resolved[msg_type] = entry
+        return entry
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="iris_handler")
+            return self._executor
+
+    @staticmethod
+    def _add_pattern(patterns: list, pattern: str, handler: Handler,
+                     threaded: bool) -> list:
+        patterns = [p for p in patterns if p[0] != pattern]
+        patterns.append((pattern, handler, threaded))
+        return sorted(patterns, key=lambda p: len(p[0]), reverse=True)
@@ -0,0 +1,293 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from math import ceil
+from os.path import isfile
+from statistics import mean
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ovos_utils.log import LOG
+
+from neon_iris.client import NeonAIClient
+from neon_iris.futures import ResponseFuture
+from neon_iris.metrics import get_timing_durations
+
+
+def percentiles(values: Sequence[float]) -> dict:
+    """
+    Summarize a distribution of latencies
+    :param values: latencies in seconds
+    :returns: dict count, mean, max, and p50/p95/p99 (nearest-rank)
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def _rank(pct: float) -> float:
+        return values[max(ceil(pct / 100 * len(values)) - 1, 0)]
+    return {"count": len(values), "mean": mean(values),
+            "p50": _rank(50), "p95": _rank(95), "p99": _rank(99),
+            "max": values[-1]}
+
+
+def get_inputs(utterances: Sequence[str] = (),
+               audio_files: Sequence[str] = ()) -> List[Tuple[str, str]]:
+    """
+    Get the inputs for a LoadGenerator
+    :param utterances: text inputs
+    :param audio_files: paths to audio inputs
+    :returns: list of (input type, utterance or path)
+    """
+    for audio_file in audio_files:
+        if not isfile(audio_file):
+            raise FileNotFoundError(audio_file)
+    return [("text", u) for u in utterances] + \
+        [("audio", a) for a in audio_files]
+
+
+class LoadGenerator:
+    """
+    Sends inputs from many simulated users and records the latency of each
+    response. In closed loop (no `rate`), each user sends its next input when
+    the previous one completes. In open loop, inputs are sent at `rate` across
+    all users regardless of responses, and latency is measured from when each
+    input was scheduled so a slow system can't hide queueing delay.
+    """
+    def __init__(self, clients: Sequence[NeonAIClient],
+                 inputs: Sequence[Tuple[str, str]], lang: str = "en-us",
+                 rate: Optional[float] = None, duration: float = 60,
+                 max_requests: Optional[int] = None, timeout: float = 30):
+        """
+        :param clients: client for each simulated user
+        :param inputs: (`text` or `audio`, utterance or path) inputs for each
+            user to send in turn
+        :param lang: language of inputs
+        :param rate: inputs per second to send across all users (open loop)
+        :param duration: max seconds to send inputs for
+        :param max_requests: max inputs to send
+        :param timeout: seconds to wait for each response
+        """
+        if not clients or not inputs:
+            raise ValueError("At least one client and input are required")
+        if rate is not None and rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}")
+        self.clients = list(clients)
+        self.inputs = list(inputs)
+        self.lang = lang
+        self.rate = rate
+        self.duration = duration
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self._lock = Lock()
+        self._sent = 0
+        self._records: List[dict] = list()
+
+    def run(self) -> dict:
+        """
+        Send inputs until `duration` has elapsed or `max_requests` have been
+        sent, then wait for outstanding responses
+        :returns: dict `summary` (see `summarize`) and per-request `records`
+        """
+        self._sent = 0
+        self._records = list()
+        start = time()
+        if self.rate:
+            self._run_open(start + self.duration)
+        else:
+            threads = [Thread(target=self._run_closed,
+                              args=(user, start + self.duration),
+                              daemon=True)
+                       for user in range(len(self.clients))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return {"summary": summarize(self._records, time() - start),
+                "records": self._records}
+
+    def _reserve(self, deadline: float) -> bool:
+        with self._lock:
+            if time() >= deadline or (self.max_requests is not None and
+                                      self._sent >= self.max_requests):
+                return False
+            self._sent += 1
+            return True
+
+    def _send(self, user: int, input_type: str, value: str) -> \
+            ResponseFuture:
+        client = self.clients[user]
+        if input_type == "audio":
+            return client.send_audio(value, self.lang)
+        return client.send_utterance(value, self.lang)
+
+    def _run_closed(self, user: int, deadline: float):
+        idx = user
+        while self._reserve(deadline):
+            input_type, value = self.inputs[idx % len(self.inputs)]
+            idx += 1
+            start = time()
+            try:
+                future = self._send(user, input_type, value)
+            except Exception as e:
+                self._record(user, input_type, start, error=e)
+                continue
+            self._wait(user, input_type, start, future)
+
+    def _run_open(self, deadline: float):
+        interval = 1 / self.rate
+        start = time()
+        sent = list()
+        idx = 0
+        while self._reserve(deadline):
+            scheduled = start + idx * interval
+            sleep(max(scheduled - time(), 0))
+            user = idx % len(self.clients)
+            input_type, value = self.inputs[idx % len(self.inputs)]
+            idx += 1
+            try:
+                future = self._send(user, input_type, value)
+            except Exception as e:
+                self._record(user, input_type, scheduled, error=e)
+                continue
+            future.add_done_callback(_set_completed)
+            sent.append((user, input_type, scheduled, future))
+        for user, input_type, scheduled, future in sent:
+            self._wait(user, input_type, scheduled, future)
+
+    def _wait(self, user: int, input_type: str, start: float,
+              future: ResponseFuture):
+        try:
+            message = future.result(max(start + self.timeout - time(), 0))
+        except FutureTimeoutError:
+            self.clients[user]._pending.discard(future.message_id)
+            self._record(user, input_type, start, status="timeout")
+            return
+        except Exception as e:
+            self._record(user, input_type, start, error=e)
+            return
+        end = getattr(future, "completed", None) or time()
+        timing = get_timing_durations(message.context.get("timing"))
+        self._record(user, input_type, start, end - start, message.msg_type,
+                     timing, status="error"
+                     if message.msg_type == "klat.error" else "ok")
+
+    def _record(self, user: int, input_type: str, start: float,
+                latency: Optional[float] = None,
+                msg_type: Optional[str] = None,
+                timing: Optional[dict] = None, status: str = "error",
+                error: Optional[Exception] = None):
+        if error:
+            LOG.warning(f"Request failed: {error}")
+        record = {"user": user, "input": input_type, "start": start,
+                  "latency": latency, "status": status, "msg_type": msg_type,
+                  "timing": timing or dict()}
+        if error:
+            record["error"] = repr(error)
+        with self._lock:
+            self._records.append(record)
+
+
+def _set_completed(future: ResponseFuture):
+    future.completed = time()
+
+
+def summarize(records: List[dict], duration: float) -> dict:
+    """
+    Summarize LoadGenerator records
+    :param records: per-request records
+    :param duration: seconds the load test ran for
+    :returns: dict request counts, throughput, end-to-end `latency`
+        percentiles overall and by input type, and `timing` percentiles for
+        each stage reported in response `context['timing']`
+    """
+    statuses = [r["status"] for r in records]
+    completed = [r for r in records if r["status"] == "ok"]
+    latency = {"all": percentiles([r["latency"] for r in completed])}
+    for input_type in sorted({r["input"] for r in completed}):
+        latency[input_type] = percentiles([r["latency"] for r in completed
+                                           if r["input"] == input_type])
+    stages: Dict[str, List[float]] = dict()
+    for record in completed:
+        for stage, value in record["timing"].items():
+            stages.setdefault(stage, list()).append(value)
+    return {"requests": len(records),
+            "completed": len(completed),
+            "errors": statuses.count("error"),
+            "timeouts": statuses.count("timeout"),
+            "intent_failures": len([r for r in completed if r["msg_type"] ==
+                                    "complete.intent.failure"]),
+            "duration": duration,
+            "throughput": len(completed) / duration if duration else 0,
+            "latency": latency,
+            "timing": {stage: percentiles(values)
+                       for stage, values in sorted(stages.items())}}
+
+
+def format_summary(summary: dict) -> List[str]:
+    """
+    Format a LoadGenerator summary for display
+    :param summary: dict returned by `summarize`
+    :returns: lines of text
+    """
+    lines = [f"{summary['requests']} requests in {summary['duration']:.2f}s: "
+             f"{summary['completed']} completed, {summary['errors']} errors, "
+             f"{summary['timeouts']} timeouts "
+             f"({summary['throughput']:.2f} responses/s)",
+             f"{'':<28}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    rows = [(f"latency {k}", v) for k, v in summary["latency"].items()] + \
+        [(f"timing {k}", v) for k, v in summary["timing"].items()]
+    for name, stats in rows:
+        if not stats.get("count"):
+            continue
+        lines.append(f"{name:<28}{stats['count']:>8}{stats['p50']:>10.4f}"
+                     f"{stats['p95']:>10.4f}{stats['p99']:>10.4f}")
+    return lines
+
+
+def compare_summaries(previous: dict, current: dict) -> List[str]:
+    """
+    Compare latency percentiles between two LoadGenerator summaries
+    :param previous: summary of an earlier run
+    :param current: summary of this run
+    :returns: lines of text describing the change in each percentile
+    """
+    lines = list()
+    for group in ("latency", "timing"):
+        for name, stats in current[group].items():
+            old = previous.get(group, dict()).get(name)
+            if not old or not old.get("count") or not stats.get("count"):
+                continue
+            changes = list()
+            for pct in ("p50", "p95", "p99"):
+                delta = (stats[pct] - old[pct]) / old[pct] * 100 \
+                    if old[pct] else 0
+                changes.append(f"{pct} {old[pct]:.4f}->{stats[pct]:.4f} "
+                               f"({delta:+.1f}%)")
+            lines.append(f"{group} {name}: {', '.join(changes)}")
+    return lines
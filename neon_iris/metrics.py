@@ -0,0 +1,410 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from bisect import bisect_left
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Lock
+from time import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ovos_bus_client.message import Message
+
+# Timing values above this are timestamps rather than durations
+_MAX_DURATION = 1e6
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+def get_timing_durations(timing: Optional[dict]) -> Dict[str, float]:
+    """
+    Get the durations from a message's `context['timing']`, which also
+    contains timestamps (i.e. `client_sent`)
+    :param timing: `context['timing']` of a message
+    :returns: dict of stage name to duration in seconds
+    """
+    return {k: v for k, v in (timing or dict()).items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and
+            0 <= v < _MAX_DURATION}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labels: Sequence[str] = ()):
+        """
+        :param name: metric name
+        :param documentation: description of the metric
+        :param labels: names of labels each value is recorded with
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._values = dict()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} requires labels {self.labels}, "
+                             f"got {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...],
+                       extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        """
+        Get the Prometheus text format lines for this metric's values
+        """
+        raise NotImplementedError()
+
+    def to_prometheus(self) -> str:
+        """
+        Get this metric in Prometheus text format
+        """
+        return "\n".join([f"# HELP {self.name} "
+                          f"{_escape(self.documentation)}",
+                          f"# TYPE {self.name} {self.type}"] +
+                         self.samples())
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count
+    """
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increment the count
+        :param amount: amount to increase the count by
+        :param labels: label values to record the count with
+        """
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """
+        Get the count for the specified label values
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {_format_value(v)}"
+                for k, v in values]
+
+
+class Gauge(_Metric):
+    """
+    Value that may go up and down. A gauge without labels may also be computed
+    as the sum of functions added with `add_function` (i.e. the number of
+    requests pending for each client).
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str,
+                 labels: Sequence[str] = ()):
+        _Metric.__init__(self, name, documentation, labels)
+        self._functions: List[Callable[[], float]] = list()
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def add_function(self, function: Callable[[], float]):
+        """
+        Add a function to the value of this gauge
+        :param function: callable returning a value to add
+        """
+        if self.labels:
+            raise ValueError("Functions are not supported with labels")
+        with self._lock:
+            self._functions.append(function)
+
+    def remove_function(self, function: Callable[[], float]):
+        """
+        Remove a function added with `add_function`
+        """
+        with self._lock:
+            if function in self._functions:
+                self._functions.remove(function)
+
+    def get(self, **labels) -> float:
+        """
+        Get the value for the specified label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            functions = list(self._functions)
+            value = self._values.get(key, 0)
+        return value + sum(f() for f in functions)
+
+    def samples(self) -> List[str]:
+        if not self.labels:
+            return [f"{self.name} {_format_value(self.get())}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {_format_value(v)}"
+                for k, v in values]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        :param buckets: upper bounds of buckets; `+Inf` is always included
+        """
+        _Metric.__init__(self, name, documentation, labels)
+        self.buckets = tuple(sorted(set(buckets) - {float("inf")}))
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observation
+        :param value: observed value
+        :param labels: label values to record the observation with
+        """
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or \
+                ([0] * (len(self.buckets) + 1), 0.0)
+            counts[idx] += 1
+            self._values[key] = (counts, total + value)
+
+    def get(self, **labels) -> Tuple[List[int], float, int]:
+        """
+        Get observations for the specified label values
+        :returns: cumulative count for each bucket (including `+Inf`), sum
+            of observed values, and number of observations
+        """
+        with self._lock:
+            counts, total = self._values.get(self._key(labels)) or \
+                ([0] * (len(self.buckets) + 1), 0.0)
+            cumulative = list()
+            running = 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+        return cumulative, total, running
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            keys = sorted(self._values)
+        lines = list()
+        bounds = self.buckets + (float("inf"),)
+        for key in keys:
+            labels = dict(zip(self.labels, key))
+            cumulative, total, count = self.get(**labels)
+            for bound, bucket_count in zip(bounds, cumulative):
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket"
+                             f"{self._format_labels(key, le)} {bucket_count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} "
+                         f"{_format_value(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} "
+                         f"{count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics that can be exported in Prometheus text format
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics: Dict[str, _Metric] = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._metrics
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """
+        Get a registered metric by name
+        """
+        return self._metrics.get(name)
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a "
+                                 f"{metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str,
+                labels: Sequence[str] = ()) -> Counter:
+        """
+        Get or create a Counter
+        """
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str,
+              labels: Sequence[str] = ()) -> Gauge:
+        """
+        Get or create a Gauge
+        """
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str,
+                  labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Get or create a Histogram
+        """
+        return self._register(Histogram, name, documentation, labels,
+                              buckets)
+
+    def to_prometheus(self) -> str:
+        """
+        Get all metrics in Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return "".join(f"{metric.to_prometheus()}\n"
+                       for _, metric in metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class ClientMetrics:
+    """
+    Request and response metrics recorded by clients
+    """
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        """
+        :param registry: MetricsRegistry to record metrics in
+        """
+        self.registry = registry
+        self.requests = registry.counter(
+            "iris_requests_total", "Requests sent to Neon", ("msg_type",))
+        self.request_seconds = registry.histogram(
+            "iris_request_seconds",
+            "Time from sending a request to its final response",
+            ("msg_type",))
+        self.response_seconds = registry.histogram(
+            "iris_response_seconds",
+            "Time from sending a request to receiving each response",
+            ("msg_type",))
+        self.stage_seconds = registry.histogram(
+            "iris_response_stage_seconds",
+            "Durations reported in response context timing", ("stage",))
+        self.timeouts = registry.counter(
+            "iris_request_timeouts_total",
+            "Requests that did not receive a response in time")
+        self.errors = registry.counter(
+            "iris_errors_total", "Failed requests and error responses",
+            ("reason",))
+        self.intent_failures = registry.counter(
+            "iris_intent_failures_total",
+            "Inputs that did not match an intent")
+        self.in_flight = registry.gauge(
+            "iris_requests_in_flight", "Requests awaiting a response")
+        self.buffered = registry.gauge(
+            "iris_messages_buffered", "Messages waiting to be published")
+
+    def on_request(self, future: Future, msg_type: str):
+        """
+        Record a sent request and its result once resolved
+        :param future: ResponseFuture tracking the request
+        :param msg_type: msg_type of the request
+        """
+        self.requests.inc(msg_type=msg_type)
+        future.add_done_callback(self._on_request_done)
+
+    def _on_request_done(self, future: Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        # `concurrent.futures.TimeoutError` is only an alias of the builtin
+        # `TimeoutError` in Python 3.11+
+        if isinstance(error, (TimeoutError, FutureTimeoutError)):
+            self.timeouts.inc()
+        elif error:
+            self.errors.inc(reason=type(error).__name__)
+        else:
+            self.request_seconds.observe(time() - future.created,
+                                         msg_type=future.msg_type)
+
+    def on_response(self, message: Message,
+                    handling_time: Optional[float] = None,
+                    error: bool = False):
+        """
+        Record a received response
+        :param message: Message received from Neon
+        :param handling_time: seconds since the request was sent, if the
+            response is to a request from this client
+        :param error: True if `message` was received on the error queue
+        """
+        if handling_time is not None:
+            self.response_seconds.observe(handling_time,
+                                          msg_type=message.msg_type)
+        for stage, duration in get_timing_durations(
+                message.context.get("timing")).items():
+            self.stage_seconds.observe(duration, stage=stage)
+        if error or message.msg_type == "klat.error":
+            self.errors.inc(reason="error_response")
+        elif message.msg_type == "complete.intent.failure":
+            self.intent_failures.inc()
@@ -0,0 +1,700 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from functools import partial
+from threading import Event, Lock, RLock, Thread
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pika
+
+from ovos_bus_client.message import Message
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPError, ChannelClosedByBroker
+from neon_mq_connector.consumers.blocking_consumer import \
+    BlockingConsumerThread
+from neon_mq_connector.consumers.select_consumer import SelectConsumerThread
+from neon_utils.mq_utils import NeonMQHandler
+from ovos_utils.log import LOG
+
+from neon_iris.serialization import LEGACY_CODEC, MessageCodec, get_codec
+
+
+class PrefetchConsumerThread(BlockingConsumerThread):
+    """
+    BlockingConsumerThread with a configurable prefetch count
+    """
+    def __init__(self, *args, prefetch_count: int = 50, **kwargs):
+        """
+        :param prefetch_count: max unacknowledged messages to deliver
+        """
+        BlockingConsumerThread.__init__(self, *args, **kwargs)
+        self.prefetch_count = prefetch_count
+
+    def _create_connection(self):
+        BlockingConsumerThread._create_connection(self)
+        # Prefetch only applies to consumers started after `basic_qos`, so
+        # restart the consumer. Undelivered messages are requeued.
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        for tag in list(self.channel.consumer_tags):
+            self.channel.basic_cancel(tag)
+        self.channel.basic_consume(on_message_callback=self.callback_func,
+                                   queue=self.queue, auto_ack=self.auto_ack)
+
+
+class PrefetchSelectConsumerThread(SelectConsumerThread):
+    """
+    SelectConsumerThread with a configurable prefetch count
+    """
+    def __init__(self, *args, prefetch_count: int = 50, **kwargs):
+        """
+        :param prefetch_count: max unacknowledged messages to deliver
+        """
+        SelectConsumerThread.__init__(self, *args, **kwargs)
+        self.prefetch_count = prefetch_count
+
+    def set_qos(self, _unused_frame=None):
+        self.channel.basic_qos(prefetch_count=self.prefetch_count,
+                               callback=self.start_consuming)
+
+
+_PREFETCH_CONSUMERS = {BlockingConsumerThread: PrefetchConsumerThread,
+                       SelectConsumerThread: PrefetchSelectConsumerThread}
+
+
+class PrefetchMQHandler(NeonMQHandler):
+    """
+    NeonMQHandler that creates consumers with a configurable prefetch count.
+    Consumers rebuilt after their connection is lost are created the same
+    way, so a prefetch count set with `set_consumer_prefetch` is kept.
+    """
+    @property
+    def consumer_thread_cls(self):
+        consumer_cls = NeonMQHandler.consumer_thread_cls.fget(self)
+        return _PREFETCH_CONSUMERS.get(consumer_cls, consumer_cls)
+
+
+def set_consumer_prefetch(mq_handler: PrefetchMQHandler, name: str,
+                          prefetch_count: int):
+    """
+    Set the prefetch count of a consumer registered with a PrefetchMQHandler.
+    This must be called before the consumer is started. The prefetch count
+    is saved with the consumer's properties, so it also applies if the
+    consumer is restarted.
+    :param mq_handler: PrefetchMQHandler the consumer is registered with
+    :param name: name the consumer was registered with
+    :param prefetch_count: max unacknowledged messages to deliver
+    """
+    properties = mq_handler.consumer_properties[name]['properties']
+    properties['prefetch_count'] = prefetch_count
+    mq_handler.consumers[name] = mq_handler.consumer_thread_cls(**properties)
+
+
+# Header marking an error response forwarded to a client's response queue
+FORWARDED_ERROR_HEADER = "iris_forwarded_error"
+
+
+def get_error_routing_key(properties, body: bytes) -> Optional[str]:
+    """
+    Get the routing key of the client an error response is for
+    :param properties: pika BasicProperties of the message
+    :param body: serialized message
+    :returns: `routing_key` header if set, else `context.routing_key`
+    """
+    headers = getattr(properties, "headers", None) or dict()
+    if "routing_key" in headers:
+        return headers["routing_key"]
+    response = get_codec(getattr(properties, "content_type",
+                                 None)).decode(body)
+    return (response.get("context") or {}).get("routing_key")
+
+
+def forward_error(channel, method, properties, body: bytes,
+                  routing_key: Optional[str] = None):
+    """
+    Forward a message from the shared error queue to the response queue of
+    the client it is for and acknowledge it. Every client consumes the shared
+    error queue, so errors for other clients must be passed on rather than
+    requeued or dropped.
+    :param channel: channel the error was received on
+    :param method: pika delivery method of the message
+    :param properties: pika BasicProperties of the message
+    :param body: serialized message
+    :param routing_key: routing key of the owning client, if already known
+    """
+    routing_key = routing_key or get_error_routing_key(properties, body)
+    if routing_key:
+        headers = dict(getattr(properties, "headers", None) or dict())
+        headers["routing_key"] = routing_key
+        headers[FORWARDED_ERROR_HEADER] = True
+        channel.basic_publish(exchange='', routing_key=routing_key,
+                              body=body, properties=pika.BasicProperties(
+                                  content_type=getattr(properties,
+                                                       "content_type", None),
+                                  headers=headers))
+    else:
+        LOG.warning("Dropping error response with no routing key")
+    channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def is_forwarded_error(properties) -> bool:
+    """
+    Check if a message received on a response queue was forwarded from the
+    shared error queue by `forward_error`
+    :param properties: pika BasicProperties of the message
+    :returns: True if the message is an error response
+    """
+    headers = getattr(properties, "headers", None) or dict()
+    return bool(headers.get(FORWARDED_ERROR_HEADER))
+
+
+class MQConnectionManager:
+    """
+    Manages the NeonMQHandler associated with a client. Messages are published
+    on a single reusable channel and connection health is tracked as state
+    updated by pika callbacks and publish results, so checking the connection
+    does not require a round-trip to the broker.
+    """
+    def __init__(self, handler_factory: Callable[[], NeonMQHandler],
+                 max_channels: int = 4):
+        """
+        :param handler_factory: callable returning a new, running NeonMQHandler
+        :param max_channels: max number of channels to open on the connection
+        """
+        self._handler_factory = handler_factory
+        self.max_channels = max_channels
+        self._lock = RLock()
+        self._channels: List[BlockingChannel] = list()
+        self._publish_channel: Optional[BlockingChannel] = None
+        self._declared_queues = set()
+        self._healthy = False
+        self._blocked = False
+        self._handler = None
+        self._connect()
+
+    @property
+    def mq_handler(self) -> NeonMQHandler:
+        """
+        The current NeonMQHandler, without checking connection health
+        """
+        return self._handler
+
+    @property
+    def healthy(self) -> bool:
+        """
+        True if the connection is open and has not failed since it was opened
+        """
+        return self._healthy and self._handler.connection.is_open
+
+    @property
+    def blocked(self) -> bool:
+        """
+        True if the broker has blocked publishing on this connection
+        (i.e. due to a resource alarm)
+        """
+        return self._blocked
+
+    @property
+    def open_channels(self) -> int:
+        """
+        Number of channels currently opened by this manager
+        """
+        return len(self._channels)
+
+    def get_handler(self) -> NeonMQHandler:
+        """
+        Get the NeonMQHandler, reconnecting first if the connection is not
+        healthy.
+        """
+        with self._lock:
+            if not self.healthy:
+                LOG.warning("Connection closed, recreating")
+                self.reconnect()
+            return self._handler
+
+    def reconnect(self):
+        """
+        Stop the current NeonMQHandler and replace it with a new one
+        """
+        with self._lock:
+            self._stop_handler()
+            self._connect()
+
+    def open_channel(self) -> BlockingChannel:
+        """
+        Open a new channel on the managed connection. Channels should be
+        returned with `close_channel` when no longer needed.
+        :returns: open BlockingChannel
+        """
+        with self._lock:
+            self._channels = [c for c in self._channels if c.is_open]
+            if len(self._channels) >= self.max_channels:
+                raise RuntimeError(f"Channel limit reached "
+                                   f"({self.max_channels})")
+            channel = self._handler.connection.channel()
+            self._channels.append(channel)
+            return channel
+
+    def close_channel(self, channel: BlockingChannel):
+        """
+        Close a channel opened with `open_channel`
+        :param channel: BlockingChannel to close
+        """
+        with self._lock:
+            if channel in self._channels:
+                self._channels.remove(channel)
+            if channel is self._publish_channel:
+                self._publish_channel = None
+                self._declared_queues.clear()
+            try:
+                if channel.is_open:
+                    channel.close()
+            except AMQPError as e:
+                LOG.debug(f"Channel already closed: {e}")
+
+    def publish(self, queue: str, request_data: dict,
+                expiration: int = 1000,
+                codec: MessageCodec = LEGACY_CODEC) -> str:
+        """
+        Publish a message to a queue on the reusable publish channel. If the
+        connection was lost, it is recreated and the publish retried once.
+        :param queue: name of the queue to publish to
+        :param request_data: dict message to publish
+        :param expiration: message expiration time in milliseconds
+        :param codec: MessageCodec to serialize the message with
+        :returns: message_id of the published message
+        """
+        request_data = self._with_message_id(request_data)
+        body = codec.encode(request_data)
+        properties = pika.BasicProperties(expiration=str(expiration),
+                                          content_type=codec.content_type)
+        with self._lock:
+            try:
+                self._publish(queue, body, properties)
+            except AMQPError as e:
+                LOG.warning(f"Publish failed ({e}), reconnecting")
+                self._healthy = False
+                self.reconnect()
+                self._publish(queue, body, properties)
+        return request_data['message_id']
+
+    def publish_batch(self, queue: str, messages: List[dict],
+                      expiration: int = 1000,
+                      codec: MessageCodec = LEGACY_CODEC,
+                      timeout: float = 30) -> List[bool]:
+        """
+        Publish messages to a queue on a channel with publisher confirms
+        enabled. All messages are published before waiting for confirms, so
+        a batch takes about one round-trip to the broker.
+        :param queue: name of the queue to publish to
+        :param messages: dict messages to publish
+        :param expiration: message expiration time in milliseconds
+        :param codec: MessageCodec to serialize the messages with
+        :param timeout: max seconds to wait for the broker to confirm messages
+        :returns: list of True for each message accepted by the broker, False
+            for messages rejected or not confirmed within `timeout`
+        """
+        bodies = [codec.encode(self._with_message_id(m)) for m in messages]
+        properties = pika.BasicProperties(expiration=str(expiration),
+                                          content_type=codec.content_type)
+        with self._lock:
+            if not self.healthy:
+                self.reconnect()
+            channel = self.open_channel()
+            try:
+                channel.queue_declare(queue=queue, auto_delete=False)
+                return self._publish_confirmed(channel, queue, bodies,
+                                               properties, timeout)
+            except AMQPError:
+                self._healthy = False
+                raise
+            finally:
+                self.close_channel(channel)
+
+    def _publish_confirmed(self, channel: BlockingChannel, queue: str,
+                           bodies: List[bytes],
+                           properties: pika.BasicProperties,
+                           timeout: float) -> List[bool]:
+        # BlockingChannel waits for each confirm before returning from
+        # `basic_publish`, so publish on the underlying channel and process
+        # confirms as they arrive instead
+        impl = channel._impl
+        connection = self._handler.connection
+        results: List[Optional[bool]] = [None] * len(bodies)
+        state = {"selected": False, "confirmed": 0}
+
+        def _on_confirm(frame):
+            method = frame.method
+            accepted = isinstance(method, pika.spec.Basic.Ack)
+            tags = range(state["confirmed"] + 1, method.delivery_tag + 1) \
+                if method.multiple else (method.delivery_tag,)
+            for tag in tags:
+                if results[tag - 1] is None:
+                    results[tag - 1] = accepted
+            while state["confirmed"] < len(results) and \
+                    results[state["confirmed"]] is not None:
+                state["confirmed"] += 1
+
+        def _on_select_ok(_):
+            state["selected"] = True
+
+        deadline = time() + timeout
+        impl.confirm_delivery(_on_confirm, _on_select_ok)
+        while not state["selected"] and time() < deadline:
+            connection.process_data_events(
+                time_limit=max(deadline - time(), 0))
+        if not state["selected"]:
+            raise TimeoutError("Timed out enabling publisher confirms")
+        for body in bodies:
+            impl.basic_publish('', queue, body, properties)
+        while state["confirmed"] < len(results) and time() < deadline:
+            connection.process_data_events(
+                time_limit=max(deadline - time(), 0))
+        return [r is True for r in results]
+
+    def get_queue_depth(self, queue: str) -> int:
+        """
+        Get the number of messages waiting in a queue
+        :param queue: name of the queue to check
+        :returns: number of messages ready for delivery, 0 if the queue does
+            not exist
+        """
+        with self._lock:
+            if not self.healthy:
+                self.reconnect()
+            channel = self._get_publish_channel()
+            try:
+                return channel.queue_declare(
+                    queue=queue, passive=True).method.message_count
+            except ChannelClosedByBroker:
+                # Queue does not exist; the broker closed the channel
+                return 0
+
+    @staticmethod
+    def _with_message_id(request_data: dict) -> dict:
+        request_data = dict(request_data)
+        if request_data.get('message_id') is None:
+            request_data['message_id'] = \
+                request_data.get("context", {}).get("mq", {}).get(
+                    "message_id") or NeonMQHandler.create_unique_id()
+        return request_data
+
+    def _publish(self, queue: str, body: bytes,
+                 properties: pika.BasicProperties):
+        if not self.healthy:
+            self.reconnect()
+        channel = self._get_publish_channel()
+        try:
+            if queue not in self._declared_queues:
+                channel.queue_declare(queue=queue, auto_delete=False)
+                self._declared_queues.add(queue)
+            channel.basic_publish(exchange='', routing_key=queue, body=body,
+                                  properties=properties)
+        except AMQPError:
+            self._healthy = False
+            raise
+
+    def _get_publish_channel(self) -> BlockingChannel:
+        if not self._publish_channel or not self._publish_channel.is_open:
+            if self._publish_channel:
+                self.close_channel(self._publish_channel)
+            self._publish_channel = self.open_channel()
+            self._declared_queues.clear()
+        return self._publish_channel
+
+    def _connect(self):
+        self._handler = self._handler_factory()
+        self._channels = list()
+        self._publish_channel = None
+        self._declared_queues.clear()
+        self._blocked = False
+        connection = self._handler.connection
+        connection.add_on_connection_blocked_callback(self._on_blocked)
+        connection.add_on_connection_unblocked_callback(self._on_unblocked)
+        self._healthy = connection.is_open
+
+    def _on_blocked(self, *_):
+        LOG.warning("MQ connection blocked by broker")
+        self._blocked = True
+
+    def _on_unblocked(self, *_):
+        LOG.info("MQ connection unblocked")
+        self._blocked = False
+
+    def _stop_handler(self):
+        handler = self._handler
+        self._healthy = False
+        try:
+            handler.stop()
+        except Exception as e:
+            LOG.error(e)
+            try:
+                handler.stop_sync_thread()
+            except Exception as x:
+                LOG.exception(x)
+                LOG.error("Sync Thread not shutdown")
+            try:
+                handler.stop_consumers()
+            except Exception as x:
+                LOG.exception(x)
+                LOG.error("Consumers not shutdown")
+        try:
+            if handler.connection.is_open:
+                handler.connection.close()
+        except Exception as e:
+            LOG.debug(f"Connection already closed: {e}")
+
+    def stop(self):
+        """
+        Close all channels and stop the managed NeonMQHandler
+        """
+        with self._lock:
+            for channel in list(self._channels):
+                self.close_channel(channel)
+            self._stop_handler()
+
+
+class MQConnectionHub:
+    """
+    Shares one MQ connection between many clients (or many session routing
+    keys). Responses are consumed from each registered routing key's queue on
+    a single channel and routed by routing key to the registered callback, and
+    the shared error queue is consumed and deserialized once for all clients.
+    Messages are published on a shared MQConnectionManager.
+    """
+    def __init__(self, mq_config: dict, vhost: str = "/neon_chat_api",
+                 error_queue: str = "neon_chat_api_error",
+                 prefetch_count: int = 50, max_channels: int = 4):
+        """
+        :param mq_config: MQ configuration
+        :param vhost: MQ vhost to connect to
+        :param error_queue: shared queue to consume error responses from
+        :param prefetch_count: max unacknowledged messages to receive
+        :param max_channels: max channels to open for publishing
+        """
+        self._config = mq_config.get("MQ") or mq_config
+        self.vhost = vhost
+        self.error_queue = error_queue
+        self.prefetch_count = prefetch_count
+        self.connection_manager = MQConnectionManager(
+            partial(NeonMQHandler, self._config, "mq_handler", vhost),
+            max_channels)
+        self._routes: Dict[str, Tuple[Callable,
+                                      Optional[Callable[[Message], None]]]] = \
+            dict()
+        self._consumer_tags: Dict[str, str] = dict()
+        self._lock = Lock()
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel: Optional[BlockingChannel] = None
+        self._connected = Event()
+        self._stopping = Event()
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="iris_mq_hub")
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def __contains__(self, routing_key: str) -> bool:
+        return routing_key in self._routes
+
+    @property
+    def connected(self) -> bool:
+        """
+        True if the hub is connected and consuming
+        """
+        return self._connected.is_set()
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the hub has connected and started consuming
+        :param timeout: max seconds to wait
+        :returns: True if connected
+        """
+        return self._connected.wait(timeout)
+
+    def register(self, routing_key: str, on_response: Callable,
+                 on_error: Optional[Callable[[Message], None]] = None):
+        """
+        Route responses for `routing_key` to the specified callbacks
+        :param routing_key: routing key (response queue) to consume
+        :param on_response: callback with pika consumer signature
+            (channel, method, properties, body) for responses
+        :param on_error: callback for deserialized error responses with a
+            matching `context.routing_key`
+        """
+        with self._lock:
+            self._routes[routing_key] = (on_response, on_error)
+            if self.connected:
+                self._connection.add_callback_threadsafe(
+                    partial(self._consume, routing_key))
+
+    def unregister(self, routing_key: str):
+        """
+        Stop routing responses for `routing_key` and remove its queue
+        :param routing_key: routing key previously passed to `register`
+        """
+        with self._lock:
+            if not self._routes.pop(routing_key, None):
+                return
+            if self.connected:
+                self._connection.add_callback_threadsafe(
+                    partial(self._cancel, routing_key))
+
+    def publish(self, queue: str, request_data: dict,
+                expiration: int = 1000,
+                codec: MessageCodec = LEGACY_CODEC) -> str:
+        """
+        Publish a message on the shared connection
+        :param queue: name of the queue to publish to
+        :param request_data: dict message to publish
+        :param expiration: message expiration time in milliseconds
+        :param codec: MessageCodec to serialize the message with
+        :returns: message_id of the published message
+        """
+        return self.connection_manager.publish(queue, request_data,
+                                               expiration, codec)
+
+    def publish_batch(self, queue: str, messages: List[dict],
+                      expiration: int = 1000,
+                      codec: MessageCodec = LEGACY_CODEC,
+                      timeout: float = 30) -> List[bool]:
+        """
+        Publish messages on the shared connection with publisher confirms
+        :param queue: name of the queue to publish to
+        :param messages: dict messages to publish
+        :param expiration: message expiration time in milliseconds
+        :param codec: MessageCodec to serialize the messages with
+        :param timeout: max seconds to wait for the broker to confirm messages
+        :returns: list of True for each message accepted by the broker
+        """
+        return self.connection_manager.publish_batch(queue, messages,
+                                                     expiration, codec,
+                                                     timeout)
+
+    def shutdown(self):
+        """
+        Stop consuming and close all connections
+        """
+        self._stopping.set()
+        if self.connected:
+            try:
+                self._connection.add_callback_threadsafe(
+                    self._channel.stop_consuming)
+            except AMQPError as e:
+                LOG.debug(e)
+        self._thread.join(30)
+        self.connection_manager.stop()
+
+    def _run(self):
+        params = self.connection_manager.mq_handler.get_connection_params(
+            self.vhost)
+        delay = 1
+        while not self._stopping.is_set():
+            try:
+                self._connection = pika.BlockingConnection(params)
+                self._channel = self._connection.channel()
+                self._channel.basic_qos(prefetch_count=self.prefetch_count)
+                self._channel.queue_declare(queue=self.error_queue,
+                                            auto_delete=False)
+                self._channel.basic_consume(self.error_queue,
+                                            self._on_error_message,
+                                            auto_ack=False)
+                with self._lock:
+                    self._consumer_tags.clear()
+                    for routing_key in self._routes:
+                        self._consume(routing_key)
+                    self._connected.set()
+                delay = 1
+                self._channel.start_consuming()
+            except AMQPError as e:
+                if self._stopping.is_set():
+                    break
+                LOG.warning(f"Hub connection lost ({e}), reconnecting in "
+                            f"{delay}s")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, 60)
+            finally:
+                self._connected.clear()
+        try:
+            if self._connection and self._connection.is_open:
+                self._connection.close()
+        except AMQPError as e:
+            LOG.debug(e)
+
+    def _consume(self, routing_key: str):
+        if routing_key in self._consumer_tags or \
+                routing_key not in self._routes:
+            return
+        self._channel.queue_declare(queue=routing_key, auto_delete=False)
+        self._consumer_tags[routing_key] = self._channel.basic_consume(
+            routing_key, self._on_message, auto_ack=False)
+
+    def _cancel(self, routing_key: str):
+        consumer_tag = self._consumer_tags.pop(routing_key, None)
+        if consumer_tag:
+            self._channel.basic_cancel(consumer_tag)
+            self._channel.queue_delete(queue=routing_key)
+
+    def _on_message(self, channel, method, properties, body):
+        route = self._routes.get(method.routing_key)
+        if not route:
+            # The client was unregistered; nobody else consumes its queue, so
+            # requeueing would redeliver the response here indefinitely
+            LOG.warning(f"Dropping response with no route: "
+                        f"{method.routing_key}")
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        try:
+            route[0](channel, method, properties, body)
+        except Exception as e:
+            LOG.exception(f"Error handling response to "
+                          f"{method.routing_key}: {e}")
+
+    def _on_error_message(self, channel, method, properties, body):
+        headers = getattr(properties, "headers", None) or dict()
+        routing_key = headers.get("routing_key")
+        if routing_key is not None and routing_key not in self._routes:
+            # Error for another process; no need to decode it
+            route = None
+        else:
+            response = get_codec(getattr(properties, "content_type",
+                                         None)).decode(body)
+            routing_key = (response.get("context") or {}).get("routing_key")
+            route = self._routes.get(routing_key)
+        if not route:
+            # Another process owns this routing key
+            forward_error(channel, method, properties, body, routing_key)
+            return
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        if route[1]:
+            message = Message(response.get('msg_type'), response.get('data'),
+                              response.get('context'))
+            try:
+                route[1](message)
+            except Exception as e:
+                LOG.exception(f"Error handling error response to "
+                              f"{routing_key}: {e}")
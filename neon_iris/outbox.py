@@ -0,0 +1,186 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pickle
+
+from collections import deque
+from itertools import count
+from os import makedirs, remove
+from os.path import join
+from shutil import rmtree
+from threading import Event, RLock, Thread
+from time import time
+from typing import Callable, Deque, Optional, Tuple, Type
+
+from ovos_utils.log import LOG
+
+
+class Outbox:
+    """
+    Buffers outgoing messages that could not be published so they are
+    published in order once the connection recovers. Publishing is retried
+    with exponential backoff, and messages that are not published before
+    their deadline are dropped rather than replayed.
+    """
+    def __init__(self, publish: Callable[[dict], None],
+                 on_drop: Optional[Callable[[dict, Exception], None]] = None,
+                 max_size: int = 1000, timeout: float = 30,
+                 spill_dir: Optional[str] = None,
+                 max_backoff: float = 30,
+                 retry_exceptions: Tuple[Type[Exception], ...] = (Exception,)):
+        """
+        :param publish: callable to publish a message; raises on failure
+        :param on_drop: callback for messages that are dropped unpublished
+        :param max_size: max number of messages to buffer in memory
+        :param timeout: default seconds to retry a message before dropping it
+        :param spill_dir: if specified, messages exceeding `max_size` are
+            written to this directory instead of being dropped
+        :param max_backoff: max seconds to wait between publish retries
+        :param retry_exceptions: exceptions raised by `publish` that indicate
+            the message should be buffered and retried
+        """
+        self._publish = publish
+        self._on_drop = on_drop
+        self.max_size = max_size
+        self.timeout = timeout
+        self.spill_dir = spill_dir
+        self.max_backoff = max_backoff
+        self.retry_exceptions = retry_exceptions
+        self._lock = RLock()
+        self._queue: Deque[Tuple[float, dict]] = deque()
+        self._spilled: Deque[str] = deque()
+        self._seq = count()
+        self._stopping = Event()
+        self._thread: Optional[Thread] = None
+        if spill_dir:
+            # Anything left from a previous process is past its deadline
+            rmtree(spill_dir, ignore_errors=True)
+            makedirs(spill_dir)
+
+    def __len__(self):
+        return len(self._queue) + len(self._spilled)
+
+    def send(self, message: dict, timeout: Optional[float] = None):
+        """
+        Publish a message, or buffer it to be published when the connection
+        recovers.
+        :param message: message to publish
+        :param timeout: seconds to retry the message before dropping it
+        :raises BufferError: if the message could not be published or buffered
+        """
+        deadline = time() + (timeout or self.timeout)
+        with self._lock:
+            if self._stopping.is_set():
+                raise RuntimeError("Outbox is shut down")
+            if not len(self):
+                try:
+                    self._publish(message)
+                    return
+                except self.retry_exceptions as e:
+                    LOG.warning(f"Publish failed, buffering messages: {e}")
+            self._enqueue(deadline, message)
+            self._start()
+
+    def shutdown(self):
+        """
+        Stop publishing and drop any buffered messages
+        """
+        self._stopping.set()
+        thread = self._thread
+        if thread:
+            thread.join(5)
+        with self._lock:
+            while len(self):
+                _, message = self._pop()
+                self._drop(message, ConnectionError("Outbox shut down"))
+        if self.spill_dir:
+            rmtree(self.spill_dir, ignore_errors=True)
+
+    def _enqueue(self, deadline: float, message: dict):
+        if len(self._queue) < self.max_size and not self._spilled:
+            self._queue.append((deadline, message))
+        elif self.spill_dir:
+            path = join(self.spill_dir, f"{next(self._seq):012d}")
+            with open(path, "wb") as f:
+                pickle.dump((deadline, message), f)
+            self._spilled.append(path)
+        else:
+            raise BufferError(f"Outbox full ({self.max_size} messages)")
+
+    def _peek(self) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            while self._spilled and len(self._queue) < self.max_size:
+                path = self._spilled.popleft()
+                with open(path, "rb") as f:
+                    self._queue.append(pickle.load(f))
+                remove(path)
+            return self._queue[0] if self._queue else None
+
+    def _pop(self) -> Tuple[float, dict]:
+        with self._lock:
+            self._peek()
+            return self._queue.popleft()
+
+    def _drop(self, message: dict, error: Exception):
+        LOG.warning(f"Dropping {message.get('msg_type')}: {error}")
+        if self._on_drop:
+            try:
+                self._on_drop(message, error)
+            except Exception as e:
+                LOG.exception(e)
+
+    def _start(self):
+        if not self._thread:
+            self._thread = Thread(target=self._run, daemon=True,
+                                  name="iris_outbox")
+            self._thread.start()
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            with self._lock:
+                item = self._peek()
+                if not item:
+                    # `send` starts a new thread when messages are buffered
+                    self._thread = None
+                    return
+            deadline, message = item
+            if deadline < time():
+                self._pop()
+                self._drop(message, TimeoutError("Message expired before "
+                                                 "it was published"))
+                continue
+            try:
+                self._publish(message)
+                self._pop()
+                backoff = 0.5
+            except self.retry_exceptions as e:
+                LOG.warning(f"Publish failed, retrying in {backoff}s: {e}")
+                self._stopping.wait(min(backoff, max(deadline - time(), 0)))
+                backoff = min(backoff * 2, self.max_backoff)
+            except Exception as e:
+                self._pop()
+                self._drop(message, e)
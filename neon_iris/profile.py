@@ -0,0 +1,200 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from hashlib import sha256
+from itertools import count
+from json import dumps
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _read_only(*_, **__):
+    raise TypeError("User profile snapshots are read-only; use `to_dict()` "
+                    "to get a mutable copy")
+
+
+class FrozenList(list):
+    """
+    Read-only list. Serializes exactly like a `list`.
+    """
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = \
+        _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict. Serializes exactly like a `dict`.
+    """
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def to_dict(self) -> dict:
+        """
+        Get a mutable deep copy of this object
+        """
+        return thaw(self)
+
+
+class ProfileSnapshot(FrozenDict):
+    """
+    Immutable snapshot of a user profile. Snapshots are cheap to pass around
+    and share; a new snapshot with a higher `version` is created whenever the
+    profile changes.
+    """
+    __slots__ = ("version", "_digest")
+    _versions = count(1)
+
+    def __init__(self, profile: dict, version: Optional[int] = None):
+        """
+        :param profile: user profile to snapshot
+        :param version: version of this snapshot; if None, a new, unique
+            version is assigned
+        """
+        FrozenDict.__init__(self, {k: freeze(v) for k, v in profile.items()})
+        self.version = version if version is not None else \
+            next(self._versions)
+        self._digest = None
+
+    def __reduce__(self):
+        return ProfileSnapshot, (dict(self), self.version)
+
+    @property
+    def digest(self) -> str:
+        """
+        sha256 hex digest of this profile's contents
+        """
+        if self._digest is None:
+            self._digest = profile_digest(dict(self))
+        return self._digest
+
+
+class ProfileReferences:
+    """
+    Tracks the user profiles sent to Neon so that unchanged profiles may be
+    sent by reference (username and digest) instead of in full.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._sent: Dict[str, Tuple[str, dict]] = dict()
+
+    def get_context(self, profiles: List[dict]) -> Tuple[List[dict],
+                                                         List[dict]]:
+        """
+        Get the profiles to include with a message
+        :param profiles: user profiles associated with a message
+        :returns: list of profiles that have not been sent in full, list of
+            references to all `profiles`
+        """
+        full_profiles = list()
+        refs = list()
+        with self._lock:
+            for profile in profiles:
+                username = profile['user']['username']
+                digest = profile_digest(profile)
+                sent = self._sent.get(username)
+                if not sent or sent[0] != digest:
+                    full_profiles.append(profile)
+                    self._sent[username] = (digest, profile)
+                refs.append({"username": username, "digest": digest})
+        return full_profiles, refs
+
+    def get_profiles(self, refs: List[dict]) -> List[dict]:
+        """
+        Get the most recently sent full profiles for the specified references
+        :param refs: profile references included with a message
+        :returns: list of known profiles for the users in `refs`
+        """
+        with self._lock:
+            sent = [self._sent.get(ref['username']) for ref in refs]
+        return [s[1] for s in sent if s]
+
+    def forget(self, usernames: Optional[List[str]] = None):
+        """
+        Forget that profiles were sent, so they are sent in full next time
+        :param usernames: usernames to forget; if None, forget all profiles
+        """
+        with self._lock:
+            if usernames is None:
+                self._sent.clear()
+            for username in usernames or []:
+                self._sent.pop(username, None)
+
+
+def profile_digest(profile: dict) -> str:
+    """
+    Get a sha256 hex digest of a user profile's contents
+    :param profile: user profile to hash
+    :returns: hex digest; equal for profiles with equal contents
+    """
+    if isinstance(profile, ProfileSnapshot):
+        return profile.digest
+    return sha256(dumps(profile, sort_keys=True,
+                        default=str).encode()).hexdigest()
+
+
+def freeze(obj: Any) -> Any:
+    """
+    Get a read-only copy of a JSON-parsable object
+    """
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj: Any) -> Any:
+    """
+    Get a mutable deep copy of a JSON-parsable object
+    """
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(v) for v in obj]
+    return obj
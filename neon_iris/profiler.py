@@ -0,0 +1,417 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import marshal
+import sys
+import threading
+
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from inspect import iscoroutinefunction
+from os import makedirs
+from os.path import basename, expanduser, join
+from time import sleep, strftime, time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from ovos_utils.log import LOG
+
+from neon_iris.metrics import MetricsRegistry, REGISTRY
+
+# Leaf functions of threads that are waiting rather than running. Stacks
+# ending in these are omitted unless `include_idle` is requested.
+_IDLE_FUNCTIONS = {("threading.py", "wait"),
+                   ("threading.py", "_wait_for_tstate_lock"),
+                   ("selectors.py", "select"),
+                   ("queue.py", "get"),
+                   ("socket.py", "accept"),
+                   ("socket.py", "readinto"),
+                   ("ssl.py", "read"),
+                   ("socketserver.py", "serve_forever")}
+
+_FuncKey = Tuple[str, int, str]
+
+
+def _func_key(code) -> _FuncKey:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that periodically records the stack of every thread
+    from a background thread. Unlike cProfile, this profiles all threads and
+    adds no overhead to the profiled code, so it may be left running in
+    production services.
+    """
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        """
+        :param interval: seconds between samples
+        :param include_idle: if True, also record threads that are waiting
+            (i.e. on a lock, queue, or socket)
+        """
+        self.interval = interval
+        self.include_idle = include_idle
+        self.started: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stacks: Dict[Tuple[str, Tuple[_FuncKey, ...]], int] = Counter()
+        self._rounds = 0
+        self._sampled_time = 0.0
+        self._ignored_threads = set()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def sample_interval(self) -> float:
+        """
+        Mean seconds between samples. This may be longer than `interval` when
+        other threads hold the GIL.
+        """
+        with self._lock:
+            if not self._rounds:
+                return self.interval
+            return self._sampled_time / self._rounds
+
+    @property
+    def sample_count(self) -> int:
+        with self._lock:
+            return sum(self._stacks.values())
+
+    def start(self):
+        """
+        Start sampling in a background thread
+        """
+        if self.running:
+            return
+        self._stopping.clear()
+        self.started = self.started or time()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="iris-profiler")
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling; recorded samples are kept until `reset`
+        """
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        """
+        Discard all recorded samples
+        """
+        with self._lock:
+            self._stacks.clear()
+            self._rounds = 0
+            self._sampled_time = 0.0
+            self.started = time() if self.running else None
+
+    def sample(self):
+        """
+        Record the current stack of every other thread
+        """
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = list()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or ident in self._ignored_threads:
+                continue
+            if not self.include_idle and \
+                    (basename(frame.f_code.co_filename),
+                     frame.f_code.co_name) in _IDLE_FUNCTIONS:
+                continue
+            stack = list()
+            while frame is not None:
+                stack.append(_func_key(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks.append((names.get(ident, str(ident)), tuple(stack)))
+        with self._lock:
+            self._stacks.update(stacks)
+
+    def get_collapsed(self) -> str:
+        """
+        Get recorded samples as collapsed stacks, one `frame;frame count` line
+        per unique stack with the thread name as the root frame. This is the
+        input format of flamegraph.pl, speedscope, and similar tools.
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+        lines = list()
+        for (thread_name, stack), count in stacks:
+            frames = [thread_name.replace(";", ":")] + \
+                [f"{name} ({basename(filename)}:{line})"
+                 for filename, line, name in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        lines.sort()
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def get_stats(self) -> dict:
+        """
+        Get recorded samples as a `pstats` stats dict. Times are estimated from
+        sample counts, and call counts are the number of samples a function
+        appears in since calls are not observed.
+        """
+        interval = self.sample_interval
+        with self._lock:
+            stacks = list(self._stacks.items())
+        stats = dict()
+        for (_, stack), count in stacks:
+            seconds = count * interval
+            # Count each function once per stack so recursion isn't inflated
+            seen = set()
+            for idx, func in enumerate(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, dict()])
+                leaf = idx == len(stack) - 1
+                if func not in seen:
+                    seen.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if leaf:
+                    entry[2] += seconds
+                if idx:
+                    caller = entry[4].setdefault(stack[idx - 1],
+                                                 [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[2] += seconds if leaf else 0.0
+                    caller[3] += seconds
+        return {func: (cc, nc, tt, ct,
+                       {k: tuple(v) for k, v in callers.items()})
+                for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+    def get_pstats(self) -> bytes:
+        """
+        Get recorded samples serialized in the format written by
+        `cProfile.Profile.dump_stats`, which can be loaded with
+        `pstats.Stats` or viewed with tools like snakeviz
+        """
+        return marshal.dumps(self.get_stats())
+
+    def _run(self):
+        last = time()
+        while not self._stopping.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                LOG.error(f"Profiler sample failed: {e}")
+            now = time()
+            with self._lock:
+                self._rounds += 1
+                self._sampled_time += now - last
+            last = now
+
+
+class Profiler(SamplingProfiler):
+    """
+    Opt-in profiling for long-running services: a SamplingProfiler plus timers
+    around message and input handlers, recorded in the
+    `iris_handler_seconds` metric. Timers are only recorded while enabled.
+    """
+    def __init__(self, interval: float = 0.005,
+                 registry: MetricsRegistry = REGISTRY):
+        """
+        :param interval: seconds between samples
+        :param registry: MetricsRegistry to record handler timers in
+        """
+        SamplingProfiler.__init__(self, interval)
+        self.enabled = False
+        self.registry = registry
+        self.handler_seconds = registry.histogram(
+            "iris_handler_seconds", "Time spent in instrumented handlers",
+            ("handler",))
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def enable(self, interval: Optional[float] = None):
+        """
+        Start sampling and recording handler timers
+        :param interval: seconds between samples
+        """
+        self.interval = interval or self.interval
+        self.enabled = True
+        self.start()
+
+    def disable(self):
+        """
+        Stop sampling and recording handler timers
+        """
+        self.enabled = False
+        self.stop()
+        if self._server:
+            self._server.shutdown()
+            self._server = None
+
+    def timer(self, name: str):
+        """
+        Get a context manager that records the time spent in its block as
+        handler `name`, if profiling is enabled
+        :param name: name of the handler
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name: str):
+        start = time()
+        try:
+            yield
+        finally:
+            self.handler_seconds.observe(time() - start, handler=name)
+
+    def dump(self, directory: str) -> Tuple[str, str]:
+        """
+        Write recorded samples to timestamped `.prof` (pstats) and `.folded`
+        (collapsed stacks) files
+        :param directory: directory to write files to
+        :returns: paths to the pstats and collapsed stacks files
+        """
+        directory = expanduser(directory)
+        makedirs(directory, exist_ok=True)
+        base = join(directory, f"iris-{strftime('%Y%m%d-%H%M%S')}")
+        with open(f"{base}.prof", "wb") as f:
+            f.write(self.get_pstats())
+        with open(f"{base}.folded", "w") as f:
+            f.write(self.get_collapsed())
+        LOG.info(f"Wrote profile to {base}")
+        return f"{base}.prof", f"{base}.folded"
+
+    def dump_on_signal(self, directory: str, signum: Optional[int] = None):
+        """
+        Dump recorded samples to `directory` when the process receives a
+        signal. Must be called from the main thread.
+        :param directory: directory to write files to
+        :param signum: signal to dump on; defaults to SIGUSR1
+        """
+        import signal
+        signum = signum or getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            LOG.warning("Signals are not supported on this platform")
+            return
+        signal.signal(signum, lambda *_: threading.Thread(
+            target=self.dump, args=(directory,), daemon=True).start())
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> int:
+        """
+        Serve profiling results over HTTP from a background thread:
+        - `/profile`: samples as collapsed stacks, or with `?format=pstats`
+          as pstats. With `?seconds=N`, samples for N seconds and returns only
+          those samples.
+        - `/metrics`: metrics, including handler timers, in Prometheus format
+        :param port: port to listen on; 0 selects an unused port
+        :param host: address to listen on. Profiles expose code paths, so
+            this should not be publicly accessible.
+        :returns: port the server is listening on
+        """
+        self._server = ThreadingHTTPServer((host, port),
+                                           _make_request_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True,
+                         name="iris-profiler-http").start()
+        LOG.info(f"Serving profiles on {host}:{self._server.server_port}")
+        return self._server.server_port
+
+    def get_window(self, seconds: float) -> SamplingProfiler:
+        """
+        Sample for a limited time, independently of any ongoing sampling
+        :param seconds: seconds to sample for
+        :returns: stopped SamplingProfiler with the samples taken
+        """
+        window = SamplingProfiler(self.interval)
+        window._ignored_threads.add(threading.get_ident())
+        window.start()
+        sleep(seconds)
+        window.stop()
+        return window
+
+
+def _make_request_handler(profiler: Profiler):
+    class _ProfileRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/metrics":
+                body = profiler.registry.to_prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            elif url.path == "/profile":
+                try:
+                    seconds = float(query.get("seconds") or 0)
+                except ValueError:
+                    self.send_error(400, "Invalid seconds")
+                    return
+                source = profiler.get_window(min(seconds, 300)) if seconds \
+                    else profiler
+                if query.get("format") == "pstats":
+                    body = source.get_pstats()
+                    content_type = "application/octet-stream"
+                else:
+                    body = source.get_collapsed().encode("utf-8")
+                    content_type = "text/plain"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            LOG.debug(format % args)
+
+    return _ProfileRequestHandler
+
+
+PROFILER = Profiler()
+
+
+def profiled(name: str):
+    """
+    Decorator that times calls to a function or coroutine function with
+    `PROFILER.timer`
+    :param name: handler name to record timers with
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with PROFILER.timer(name):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with PROFILER.timer(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
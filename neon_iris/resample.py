@@ -0,0 +1,210 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from functools import lru_cache
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Filter length, in zero crossings of the lowpass filter on each side
+_ZERO_CROSSINGS = 16
+# Passband as a fraction of the lower Nyquist frequency
+_ROLLOFF = 0.945
+# Kaiser window shape; ~86dB stopband attenuation
+_KAISER_BETA = 8.6
+# Max filter phases to compute outputs for one phase at a time
+_MAX_PHASES = 16
+# Outputs to compute at once when there are more filter phases
+_BLOCK_SIZE = 256
+
+
+@lru_cache(maxsize=16)
+def get_filter_table(src_rate: int, dst_rate: int) -> \
+        Tuple[int, int, np.ndarray]:
+    """
+    Get the polyphase filter table to resample audio from `src_rate` to
+    `dst_rate`. Tables are cached, so streams with the same rates share one.
+    :param src_rate: input sample rate
+    :param dst_rate: output sample rate
+    :returns: upsampling factor, downsampling factor, and float32 array of
+        shape (upsampling factor, taps) with filter coefficients for each
+        phase, in order of input samples
+    """
+    if src_rate <= 0 or dst_rate <= 0:
+        raise ValueError(f"Invalid sample rates: {src_rate}, {dst_rate}")
+    factor = gcd(src_rate, dst_rate)
+    up, down = dst_rate // factor, src_rate // factor
+    # Cutoff in cycles per sample at the upsampled rate
+    cutoff = _ROLLOFF * 0.5 / max(up, down)
+    taps = int(np.ceil(_ZERO_CROSSINGS / cutoff / up))
+    # Center the filter on an upsampled sample
+    center = (taps * up - 1) // 2
+    offsets = np.arange(taps * up) - center
+    window = np.i0(_KAISER_BETA * np.sqrt(np.clip(
+        1 - (offsets / (center + 1)) ** 2, 0, None))) / np.i0(_KAISER_BETA)
+    coefficients = 2 * cutoff * up * np.sinc(2 * cutoff * offsets) * window
+    # Phase `p` filters input samples with coefficients p, p + up, ... with
+    # the last coefficient applied to the first input sample
+    table = coefficients.reshape(taps, up).T[:, ::-1]
+    return up, down, np.ascontiguousarray(table, dtype=np.float32)
+
+
+class StreamResampler:
+    """
+    Resamples a stream of audio that is received in frames. Filter state is
+    kept between frames, so output is continuous across frame boundaries.
+    """
+    def __init__(self, src_rate: int, dst_rate: int = 16000,
+                 dtype: type = np.float32):
+        """
+        :param src_rate: sample rate of input audio
+        :param dst_rate: sample rate to resample to
+        :param dtype: output dtype, `np.float32` or `np.int16`
+        """
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.int16):
+            raise ValueError(f"Unsupported output dtype: {self.dtype}")
+        self._up, self._down, self._table = \
+            get_filter_table(src_rate, dst_rate)
+        self._taps = self._table.shape[1]
+        # Input samples kept from previous frames
+        self._history = self._taps - 1
+        # Upsampled samples from the center of the filter to its last tap
+        self._delay = (self._taps * self._up - 1) // 2
+        # Buffers are reused between frames and grow as needed. int16 output
+        # is computed in `_filtered` before converting it
+        self._input = np.zeros(self._history, dtype=np.float32)
+        self._output = np.zeros(0, dtype=self.dtype)
+        self._filtered = np.zeros(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """
+        Reset filter state to start a new stream
+        """
+        self._input[:self._history] = 0
+        # Samples received and output
+        self._received = 0
+        self._sent = 0
+
+    def _get_input_buffer(self, size: int) -> np.ndarray:
+        """
+        Get the input buffer, starting with the kept input samples
+        :param size: number of samples needed
+        """
+        if self._input.shape[0] < size:
+            samples = np.zeros(size * 2, dtype=np.float32)
+            samples[:self._history] = self._input[:self._history]
+            self._input = samples
+        return self._input[:size]
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Resample the next frame of audio in the stream. Output is delayed by
+        about half of the filter length, so it may include fewer samples
+        than the frame duration.
+        :param audio: array of input audio
+        :returns: resampled audio. This is a view of a buffer that is reused
+            by the next call to `process`
+        """
+        size = self._history + audio.shape[0]
+        samples = self._get_input_buffer(size)
+        samples[self._history:] = audio
+        self._received += audio.shape[0]
+        # Output sample k is centered on upsampled sample k * down and needs
+        # input up to upsampled sample k * down + delay
+        end = (self._received * self._up - self._delay + self._down - 1) \
+            // self._down
+        count = max(end - self._sent, 0)
+        if self._output.shape[0] < count:
+            self._output = np.zeros(count * 2, dtype=self.dtype)
+            if self.dtype != np.float32:
+                self._filtered = np.zeros(count * 2, dtype=np.float32)
+        result = self._output[:count]
+        output = result if self.dtype == np.float32 else \
+            self._filtered[:count]
+        first = self._sent * self._down + self._delay
+        start = self._received - size
+        if self._up <= _MAX_PHASES:
+            self._filter_phases(samples, first, start, output)
+        else:
+            self._filter_blocks(samples, first, start, output)
+        self._sent += count
+
+        # Keep inputs needed for the next output
+        samples[:self._history] = samples[size - self._history:]
+
+        if self.dtype == np.int16:
+            np.clip(np.round(output, out=output), -32768, 32767, out=output)
+            result[:] = output
+        return result
+
+    def _filter_phases(self, samples: np.ndarray, first: int, start: int,
+                       output: np.ndarray):
+        """
+        Compute output samples one phase at a time. Outputs with the same
+        phase are `up` outputs apart and their input windows are `down`
+        samples apart, so each phase is one product with a strided view of
+        the input.
+        :param samples: input samples
+        :param first: upsampled position of the first output sample
+        :param start: index of `samples[0]` in the stream
+        :param output: array to write output samples to
+        """
+        stride = samples.strides[0]
+        for idx in range(min(self._up, output.shape[0])):
+            position = first + idx * self._down
+            offset = position // self._up - start - self._taps + 1
+            rows = (output.shape[0] - idx + self._up - 1) // self._up
+            windows = as_strided(samples[offset:], (rows, self._taps),
+                                 (stride * self._down, stride))
+            np.einsum("ij,j->i", windows, self._table[position % self._up],
+                      out=output[idx::self._up])
+
+    def _filter_blocks(self, samples: np.ndarray, first: int, start: int,
+                       output: np.ndarray):
+        """
+        Compute output samples in blocks, gathering the input window and
+        filter phase of each output. This is faster than `_filter_phases`
+        when there are many phases with few outputs each.
+        :param samples: input samples
+        :param first: upsampled position of the first output sample
+        :param start: index of `samples[0]` in the stream
+        :param output: array to write output samples to
+        """
+        windows = as_strided(samples, (samples.shape[0] - self._taps + 1,
+                                       self._taps), samples.strides * 2)
+        for block in range(0, output.shape[0], _BLOCK_SIZE):
+            positions = first + self._down * np.arange(
+                block, min(block + _BLOCK_SIZE, output.shape[0]))
+            offsets = positions // self._up - start - self._taps + 1
+            np.einsum("ij,ij->i", windows[offsets],
+                      self._table[positions % self._up],
+                      out=output[block:block + positions.shape[0]])
@@ -0,0 +1,206 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from base64 import b64decode, b64encode
+from os import makedirs
+from os.path import dirname, expanduser, isfile
+from typing import Dict, Optional, Tuple, Union
+
+from neon_utils.socket_utils import b64_to_dict, dict_to_b64
+from ovos_utils.log import LOG
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class MessageCodec:
+    """
+    Serializes dict messages to and from MQ message bodies. `content_type` is
+    set in the AMQP properties of published messages so receivers can select
+    the matching codec.
+    """
+    name = "legacy"
+    content_type: Optional[str] = None
+    binary = False
+
+    def encode(self, data: dict) -> bytes:
+        """
+        Serialize a message for publishing
+        :param data: dict message to serialize
+        :returns: serialized message body
+        """
+        if isinstance(data.get("data"), dict):
+            msg_data = _bytes_to_b64(data["data"])
+            if msg_data is not data["data"]:
+                data = {**data, "data": msg_data}
+        return dict_to_b64(data)
+
+    def decode(self, body: bytes) -> dict:
+        """
+        Deserialize a received message
+        :param body: received message body
+        :returns: dict message
+        """
+        return b64_to_dict(body)
+
+
+class MsgpackCodec(MessageCodec):
+    """
+    Serializes messages with msgpack. Binary data (i.e. audio) is carried as
+    raw bytes instead of base64-encoded strings.
+    """
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+    binary = True
+
+    def encode(self, data: dict) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, body: bytes) -> dict:
+        return msgpack.unpackb(body, raw=False)
+
+
+LEGACY_CODEC = MessageCodec()
+_codecs: Dict[Optional[str], MessageCodec] = {None: LEGACY_CODEC}
+if msgpack:
+    _codecs[MSGPACK_CONTENT_TYPE] = MsgpackCodec()
+
+
+def get_codec(content_type: Optional[str] = None) -> MessageCodec:
+    """
+    Get the codec for a received message
+    :param content_type: AMQP content_type of the message
+    :returns: matching MessageCodec, else the legacy base64 JSON codec
+    """
+    codec = _codecs.get(content_type)
+    if not codec:
+        LOG.warning(f"Unsupported content_type: {content_type}")
+        return LEGACY_CODEC
+    return codec
+
+
+def get_codec_by_name(name: str) -> Optional[MessageCodec]:
+    """
+    Get an available codec by name
+    :param name: codec name (i.e. `msgpack`, `legacy`)
+    :returns: MessageCodec if available, else None
+    """
+    for codec in _codecs.values():
+        if codec.name == name:
+            return codec
+    return None
+
+
+def supported_content_types() -> list:
+    """
+    Get content types supported for received messages, in order of preference
+    """
+    return [c for c in _codecs if c is not None]
+
+
+def audio_to_bytes(audio_data: Union[str, bytes]) -> bytes:
+    """
+    Get raw audio from a message value that may be base64-encoded
+    :param audio_data: raw bytes or base64-encoded string
+    :returns: raw bytes
+    """
+    if isinstance(audio_data, str):
+        return b64decode(audio_data.encode("utf-8"))
+    return audio_data
+
+
+def audio_to_b64(audio_data: Union[str, bytes]) -> str:
+    """
+    Get base64-encoded audio from a message value that may be raw bytes
+    :param audio_data: raw bytes or base64-encoded string
+    :returns: base64-encoded string
+    """
+    if isinstance(audio_data, bytes):
+        return b64encode(audio_data).decode("utf-8")
+    return audio_data
+
+
+def decode_audio_to_file(audio_data: Union[str, bytes],
+                         output_path: str) -> str:
+    """
+    Write out audio from a message value to a file at the specified path
+    :param audio_data: raw bytes or base64-encoded string
+    :param output_path: Path to file to write (throws exception if file exists)
+    :returns: Path to output file
+    """
+    output_path = expanduser(output_path)
+    if isfile(output_path):
+        LOG.error(f"File already exists: {output_path}")
+        raise FileExistsError(output_path)
+    makedirs(dirname(output_path), exist_ok=True)
+    with open(output_path, "wb+") as f:
+        f.write(audio_to_bytes(audio_data))
+    return output_path
+
+
+def get_body_patterns(text: str) -> Tuple[bytes, ...]:
+    """
+    Get byte patterns to check for `text` in a serialized message without
+    decoding it. Any message body containing `text` in a string value will
+    contain at least one of the returned patterns for all supported codecs,
+    including the legacy base64 codec. This allows cheaply filtering messages
+    by an ID (i.e. a routing key) before decoding them.
+    :param text: string to search for
+    :returns: tuple of byte patterns
+    """
+    raw = text.encode("utf-8")
+    patterns = [raw]
+    # base64 encodes 3-byte groups, so the encoding of `text` depends on its
+    # offset in the encoded string. Only keep characters determined entirely
+    # by `text` for each possible offset.
+    for offset in range(3):
+        encoded = b64encode(bytes(offset) + raw)
+        start = -(-4 * offset // 3)
+        end = 4 * (offset + len(raw)) // 3
+        patterns.append(encoded[start:end])
+    return tuple(patterns)
+
+
+def _bytes_to_b64(data):
+    """
+    Replace any `bytes` values in message data with base64-encoded strings.
+    Returns `data` unchanged if it contains no `bytes`.
+    """
+    if isinstance(data, bytes):
+        return b64encode(data).decode("utf-8")
+    if isinstance(data, dict):
+        encoded = {k: _bytes_to_b64(v) for k, v in data.items()}
+        if any(encoded[k] is not v for k, v in data.items()):
+            return encoded
+    elif isinstance(data, list):
+        encoded = [_bytes_to_b64(v) for v in data]
+        if any(e is not v for e, v in zip(encoded, data)):
+            return encoded
+    return data
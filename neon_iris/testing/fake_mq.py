@@ -0,0 +1,875 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import heapq
+import wave
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import count
+from queue import Empty, Queue
+from threading import Condition, Event, Lock, RLock, Thread, \
+    current_thread
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from unittest.mock import patch
+from uuid import uuid4
+
+import pika
+
+from neon_utils.mq_utils import NeonMQHandler
+from neon_utils.socket_utils import b64_to_dict, dict_to_b64
+from ovos_utils.log import LOG
+from pika.exceptions import ChannelClosedByBroker
+from pika.frame import Method
+from pika.spec import Basic, Confirm, Queue as QueueSpec
+
+from neon_iris.serialization import LEGACY_CODEC, MessageCodec, get_codec
+
+# (msg_type, data) responses to a request
+Responses = List[Tuple[str, dict]]
+
+
+class FakeConnectionParameters:
+    """
+    Connection parameters for a FakeConnection
+    """
+    def __init__(self, broker: "FakeMQBroker", virtual_host: str = "/"):
+        """
+        :param broker: FakeMQBroker to connect to
+        :param virtual_host: vhost to connect to
+        """
+        self.broker = broker
+        self.virtual_host = virtual_host
+
+
+class _FakeQueue:
+    def __init__(self):
+        # (body, properties, redelivered)
+        self.messages = deque()
+        # (channel, consumer_tag, callback, auto_ack)
+        self.consumers: List[tuple] = list()
+        self.next_consumer = 0
+
+
+class FakeMQBroker:
+    """
+    In-process stand-in for a RabbitMQ server, for tests and benchmarks.
+    Messages published to the default exchange are routed to the queue named
+    by the routing key and delivered to consumers on the thread consuming
+    their connection, as with pika's BlockingConnection. Unacknowledged
+    messages are requeued when nacked or when their channel is closed.
+    Message expiration and prefetch limits are not implemented.
+    """
+    def __init__(self):
+        self._lock = RLock()
+        self._queues: Dict[Tuple[str, str], _FakeQueue] = dict()
+        self._consumer_tags = count(1)
+
+    def get_connection_params(self, vhost: str = "/") -> \
+            FakeConnectionParameters:
+        """
+        Get parameters to open a FakeConnection to this broker
+        :param vhost: vhost to connect to
+        """
+        return FakeConnectionParameters(self, vhost)
+
+    def message_count(self, vhost: str, queue: str) -> int:
+        """
+        Get the number of messages waiting for delivery in a queue
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        :returns: number of undelivered messages, 0 if the queue does not exist
+        """
+        with self._lock:
+            fake_queue = self._queues.get((vhost, queue))
+            return len(fake_queue.messages) if fake_queue else 0
+
+    def declare(self, vhost: str, queue: str, passive: bool = False) -> \
+            Tuple[int, int]:
+        """
+        Declare a queue
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        :param passive: if True, only check that the queue exists
+        :returns: number of waiting messages and number of consumers
+        """
+        with self._lock:
+            key = (vhost, queue)
+            if key not in self._queues:
+                if passive:
+                    raise ChannelClosedByBroker(
+                        404, f"NOT_FOUND - no queue '{queue}' in vhost "
+                             f"'{vhost}'")
+                self._queues[key] = _FakeQueue()
+            fake_queue = self._queues[key]
+            return len(fake_queue.messages), len(fake_queue.consumers)
+
+    def delete(self, vhost: str, queue: str):
+        """
+        Delete a queue and any messages waiting in it
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        """
+        with self._lock:
+            fake_queue = self._queues.pop((vhost, queue), None)
+        for channel, consumer_tag, _, _ in \
+                (fake_queue.consumers if fake_queue else []):
+            channel._consumers.pop(consumer_tag, None)
+
+    def publish(self, vhost: str, queue: str, body: bytes,
+                properties: Optional[pika.BasicProperties] = None,
+                redelivered: bool = False):
+        """
+        Publish a message to a queue, creating the queue if necessary
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        :param body: message body
+        :param properties: message properties
+        :param redelivered: True if the message is being requeued
+        """
+        properties = properties or pika.BasicProperties()
+        with self._lock:
+            fake_queue = self._queues.setdefault((vhost, queue), _FakeQueue())
+            if redelivered:
+                fake_queue.messages.appendleft((body, properties, True))
+            else:
+                fake_queue.messages.append((body, properties, False))
+            self._dispatch(queue, fake_queue)
+
+    def consume(self, vhost: str, queue: str, channel: "FakeChannel",
+                callback: Callable, auto_ack: bool) -> str:
+        """
+        Add a consumer to a queue
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        :param channel: FakeChannel to deliver messages on
+        :param callback: callback with pika consumer signature
+        :param auto_ack: if True, messages are acknowledged on delivery
+        :returns: consumer tag
+        """
+        with self._lock:
+            fake_queue = self._queues.setdefault((vhost, queue), _FakeQueue())
+            consumer_tag = f"fake.ctag{next(self._consumer_tags)}"
+            fake_queue.consumers.append((channel, consumer_tag, callback,
+                                         auto_ack))
+            self._dispatch(queue, fake_queue)
+            return consumer_tag
+
+    def cancel(self, consumer_tag: str):
+        """
+        Remove a consumer added with `consume`
+        :param consumer_tag: consumer tag returned by `consume`
+        """
+        with self._lock:
+            for fake_queue in self._queues.values():
+                fake_queue.consumers = [c for c in fake_queue.consumers
+                                        if c[1] != consumer_tag]
+
+    def send_mq_request(self, vhost: str, request_data: dict,
+                        target_queue: str, response_queue: str = None,
+                        timeout: int = 30,
+                        expect_response: bool = True) -> dict:
+        """
+        Stand-in for `neon_mq_connector.utils.client_utils.send_mq_request`
+        that sends the request through this broker.
+        :param vhost: vhost to target
+        :param request_data: data to post to target_queue
+        :param target_queue: queue to post request to
+        :param response_queue: optional queue to monitor for a response
+        :param timeout: time in seconds to wait for a response
+        :param expect_response: if True, wait for a response
+        :returns: response to request
+        """
+        response_queue = response_queue or uuid4().hex
+        message_id = NeonMQHandler.create_unique_id()
+        request_data['message_id'] = message_id
+        response_event = Event()
+        response_data = dict()
+
+        def handle_mq_response(channel, method, _, body):
+            api_output = b64_to_dict(body)
+            api_output_msg_id = api_output.get('context', api_output).get(
+                'mq', api_output).get('message_id')
+            if api_output_msg_id == message_id:
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                response_data.update(api_output)
+                response_event.set()
+            else:
+                channel.basic_nack(delivery_tag=method.delivery_tag)
+
+        handler = FakeMQHandler(vhost=vhost, broker=self)
+        try:
+            if expect_response:
+                handler.register_consumer('neon_output_handler', vhost,
+                                          response_queue, handle_mq_response,
+                                          auto_ack=False)
+                handler.run_consumers()
+                request_data['routing_key'] = response_queue
+            handler.emit_mq_message(handler.connection, request_data,
+                                    queue=target_queue)
+            if expect_response and not response_event.wait(timeout):
+                LOG.error(f"Timeout waiting for response to: {message_id} "
+                          f"on {response_queue}")
+        finally:
+            handler.stop()
+        return response_data
+
+    def _dispatch(self, queue: str, fake_queue: _FakeQueue):
+        while fake_queue.messages and fake_queue.consumers:
+            body, properties, redelivered = fake_queue.messages.popleft()
+            idx = fake_queue.next_consumer % len(fake_queue.consumers)
+            fake_queue.next_consumer = idx + 1
+            channel, consumer_tag, callback, auto_ack = \
+                fake_queue.consumers[idx]
+            channel._deliver(queue, consumer_tag, callback, auto_ack, body,
+                             properties, redelivered)
+
+
+class FakeChannel:
+    """
+    Stand-in for a pika BlockingChannel on a FakeConnection
+    """
+    def __init__(self, connection: "FakeConnection", channel_number: int):
+        self.connection = connection
+        self.channel_number = channel_number
+        self._broker = connection.broker
+        self._vhost = connection.vhost
+        self._lock = Lock()
+        self._open = True
+        self._consuming = False
+        self._consumers: Dict[str, str] = dict()
+        self._delivery_tags = count(1)
+        # delivery_tag -> (queue, body, properties)
+        self._unacked: Dict[int, tuple] = dict()
+        self._on_confirm: Optional[Callable] = None
+        self._published = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._open and self.connection.is_open
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    @property
+    def consumer_tags(self) -> List[str]:
+        return list(self._consumers)
+
+    @property
+    def _impl(self) -> "FakeChannel":
+        # Publisher confirms are processed as connection events, so the
+        # underlying channel behaves like the blocking channel
+        return self
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0,
+                  global_qos: bool = False):
+        # Recorded, but deliveries are not limited
+        self.prefetch_count = prefetch_count
+
+    def queue_declare(self, queue: str, passive: bool = False, **_) -> Method:
+        try:
+            message_count, consumer_count = \
+                self._broker.declare(self._vhost, queue, passive)
+        except ChannelClosedByBroker:
+            self.close()
+            raise
+        return Method(self.channel_number,
+                      QueueSpec.DeclareOk(queue, message_count,
+                                          consumer_count))
+
+    def queue_delete(self, queue: str, **_):
+        self._broker.delete(self._vhost, queue)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[pika.BasicProperties] = None,
+                      mandatory: bool = False):
+        self._broker.publish(self._vhost, routing_key, body, properties)
+        if self._on_confirm:
+            self._published += 1
+            frame = Method(self.channel_number,
+                           Basic.Ack(delivery_tag=self._published))
+            self.connection.add_callback_threadsafe(
+                lambda: self._on_confirm(frame))
+
+    def confirm_delivery(self, ack_nack_callback: Optional[Callable] = None,
+                         callback: Optional[Callable] = None):
+        self._on_confirm = ack_nack_callback or (lambda _: None)
+        if callback:
+            frame = Method(self.channel_number, Confirm.SelectOk())
+            self.connection.add_callback_threadsafe(lambda: callback(frame))
+
+    def basic_consume(self, queue: str, on_message_callback: Callable,
+                      auto_ack: bool = False, **_) -> str:
+        consumer_tag = self._broker.consume(self._vhost, queue, self,
+                                            on_message_callback, auto_ack)
+        self._consumers[consumer_tag] = queue
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str):
+        self._consumers.pop(consumer_tag, None)
+        self._broker.cancel(consumer_tag)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        self._settle(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False,
+                   requeue: bool = True):
+        for queue, body, properties in self._settle(delivery_tag, multiple):
+            if requeue:
+                self._broker.publish(self._vhost, queue, body, properties,
+                                     redelivered=True)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self._consumers and self.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self):
+        for consumer_tag in self.consumer_tags:
+            self.basic_cancel(consumer_tag)
+        self._consuming = False
+
+    def close(self):
+        if not self._open:
+            return
+        self._open = False
+        self.stop_consuming()
+        # Unacknowledged messages are requeued when their channel closes
+        self.basic_nack(multiple=True)
+
+    def _settle(self, delivery_tag: int, multiple: bool) -> List[tuple]:
+        with self._lock:
+            if multiple:
+                tags = [t for t in self._unacked
+                        if not delivery_tag or t <= delivery_tag]
+            else:
+                tags = [delivery_tag] if delivery_tag in self._unacked else []
+            return [self._unacked.pop(t) for t in tags]
+
+    def _deliver(self, queue: str, consumer_tag: str, callback: Callable,
+                 auto_ack: bool, body: bytes,
+                 properties: pika.BasicProperties, redelivered: bool):
+        with self._lock:
+            delivery_tag = next(self._delivery_tags)
+            if not auto_ack:
+                self._unacked[delivery_tag] = (queue, body, properties)
+        method = Basic.Deliver(consumer_tag, delivery_tag, redelivered, '',
+                               queue)
+
+        def _on_message():
+            if self.is_open and consumer_tag in self._consumers:
+                callback(self, method, properties, body)
+        self.connection.add_callback_threadsafe(_on_message)
+
+
+class FakeConnection:
+    """
+    Stand-in for a pika BlockingConnection to a FakeMQBroker. Deliveries and
+    callbacks added with `add_callback_threadsafe` are run by the thread
+    calling `process_data_events` (or a channel's `start_consuming`).
+    """
+    def __init__(self, parameters: FakeConnectionParameters):
+        """
+        :param parameters: FakeConnectionParameters to connect with
+        """
+        self.broker = parameters.broker
+        self.vhost = parameters.virtual_host
+        self._events = Queue()
+        self._channel_numbers = count(1)
+        self._open = True
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def is_closed(self) -> bool:
+        return not self._open
+
+    def channel(self, channel_number: Optional[int] = None) -> FakeChannel:
+        return FakeChannel(self, channel_number or
+                           next(self._channel_numbers))
+
+    def add_callback_threadsafe(self, callback: Callable):
+        self._events.put(callback)
+
+    def add_on_connection_blocked_callback(self, callback: Callable):
+        pass
+
+    def add_on_connection_unblocked_callback(self, callback: Callable):
+        pass
+
+    def process_data_events(self, time_limit: Optional[float] = 0):
+        """
+        Run pending events. If `time_limit` is None, block until at least one
+        event is run; otherwise, wait up to `time_limit` seconds for one.
+        :param time_limit: max seconds to wait for an event
+        """
+        deadline = None if time_limit is None else time() + time_limit
+        timeout = None if deadline is None else time_limit
+        while self._open:
+            try:
+                event = self._events.get(timeout=timeout) if \
+                    timeout is None or timeout > 0 else \
+                    self._events.get_nowait()
+            except Empty:
+                return
+            event()
+            # Drain any other pending events without waiting
+            timeout = 0
+
+    def sleep(self, duration: float):
+        deadline = time() + duration
+        while time() < deadline and self._open:
+            self.process_data_events(deadline - time())
+
+    def close(self):
+        self._open = False
+        # Wake any thread waiting on events
+        self._events.put(lambda: None)
+
+
+class FakeConsumerThread(Thread):
+    """
+    Stand-in for a neon_mq_connector BlockingConsumerThread
+    """
+    def __init__(self, connection_params: FakeConnectionParameters,
+                 queue: str, callback_func: Callable,
+                 error_func: Optional[Callable] = None,
+                 auto_ack: bool = True, prefetch_count: int = 50,
+                 *args, **kwargs):
+        Thread.__init__(self, daemon=True, name=f"fake_consumer_{queue}")
+        self.connection = FakeConnection(connection_params)
+        self.channel = self.connection.channel()
+        self.queue = queue
+        self.callback_func = callback_func
+        self.error_func = error_func
+        self.auto_ack = auto_ack
+        self.prefetch_count = prefetch_count
+        self._consuming = Event()
+
+    @property
+    def is_consuming(self) -> bool:
+        return self._consuming.is_set()
+
+    def run(self):
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.queue_declare(queue=self.queue)
+        self.channel.basic_consume(self.queue, self._on_message,
+                                   auto_ack=self.auto_ack)
+        self._consuming.set()
+        try:
+            self.channel.start_consuming()
+        finally:
+            self._consuming.clear()
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            self.callback_func(channel, method, properties, body)
+        except Exception as e:
+            if self.error_func:
+                self.error_func(self, e)
+            else:
+                LOG.exception(f"{self.name} raised {e}")
+
+    def join(self, timeout: Optional[float] = None):
+        if self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.channel.close)
+        if self.is_alive() and current_thread() is not self:
+            Thread.join(self, timeout)
+        self.connection.close()
+
+
+class FakeMQHandler:
+    """
+    Stand-in for a NeonMQHandler connected to a FakeMQBroker. Instances use
+    `broker` if specified, else the class `default_broker`.
+    """
+    default_broker: Optional[FakeMQBroker] = None
+    consumer_thread_cls = FakeConsumerThread
+    create_unique_id = staticmethod(NeonMQHandler.create_unique_id)
+
+    def __init__(self, config: Optional[dict] = None,
+                 service_name: str = "mq_handler", vhost: str = "/",
+                 broker: Optional[FakeMQBroker] = None):
+        """
+        :param config: MQ configuration (ignored)
+        :param service_name: name of the service
+        :param vhost: vhost to connect to
+        :param broker: FakeMQBroker to connect to
+        """
+        self.config = config
+        self.service_name = service_name
+        self.vhost = vhost
+        self.broker = broker or self.default_broker
+        if not self.broker:
+            raise ValueError("No FakeMQBroker specified")
+        self.connection = FakeConnection(self.get_connection_params(vhost))
+        self.consumers: Dict[str, FakeConsumerThread] = dict()
+        self.consumer_properties: Dict[str, dict] = dict()
+
+    def get_connection_params(self, vhost: str, **_) -> \
+            FakeConnectionParameters:
+        return self.broker.get_connection_params(vhost)
+
+    def register_consumer(self, name: str, vhost: str, queue: str,
+                          callback: Callable,
+                          on_error: Optional[Callable] = None,
+                          auto_ack: bool = True, **_):
+        properties = {"connection_params": self.get_connection_params(vhost),
+                      "queue": queue, "callback_func": callback,
+                      "error_func": on_error, "auto_ack": auto_ack}
+        self.consumer_properties[name] = {"properties": properties}
+        self.consumers[name] = self.consumer_thread_cls(**properties)
+
+    def run_consumers(self, names: tuple = (), daemon: bool = True):
+        for name in names or tuple(self.consumers):
+            consumer = self.consumers[name]
+            if not consumer.is_alive():
+                consumer.start()
+                consumer._consuming.wait(5)
+
+    def run(self, run_consumers: bool = True, **_):
+        if run_consumers:
+            self.run_consumers()
+        return self
+
+    def stop_consumers(self, names: tuple = ()):
+        for name in names or tuple(self.consumers):
+            self.consumers[name].join(5)
+
+    def stop_sync_thread(self):
+        pass
+
+    def stop(self):
+        self.stop_consumers()
+        self.connection.close()
+
+    @classmethod
+    def emit_mq_message(cls, connection: FakeConnection, request_data: dict,
+                        exchange: Optional[str] = '', queue: Optional[str] = '',
+                        expiration: int = 1000, **_) -> str:
+        request_data.setdefault('message_id', cls.create_unique_id())
+        channel = connection.channel()
+        channel.basic_publish(exchange=exchange or '', routing_key=queue,
+                              body=dict_to_b64(request_data),
+                              properties=pika.BasicProperties(
+                                  expiration=str(expiration)))
+        channel.close()
+        return request_data['message_id']
+
+
+class _Scheduler(Thread):
+    """
+    Runs callbacks after a delay on a single thread
+    """
+    def __init__(self):
+        Thread.__init__(self, daemon=True, name="fake_neon_scheduler")
+        self._cond = Condition()
+        self._events = list()
+        self._seq = count()
+        self._stopping = False
+
+    def call_later(self, delay: float, callback: Callable):
+        with self._cond:
+            heapq.heappush(self._events, (time() + delay, next(self._seq),
+                                          callback))
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and \
+                        (not self._events or self._events[0][0] > time()):
+                    self._cond.wait(self._events[0][0] - time()
+                                    if self._events else None)
+                if self._stopping:
+                    return
+                _, _, callback = heapq.heappop(self._events)
+            try:
+                callback()
+            except Exception as e:
+                LOG.exception(e)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+
+def make_wav(duration: float = 0.5, sample_rate: int = 16000) -> bytes:
+    """
+    Generate a silent, 16-bit mono WAV file
+    :param duration: length of the audio in seconds
+    :param sample_rate: audio sample rate
+    :returns: WAV file contents
+    """
+    wav_io = BytesIO()
+    with wave.open(wav_io, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(2 * int(duration * sample_rate)))
+    return wav_io.getvalue()
+
+
+class FakeNeonCore:
+    """
+    Scripted stand-in for a Neon Core connected to a FakeMQBroker. Requests
+    are answered after a configurable latency with responses shaped like those
+    from Neon Core. Responses to a `msg_type` may be replaced by setting
+    `responders[msg_type]` to a callable accepting the request dict and
+    returning a list of (msg_type, data) responses.
+    """
+    def __init__(self, broker: FakeMQBroker,
+                 latency: Union[float, Dict[str, float]] = 0.0,
+                 vhost: str = "/neon_chat_api",
+                 request_queue: str = "neon_chat_api_request",
+                 error_queue: str = "neon_chat_api_error",
+                 languages: Optional[List[str]] = None,
+                 genders: Tuple[str, ...] = ("female",),
+                 transcript: str = "what time is it",
+                 tts_duration: float = 0.5):
+        """
+        :param broker: FakeMQBroker to consume requests from
+        :param latency: seconds to wait before responding, or a dict of
+            `msg_type` to latency (requests not in the dict are answered
+            immediately)
+        :param vhost: vhost to consume requests from
+        :param request_queue: queue to consume requests from
+        :param error_queue: queue to publish error responses to
+        :param languages: languages to report STT and TTS support for
+        :param genders: TTS voice genders to respond with
+        :param transcript: transcription of all audio inputs
+        :param tts_duration: length in seconds of TTS audio responses
+        """
+        self.broker = broker
+        self.latency = latency
+        self.vhost = vhost
+        self.request_queue = request_queue
+        self.error_queue = error_queue
+        self.languages = languages or ["en-us"]
+        self.genders = genders
+        self.transcript = transcript
+        self.tts_audio = make_wav(tts_duration)
+        self.received = Counter()
+        self.responders: Dict[str, Callable[[dict], Responses]] = {
+            "recognizer_loop:utterance": self._respond_utterance,
+            "neon.audio_input": self._respond_audio_input,
+            "neon.get_stt": self._respond_get_stt,
+            "neon.get_tts": self._respond_get_tts,
+            "neon.languages.get": self._respond_languages
+        }
+        self._connection = FakeConnection(
+            broker.get_connection_params(vhost))
+        self._channel = self._connection.channel()
+        self._lock = Lock()
+        self._consumer = None
+        self._scheduler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Start consuming requests
+        """
+        self._scheduler = _Scheduler()
+        self._scheduler.start()
+        self._consumer = FakeConsumerThread(
+            self.broker.get_connection_params(self.vhost),
+            self.request_queue, self._on_request, auto_ack=True)
+        self._consumer.start()
+        self._consumer._consuming.wait(5)
+
+    def stop(self):
+        """
+        Stop consuming requests. Pending responses are not sent.
+        """
+        if self._consumer:
+            self._consumer.join(5)
+        if self._scheduler:
+            self._scheduler.stop()
+        self._connection.close()
+
+    def get_latency(self, msg_type: str) -> float:
+        """
+        Get the response latency for a request
+        :param msg_type: msg_type of the request
+        """
+        if isinstance(self.latency, dict):
+            return self.latency.get(msg_type, 0.0)
+        return self.latency
+
+    def _on_request(self, channel, method, properties, body):
+        codec = get_codec(getattr(properties, "content_type", None))
+        request = codec.decode(body)
+        msg_type = request.get("msg_type")
+        self.received[msg_type] += 1
+        delay = self.get_latency(msg_type)
+        if delay > 0:
+            self._scheduler.call_later(delay, lambda: self._respond(request))
+        else:
+            self._respond(request)
+
+    def _respond(self, request: dict):
+        msg_type = request.get("msg_type")
+        context = dict(request.get("context") or dict())
+        mq_context = context.get("mq") or dict()
+        routing_key = mq_context.get("routing_key") or \
+            request.get("routing_key")
+        if not routing_key:
+            LOG.warning(f"No routing key for {msg_type}; not responding")
+            return
+        codec = self._get_response_codec(mq_context.get("accept"))
+        responder = self.responders.get(msg_type)
+        if not responder:
+            self._publish_error(request, routing_key, codec,
+                                f"Unhandled msg_type: {msg_type}")
+            return
+        try:
+            responses = responder(request)
+        except Exception as e:
+            LOG.exception(e)
+            self._publish_error(request, routing_key, codec, repr(e))
+            return
+        if "mq" not in context:
+            # Requests via `send_mq_request` are matched by `message_id`
+            context.setdefault("session", {"session_id": "default"})
+        for response_type, data in responses:
+            response = {"msg_type": response_type, "data": data,
+                        "context": self._get_context(context),
+                        "message_id": request.get("message_id")}
+            self._publish(routing_key, response, codec)
+
+    def _publish_error(self, request: dict, routing_key: str,
+                       codec: MessageCodec, error: str):
+        context = self._get_context(request.get("context") or dict())
+        context["routing_key"] = routing_key
+        response = {"msg_type": "klat.error",
+                    "data": {"error": error,
+                             "message": {"msg_type": request.get("msg_type")}},
+                    "context": context}
+        self._publish(self.error_queue, response, codec,
+                      headers={"routing_key": routing_key})
+
+    def _publish(self, queue: str, response: dict, codec: MessageCodec,
+                 headers: Optional[dict] = None):
+        properties = pika.BasicProperties(content_type=codec.content_type,
+                                          headers=headers)
+        with self._lock:
+            self._channel.basic_publish('', queue, codec.encode(response),
+                                        properties)
+
+    @staticmethod
+    def _get_context(context: dict) -> dict:
+        context = dict(context)
+        context["timing"] = {**(context.get("timing") or dict()),
+                             "response_sent": time()}
+        return context
+
+    @staticmethod
+    def _get_response_codec(accept: Optional[list]) -> MessageCodec:
+        for content_type in accept or []:
+            codec = get_codec(content_type)
+            if codec.content_type == content_type:
+                return codec
+        return LEGACY_CODEC
+
+    def _get_tts(self, text: str, lang: str) -> dict:
+        response = {"sentence": text, "translated": False,
+                    "genders": list(self.genders), "audio": dict()}
+        for gender in self.genders:
+            response[gender] = f"{gender}.wav"
+            response["audio"][gender] = self.tts_audio
+        return response
+
+    def _get_klat_response(self, utterance: str, lang: str) -> dict:
+        return {"responses": {lang: self._get_tts(f"You said {utterance}",
+                                                  lang)}}
+
+    def _respond_utterance(self, request: dict) -> Responses:
+        data = request.get("data") or dict()
+        lang = data.get("lang", "en-us")
+        utterance = (data.get("utterances") or [""])[0]
+        return [("klat.response", self._get_klat_response(utterance, lang))]
+
+    def _respond_audio_input(self, request: dict) -> Responses:
+        data = request.get("data") or dict()
+        lang = data.get("lang", "en-us")
+        return [("neon.audio_input.response",
+                 {"transcripts": [self.transcript], "parser_data": dict(),
+                  "lang": lang}),
+                ("klat.response",
+                 self._get_klat_response(self.transcript, lang))]
+
+    def _respond_get_stt(self, request: dict) -> Responses:
+        data = request.get("data") or dict()
+        return [("neon.get_stt.response",
+                 {"transcripts": [self.transcript], "parser_data": dict(),
+                  "lang": data.get("lang", "en-us")})]
+
+    def _respond_get_tts(self, request: dict) -> Responses:
+        data = request.get("data") or dict()
+        lang = data.get("lang", "en-us")
+        return [("neon.get_tts.response",
+                 {lang: self._get_tts(data.get("text", ""), lang)})]
+
+    def _respond_languages(self, request: dict) -> Responses:
+        return [("neon.languages.get.response",
+                 {"stt": list(self.languages), "tts": list(self.languages),
+                  "skills": list(self.languages)})]
+
+
+@contextmanager
+def fake_mq_connection(broker: Optional[FakeMQBroker] = None):
+    """
+    Connect MQ clients created in this context to an in-process broker
+    instead of a RabbitMQ server. This patches NeonMQHandler as used by
+    `neon_iris`, `pika.BlockingConnection`, and `send_mq_request`.
+    :param broker: FakeMQBroker to connect to (default a new broker)
+    :returns: context manager yielding the FakeMQBroker
+    """
+    broker = broker or FakeMQBroker()
+    handler_class = type("FakeMQHandler", (FakeMQHandler,),
+                         {"default_broker": broker})
+    with patch("neon_iris.client.PrefetchMQHandler", handler_class), \
+            patch("neon_iris.mq_connection.NeonMQHandler", handler_class), \
+            patch("pika.BlockingConnection", FakeConnection), \
+            patch("neon_mq_connector.utils.client_utils.send_mq_request",
+                  broker.send_mq_request), \
+            patch("neon_iris.llm.send_mq_request", broker.send_mq_request):
+        yield broker
@@ -0,0 +1,481 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import re
+
+from contextvars import ContextVar
+from os import makedirs
+from os.path import dirname, expanduser
+from random import random
+from threading import Event, Lock, Thread
+from time import time
+from typing import Dict, List, Optional, Union
+from urllib.request import Request, urlopen
+from uuid import uuid4
+
+from ovos_utils.log import LOG
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("iris_span",
+                                                         default=None)
+# Default `parent`; use the span active in the current context
+_CURRENT = object()
+
+
+class Span:
+    """
+    A timed operation within a trace. Spans are identified and propagated
+    using W3C Trace Context `traceparent` strings, so a trace may continue in
+    another process (i.e. Neon Core) that receives a span's `traceparent`.
+    Spans may be used as context managers to make them the parent of spans
+    started within the block.
+    """
+    recording = True
+
+    def __init__(self, tracer: Optional["Tracer"], name: str, trace_id: str,
+                 parent_id: Optional[str] = None,
+                 start_time: Optional[float] = None,
+                 attributes: Optional[dict] = None):
+        """
+        :param tracer: Tracer to export this span with when it ends
+        :param name: name of the operation
+        :param trace_id: 32 character hex ID of the trace this span is part of
+        :param parent_id: 16 character hex ID of the parent span, if any
+        :param start_time: epoch time the operation started; defaults to now
+        :param attributes: dict of attributes describing the operation
+        """
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_time = start_time or time()
+        self.end_time: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def traceparent(self) -> Optional[str]:
+        """
+        W3C `traceparent` string identifying this span
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Seconds between the start and end of this span, if it has ended
+        """
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error: Union[Exception, str]):
+        """
+        Mark this span as failed
+        :param error: exception or description of the failure
+        """
+        self.error = repr(error) if isinstance(error, Exception) else error
+
+    def end(self, end_time: Optional[float] = None):
+        """
+        End this span and export it. Spans may only be ended once.
+        :param end_time: epoch time the operation ended; defaults to now
+        """
+        if self.end_time is not None:
+            return
+        self.end_time = end_time or time()
+        if self.tracer:
+            self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "start_time": self.start_time,
+                "end_time": self.end_time,
+                "duration": self.duration,
+                "attributes": self.attributes,
+                "error": self.error}
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_val is not None:
+            self.set_error(exc_val)
+        _current_span.reset(self._token)
+        self._token = None
+        self.end()
+
+    def __repr__(self):
+        return f"Span({self.name}, {self.traceparent})"
+
+
+class _NonRecordingSpan(Span):
+    """
+    Span returned when a trace is not sampled. It is never exported, and
+    spans started within it are not recorded either.
+    """
+    recording = False
+
+    def __init__(self):  # pylint: disable=super-init-not-called
+        self.tracer = None
+        self.name = ""
+        self.trace_id = "0" * 32
+        self.span_id = "0" * 16
+        self.parent_id = None
+        self.start_time = 0
+        self.end_time = None
+        self.attributes = dict()
+        self.error = None
+        self._token = None
+
+    @property
+    def traceparent(self) -> Optional[str]:
+        return None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, error: Union[Exception, str]):
+        pass
+
+    def end(self, end_time: Optional[float] = None):
+        pass
+
+
+class _DisabledSpan(_NonRecordingSpan):
+    """
+    Span returned by a Tracer without an exporter. A single instance is
+    shared, so it does not change the span active in the current context.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NOOP_SPAN = _DisabledSpan()
+
+
+def get_current_span() -> Optional[Span]:
+    """
+    Get the span active in the current context, if any
+    """
+    return _current_span.get()
+
+
+def parse_traceparent(traceparent: str) -> Optional[tuple]:
+    """
+    Parse a W3C `traceparent` string
+    :param traceparent: `traceparent` string (i.e. from a message context)
+    :returns: tuple of trace ID, parent span ID, and sampled flag, or None if
+        `traceparent` is not valid
+    """
+    match = _TRACEPARENT.match(traceparent or "")
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class SpanExporter:
+    """
+    Base class for writing ended spans to a destination
+    """
+    def export(self, span: Span):
+        raise NotImplementedError()
+
+    def shutdown(self):
+        pass
+
+
+class MemoryExporter(SpanExporter):
+    """
+    Keeps ended spans in memory (i.e. for tests)
+    """
+    def __init__(self):
+        self.spans: List[Span] = list()
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def get_spans(self, name: Optional[str] = None) -> List[Span]:
+        return [s for s in self.spans if name is None or s.name == name]
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    Appends each ended span to a file as a line of JSON
+    """
+    def __init__(self, path: str):
+        """
+        :param path: path to the file to write spans to
+        """
+        self.path = expanduser(path)
+        if dirname(self.path):
+            makedirs(dirname(self.path), exist_ok=True)
+        self._lock = Lock()
+        self._file = open(self.path, "a", buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+class OTLPExporter(SpanExporter):
+    """
+    Sends spans to an OpenTelemetry collector with OTLP/HTTP JSON. Spans are
+    sent in batches from a background thread so exporting never blocks the
+    traced operation.
+    """
+    def __init__(self, endpoint: str, service_name: str = "neon_iris",
+                 flush_interval: float = 1.0, max_queue: int = 10000):
+        """
+        :param endpoint: collector traces URL
+            (i.e. `http://localhost:4318/v1/traces`)
+        :param service_name: `service.name` resource attribute
+        :param flush_interval: max seconds between sends
+        :param max_queue: max spans to keep while the collector is unavailable
+        """
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._lock = Lock()
+        self._queue: List[Span] = list()
+        self._stopping = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                return
+            self._queue.append(span)
+
+    def flush(self):
+        """
+        Send all queued spans to the collector
+        """
+        with self._lock:
+            spans, self._queue = self._queue, list()
+        if not spans:
+            return
+        body = json.dumps(to_otlp(spans, self.service_name),
+                          default=str).encode("utf-8")
+        try:
+            urlopen(Request(self.endpoint, body,
+                            {"Content-Type": "application/json"}),
+                    timeout=10).close()
+        except Exception as e:
+            LOG.warning(f"Failed to export {len(spans)} spans: {e}")
+
+    def shutdown(self):
+        self._stopping.set()
+        self._thread.join(self.flush_interval + 10)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span], service_name: str = "neon_iris") -> dict:
+    """
+    Format spans as an OTLP `ExportTraceServiceRequest`
+    :param spans: ended spans to format
+    :param service_name: `service.name` resource attribute
+    :returns: dict request body
+    """
+    otlp_spans = list()
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(span.start_time * 1e9)),
+            "endTimeUnixNano": str(int(span.end_time * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)}
+                           for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error
+            else {"code": 1}}
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "neon_iris"},
+                        "spans": otlp_spans}]}]}
+
+
+class Tracer:
+    """
+    Creates spans and exports them when they end. Without an exporter, all
+    spans are non-recording so tracing adds negligible overhead.
+    """
+    def __init__(self, exporter: Optional[SpanExporter] = None,
+                 sample_rate: float = 1.0):
+        """
+        :param exporter: SpanExporter to write ended spans to
+        :param sample_rate: fraction of traces to record, from 0 to 1. The
+            decision is made when a trace starts and applies to all its spans
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(self, name: str, parent=_CURRENT,
+                   start_time: Optional[float] = None,
+                   attributes: Optional[dict] = None) -> Span:
+        """
+        Start a span. It must be ended with `Span.end` or by using it as a
+        context manager.
+        :param name: name of the operation
+        :param parent: parent Span or `traceparent` string. Defaults to the
+            span active in the current context; if None, a new trace is started
+        :param start_time: epoch time the operation started; defaults to now
+        :param attributes: dict of attributes describing the operation
+        :returns: new Span, or a non-recording span if not traced
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is _CURRENT:
+            parent = _current_span.get()
+        if isinstance(parent, str):
+            parsed = parse_traceparent(parent)
+            if not parsed:
+                LOG.debug(f"Invalid traceparent: {parent}")
+                parent = None
+            elif not parsed[2]:
+                return _NonRecordingSpan()
+            else:
+                return Span(self, name, parsed[0], parsed[1], start_time,
+                            attributes)
+        if parent is None:
+            if self.sample_rate < 1 and random() >= self.sample_rate:
+                return _NonRecordingSpan()
+            return Span(self, name, uuid4().hex, None, start_time, attributes)
+        if not parent.recording:
+            return _NonRecordingSpan()
+        return Span(self, name, parent.trace_id, parent.span_id, start_time,
+                    attributes)
+
+    def span(self, name: str, parent=_CURRENT,
+             attributes: Optional[dict] = None) -> Span:
+        """
+        Start a span to be used as a context manager, i.e.
+        `with tracer.span("name"):`
+        """
+        return self.start_span(name, parent, attributes=attributes)
+
+    def record_span(self, name: str, start_time: float, end_time: float,
+                    parent=_CURRENT,
+                    attributes: Optional[dict] = None) -> Span:
+        """
+        Record a span for an operation that has already completed (i.e. from
+        timestamps reported by another process)
+        :param name: name of the operation
+        :param start_time: epoch time the operation started
+        :param end_time: epoch time the operation ended
+        :param parent: parent Span or `traceparent` string
+        :param attributes: dict of attributes describing the operation
+        :returns: ended Span
+        """
+        span = self.start_span(name, parent, start_time, attributes)
+        span.end(end_time)
+        return span
+
+    def export(self, span: Span):
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            LOG.error(f"Failed to export span {span}: {e}")
+
+
+_exporters: Dict[str, SpanExporter] = dict()
+_exporters_lock = Lock()
+
+
+def get_exporter(config: dict) -> Optional[SpanExporter]:
+    """
+    Get the exporter specified in `iris` configuration. Exporters are shared
+    by all clients in a process that use the same destination.
+    :param config: `iris` configuration with `trace_file` or `trace_endpoint`
+    :returns: SpanExporter, or None if tracing is not configured
+    """
+    if config.get("trace_endpoint"):
+        key = config["trace_endpoint"]
+        create = OTLPExporter
+    elif config.get("trace_file"):
+        key = expanduser(config["trace_file"])
+        create = JsonLinesExporter
+    else:
+        return None
+    with _exporters_lock:
+        if key not in _exporters:
+            _exporters[key] = create(key)
+        return _exporters[key]
+
+
+def get_tracer(config: dict) -> Tracer:
+    """
+    Get a Tracer as specified in `iris` configuration
+    :param config: `iris` configuration
+    :returns: Tracer; disabled if no exporter is configured
+    """
+    return Tracer(get_exporter(config), config.get("trace_sample_rate", 1.0))
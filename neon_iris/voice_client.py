@@ -42,7 +42,6 @@ from ovos_utils.log import LOG
 from ovos_utils.xdg_utils import xdg_data_home
 from ovos_utils.sound import play_wav
 from ovos_bus_client.message import Message
-from neon_utils.file_utils import decode_base64_string_to_file
 from neon_iris.client import NeonAIClient
 
 
@@ -74,11 +73,8 @@ class NeonVoiceClient(NeonAIClient):
         self._voice_thread = None
 
         self._stt_audio_path = join(xdg_data_home(), "iris", "stt")
-        self._tts_audio_path = join(xdg_data_home(), "iris", "tts")
         if not isdir(self._stt_audio_path):
             makedirs(self._stt_audio_path)
-        if not isdir(self._tts_audio_path):
-            makedirs(self._tts_audio_path)
 
         self._listening_sound = join(dirname(__file__), "res",
                                      "start_listening.wav")
@@ -91,15 +87,17 @@ class NeonVoiceClient(NeonAIClient):
 
     def on_stt_audio(self, audio_bytes: bytes, context: dict):
         LOG.info(f"Got {len(audio_bytes)} bytes of audio")
-        wav_path = join(self._stt_audio_path, f"{time()}.wav")
-        with open(wav_path, "wb") as wav_io, \
-                wave.open(wav_io, "wb") as wav_file:
-            wav_file.setframerate(self._mic.sample_rate)
-            wav_file.setsampwidth(self._mic.sample_width)
-            wav_file.setnchannels(self._mic.sample_channels)
-            wav_file.writeframes(audio_bytes)
-
-        self.send_audio(wav_path)
+        with self.tracer.span("voice.stt_audio", None,
+                              {"bytes": len(audio_bytes)}):
+            wav_path = join(self._stt_audio_path, f"{time()}.wav")
+            with open(wav_path, "wb") as wav_io, \
+                    wave.open(wav_io, "wb") as wav_file:
+                wav_file.setframerate(self._mic.sample_rate)
+                wav_file.setsampwidth(self._mic.sample_width)
+                wav_file.setnchannels(self._mic.sample_channels)
+                wav_file.writeframes(audio_bytes)
+
+            self.send_audio(wav_path)
         LOG.debug("Sent Audio to MQ")
 
     def on_hotword_audio(self, audio: bytes, context: dict):
@@ -110,22 +108,26 @@ class NeonVoiceClient(NeonAIClient):
         # emit ww event
         self.bus.emit(Message(msg_type, payload, context))
 
+    def _register_default_handlers(self):
+        NeonAIClient._register_default_handlers(self)
+        # Audio playback blocks; keep it off of the MQ consumer thread
+        self.register_handler(self.handle_klat_response, "klat.response",
+                              threaded=True)
+
     def handle_klat_response(self, message: Message):
         responses = message.data.get('responses')
         for lang, data in responses.items():
             text = data.get('sentence')
             LOG.info(text)
-            file_basename = f"{hash(text)}.wav"
             genders = data.get('genders', [])
             for gender in genders:
                 audio_data = data["audio"].get(gender)
-                audio_file = join(self._tts_audio_path, lang, gender,
-                                  file_basename)
-                try:
-                    decode_base64_string_to_file(audio_data, audio_file)
-                except FileExistsError:
-                    pass
-                play_wav(audio_file)
+                with self.tracer.span("iris.audio_decode"):
+                    audio_file = self.audio_cache.put(
+                        lang, gender, text, audio_data,
+                        username=message.context.get("username"))
+                with self.tracer.span("iris.playback"):
+                    play_wav(audio_file)
 
     def handle_complete_intent_failure(self, message: Message):
         LOG.info(f"{message.data}")
@@ -0,0 +1,538 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Development System
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2024 Neongecko.com Inc.
+# BSD-3
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+
+from collections import deque
+from concurrent.futures import Executor
+from importlib.util import find_spec
+from os.path import basename, join, splitext
+from time import time
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, \
+    Set, Tuple
+
+import numpy as np
+
+from neon_iris.metrics import MetricsRegistry, REGISTRY
+
+# Audio is processed in 80ms chunks of 16kHz audio
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 1280
+# Samples preceding each chunk needed to compute its melspectrogram frames
+_MEL_CONTEXT = 480
+# Melspectrogram frames per embedding window
+_MEL_WINDOW = 76
+_MEL_FEATURES = 32
+# Max melspectrogram windows per embedding model call
+_EMBEDDING_BATCH = 8
+# Max embeddings kept per stream (~10s)
+_FEATURE_HISTORY = 120
+# Predictions are 0 for the first frames of a stream while features are
+# initialized
+_WARMUP_FRAMES = 5
+
+
+class AudioFrame(NamedTuple):
+    audio: bytes
+    sample_rate: Optional[int]
+    received: float
+
+
+class FrameQueue:
+    """
+    Bounded queue of audio frames received from one websocket connection,
+    awaiting wake word detection. Wake word detection only needs recent
+    audio, so when detection falls behind (i.e. under load), the oldest
+    frames are dropped instead of delaying detection of new audio.
+    """
+    def __init__(self, max_size: int = 4, max_age: float = 1.0,
+                 registry: MetricsRegistry = REGISTRY):
+        """
+        :param max_size: max frames to queue; when full, the oldest frame is
+            dropped to queue a new one
+        :param max_age: max seconds since a frame was received for it to be
+            processed; older frames are dropped. 0 to disable
+        :param registry: MetricsRegistry to count dropped frames in
+        """
+        self.max_size = max_size
+        self.max_age = max_age
+        self.dropped = 0
+        self.closed = False
+        self._frames: Deque[AudioFrame] = deque()
+        self._ready = asyncio.Event()
+        self._dropped_frames = registry.counter(
+            "iris_ww_frames_dropped_total",
+            "Audio frames dropped before wake word detection", ("reason",))
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def put(self, audio: bytes, sample_rate: Optional[int] = None):
+        """
+        Queue a frame without waiting. Frames are ignored once closed
+        :param audio: raw 16-bit PCM audio
+        :param sample_rate: sample rate of `audio`
+        """
+        if self.closed:
+            return
+        if len(self._frames) >= self.max_size:
+            self._frames.popleft()
+            self._drop("full")
+        self._frames.append(AudioFrame(audio, sample_rate, time()))
+        self._ready.set()
+
+    async def get(self) -> Optional[AudioFrame]:
+        """
+        Wait for the next frame that is not stale
+        :returns: AudioFrame, or None if the queue is closed
+        """
+        while not self.closed:
+            while self._frames:
+                frame = self._frames.popleft()
+                if self.max_age and time() - frame.received > self.max_age:
+                    self._drop("stale")
+                    continue
+                return frame
+            self._ready.clear()
+            await self._ready.wait()
+        return None
+
+    def close(self):
+        """
+        Discard queued frames and return None from `get` (i.e. when the
+        connection is closed)
+        """
+        self.closed = True
+        self._frames.clear()
+        self._ready.set()
+
+    def _drop(self, reason: str):
+        self.dropped += 1
+        self._dropped_frames.inc(reason=reason)
+
+
+def get_feature_model_paths() -> Tuple[str, str]:
+    """
+    Get paths to the melspectrogram and embedding models distributed with
+    openWakeWord, which are shared by all openWakeWord wake word models
+    :returns: melspectrogram model path, embedding model path
+    """
+    spec = find_spec("openwakeword")
+    if not spec or not spec.submodule_search_locations:
+        raise ImportError("openwakeword is required for wake word detection")
+    models = join(list(spec.submodule_search_locations)[0], "resources",
+                  "models")
+    return join(models, "melspectrogram.onnx"), \
+        join(models, "embedding_model.onnx")
+
+
+class WakeWordModel:
+    """
+    openWakeWord ONNX models, loaded once and shared by all streams. The
+    models are only read during inference, so one WakeWordModel may be used
+    from many threads. Streaming state (buffered audio, melspectrograms, and
+    embeddings) is kept separately for each stream in a WakeWordStream.
+    """
+    def __init__(self, wakeword_models: List[str],
+                 melspec_model: Optional[str] = None,
+                 embedding_model: Optional[str] = None):
+        """
+        :param wakeword_models: paths to openWakeWord `.onnx` models
+        :param melspec_model: path to the melspectrogram model; defaults to
+            the model distributed with openWakeWord
+        :param embedding_model: path to the embedding model; defaults to the
+            model distributed with openWakeWord
+        """
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = 1
+
+        def _load(path: str):
+            return ort.InferenceSession(path, sess_options=options,
+                                        providers=["CPUExecutionProvider"])
+
+        if not (melspec_model and embedding_model):
+            default_melspec, default_embedding = get_feature_model_paths()
+            melspec_model = melspec_model or default_melspec
+            embedding_model = embedding_model or default_embedding
+        self._melspec = _load(melspec_model)
+        self._embedding = _load(embedding_model)
+        # name: (session, input name, input feature frames, outputs)
+        self.models: Dict[str, tuple] = dict()
+        for path in wakeword_models:
+            session = _load(path)
+            model_input = session.get_inputs()[0]
+            self.models[splitext(basename(path))[0]] = (
+                session, model_input.name, model_input.shape[1],
+                session.get_outputs()[0].shape[1])
+        # Streams start with features computed from noise, as in openWakeWord
+        noise = np.random.RandomState(0).randint(
+            -1000, 1000, SAMPLE_RATE * 4).astype(np.float32)
+        melspec = self.get_melspectrogram(noise[None, :])[0]
+        windows = [melspec[i:i + _MEL_WINDOW]
+                   for i in range(0, melspec.shape[0] - _MEL_WINDOW + 1, 8)]
+        self.initial_features = self.get_embeddings(np.array(windows))
+        self.initial_melspectrogram = np.ones((_MEL_WINDOW, _MEL_FEATURES),
+                                              dtype=np.float32)
+
+    @property
+    def labels(self) -> List[str]:
+        """
+        Names of predictions returned for each frame
+        """
+        labels = list()
+        for name, (_, _, _, outputs) in self.models.items():
+            labels.extend([name] if outputs == 1 else
+                          [f"{name}_{i}" for i in range(outputs)])
+        return labels
+
+    def get_melspectrogram(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Compute melspectrograms for a batch of audio
+        :param audio: float32 array of 16-bit PCM samples with shape
+            (batch, samples)
+        :returns: array of shape (batch, frames, 32)
+        """
+        spec = self._melspec.run(None, {"input": audio})[0]
+        return (spec.reshape(audio.shape[0], -1, _MEL_FEATURES) / 10 + 2)\
+            .astype(np.float32)
+
+    def get_embeddings(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Compute embeddings for a batch of melspectrogram windows
+        :param windows: array of shape (batch, 76, 32)
+        :returns: array of shape (batch, 96)
+        """
+        windows = windows[..., None].astype(np.float32)
+        # The embedding model is compute bound, so large batches gain nothing
+        # over small ones and run slower as they exceed CPU caches
+        embeddings = [
+            self._embedding.run(
+                None, {"input_1": windows[i:i + _EMBEDDING_BATCH]})[0]
+            for i in range(0, windows.shape[0], _EMBEDDING_BATCH)]
+        return np.concatenate(embeddings).reshape(windows.shape[0], -1)
+
+    def classify(self, name: str, features: np.ndarray) -> np.ndarray:
+        """
+        Get wake word model scores for a batch of feature windows
+        :param name: name of the wake word model
+        :param features: array of shape (batch, input frames, 96)
+        :returns: array of shape (batch, outputs)
+        """
+        session, input_name, _, _ = self.models[name]
+        # Models are exported with a batch size of 1
+        return np.concatenate([session.run(None, {input_name: f[None, :]})[0]
+                               for f in features.astype(np.float32)])
+
+    def predict(self, stream: "WakeWordStream",
+                audio: np.ndarray) -> Dict[str, float]:
+        """
+        Add audio to a stream and get wake word scores for it
+        :param stream: WakeWordStream the audio is from
+        :param audio: array of 16kHz audio with 16-bit PCM sample values
+        :returns: dict of label to score between 0 and 1
+        """
+        return self.predict_batch([(stream, audio)])[0]
+
+    def predict_batch(self, frames: Sequence[Tuple["WakeWordStream",
+                                                   np.ndarray]]) -> \
+            List[Dict[str, float]]:
+        """
+        Add audio to multiple streams and get wake word scores for each. Each
+        model stage is run once for all chunks completed by the batch.
+        :param frames: list of (WakeWordStream, audio) to process, with at
+            most one frame per stream
+        :returns: list of predictions for each frame in `frames`
+        """
+        streams = [stream for stream, _ in frames]
+        if len(set(map(id, streams))) != len(streams):
+            raise ValueError("Batch contains multiple frames of one stream")
+        chunks = [stream.add_audio(audio) for stream, audio in frames]
+        counts = [c.shape[0] for c in chunks]
+        scores = [dict() for _ in frames]
+        if sum(counts):
+            # Streams with no complete chunks do not change until a later
+            # frame completes one
+            active = [idx for idx, count in enumerate(counts) if count]
+            splits = np.cumsum([counts[idx] for idx in active])[:-1]
+            melspec = np.split(self.get_melspectrogram(
+                np.concatenate([chunks[idx] for idx in active])), splits)
+            windows = list()
+            for idx, spec in zip(active, melspec):
+                streams[idx].add_melspectrogram(spec)
+                windows.append(
+                    streams[idx].get_melspectrogram_windows(counts[idx]))
+            embeddings = np.split(self.get_embeddings(
+                np.concatenate(windows)), splits)
+            for idx, stream_embeddings in zip(active, embeddings):
+                streams[idx].add_features(stream_embeddings)
+            for name, (_, _, model_frames, _) in self.models.items():
+                model_scores = np.split(self.classify(name, np.concatenate(
+                    [streams[idx].get_feature_windows(counts[idx],
+                                                      model_frames)
+                     for idx in active])), splits)
+                for idx, stream_scores in zip(active, model_scores):
+                    scores[idx][name] = stream_scores
+        return [stream.update_predictions(stream_scores)
+                for stream, stream_scores in zip(streams, scores)]
+
+    def create_stream(self) -> "WakeWordStream":
+        """
+        Create streaming state for a new audio stream
+        """
+        return WakeWordStream(self)
+
+
+class WakeWordStream:
+    """
+    Streaming state of wake word detection for one audio stream (i.e. one
+    websocket connection). Chunks of audio are processed in order; stages
+    that run models are performed by a WakeWordModel.
+    """
+    def __init__(self, model: WakeWordModel):
+        """
+        :param model: WakeWordModel this stream is processed with
+        """
+        self.labels = model.labels
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._context = np.zeros(_MEL_CONTEXT, dtype=np.float32)
+        self._melspec = model.initial_melspectrogram.copy()
+        self._features = model.initial_features.copy()
+        self._last_scores = {label: 0.0 for label in self.labels}
+        self._frames = 0
+        self._chunk_frames = 0
+
+    def add_audio(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Buffer audio and get complete chunks to compute melspectrograms for
+        :param audio: array of 16kHz audio with 16-bit PCM sample values
+        :returns: float32 array of shape (chunks, 1760) with each chunk and
+            the samples preceding it
+        """
+        audio = audio.astype(np.float32, copy=False)
+        if self._remainder.size:
+            audio = np.concatenate((self._remainder, audio))
+        n_chunks = audio.shape[0] // CHUNK_SAMPLES
+        self._remainder = audio[n_chunks * CHUNK_SAMPLES:].copy()
+        if not n_chunks:
+            return np.zeros((0, CHUNK_SAMPLES + _MEL_CONTEXT),
+                            dtype=np.float32)
+        samples = np.concatenate(
+            (self._context, audio[:n_chunks * CHUNK_SAMPLES]))
+        self._context = samples[-_MEL_CONTEXT:]
+        return np.stack([samples[i * CHUNK_SAMPLES:
+                                 (i + 1) * CHUNK_SAMPLES + _MEL_CONTEXT]
+                         for i in range(n_chunks)])
+
+    def add_melspectrogram(self, melspec: np.ndarray):
+        """
+        Add melspectrogram frames computed for chunks from `add_audio`
+        :param melspec: array of shape (chunks, frames, 32)
+        """
+        self._chunk_frames = melspec.shape[1]
+        self._melspec = np.concatenate(
+            (self._melspec, melspec.reshape(-1, _MEL_FEATURES)))
+        # Keep enough frames for an embedding window of each new chunk
+        keep = _MEL_WINDOW + melspec.shape[0] * melspec.shape[1]
+        self._melspec = self._melspec[-keep:]
+
+    def get_melspectrogram_windows(self, n_chunks: int) -> np.ndarray:
+        """
+        Get the melspectrogram window ending at each of the last `n_chunks`
+        chunks, to compute embeddings for
+        :returns: array of shape (n_chunks, 76, 32)
+        """
+        step = self._chunk_frames
+        end = self._melspec.shape[0]
+        return np.stack([self._melspec[end - i * step - _MEL_WINDOW:
+                                       end - i * step]
+                         for i in range(n_chunks - 1, -1, -1)])
+
+    def add_features(self, embeddings: np.ndarray):
+        """
+        Add embeddings computed for windows from `get_melspectrogram_windows`
+        :param embeddings: array of shape (chunks, 96)
+        """
+        self._features = np.concatenate(
+            (self._features, embeddings))[-_FEATURE_HISTORY:]
+
+    def get_feature_windows(self, n_chunks: int, frames: int) -> np.ndarray:
+        """
+        Get the feature window ending at each of the last `n_chunks` chunks,
+        to get wake word model scores for
+        :param n_chunks: number of chunks to get windows for
+        :param frames: input frames of the wake word model
+        :returns: array of shape (n_chunks, frames, 96)
+        """
+        end = self._features.shape[0]
+        return np.stack([self._features[end - i - frames:end - i]
+                         for i in range(n_chunks - 1, -1, -1)])
+
+    def update_predictions(self, scores: Dict[str, np.ndarray]) -> \
+            Dict[str, float]:
+        """
+        Get predictions for a frame of audio from model scores
+        :param scores: dict of model name to scores of shape
+            (chunks, outputs) for the chunks completed by the frame. Empty if
+            no chunks were completed, in which case the previous predictions
+            are returned
+        :returns: dict of label to score between 0 and 1
+        """
+        predictions = dict(self._last_scores)
+        for name, model_scores in scores.items():
+            # Report the highest score of the chunks in this frame
+            frame_scores = model_scores.max(axis=0)
+            if frame_scores.shape[0] == 1:
+                predictions[name] = float(frame_scores[0])
+            else:
+                for idx, score in enumerate(frame_scores):
+                    predictions[f"{name}_{idx}"] = float(score)
+        self._frames += 1
+        if self._frames <= _WARMUP_FRAMES:
+            predictions = {label: 0.0 for label in predictions}
+        self._last_scores = predictions
+        return predictions
+
+
+class WakeWordBatcher:
+    """
+    Schedules wake word detection for frames from many streams in batches.
+    Frames submitted within `max_delay` seconds of each other, or while a
+    previous batch is running, are processed with one call to each model
+    stage instead of one call per frame.
+    """
+    def __init__(self, model: WakeWordModel,
+                 executor: Optional[Executor] = None, max_batch: int = 64,
+                 max_delay: float = 0.005, max_concurrent: int = 1,
+                 registry: MetricsRegistry = REGISTRY):
+        """
+        :param model: WakeWordModel to run detection with
+        :param executor: Executor to run batches in; None for the event
+            loop's default executor
+        :param max_batch: max frames to process in one batch
+        :param max_delay: seconds to wait for more frames before running a
+            batch with less than `max_batch` frames
+        :param max_concurrent: max batches to run at once
+        :param registry: MetricsRegistry to record batch sizes in
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_concurrent = max_concurrent
+        self._executor = executor
+        self._pending: Deque[tuple] = deque()
+        self._busy: Set[int] = set()
+        self._running: Set[asyncio.Future] = set()
+        self._dispatcher: Optional[asyncio.Future] = None
+        self._batch_size = registry.histogram(
+            "iris_ww_batch_size", "Frames processed per wake word batch",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self._batch_seconds = registry.histogram(
+            "iris_ww_batch_seconds", "Time to process a wake word batch")
+
+    async def predict(self, stream: WakeWordStream,
+                      audio: np.ndarray) -> Dict[str, float]:
+        """
+        Add audio to a stream and get wake word scores for it, once the batch
+        including it has been processed. Frames of one stream are processed
+        in the order they are submitted.
+        :param stream: WakeWordStream the audio is from
+        :param audio: array of 16kHz audio with 16-bit PCM sample values
+        :returns: dict of label to score between 0 and 1
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((stream, audio, future))
+        if not self._dispatcher or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        return await future
+
+    async def _dispatch(self):
+        """
+        Run batches of pending frames until none are left
+        """
+        while self._pending:
+            if len(self._running) >= self.max_concurrent:
+                await asyncio.wait(self._running,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                continue
+            if len(self._pending) < self.max_batch and self.max_delay:
+                await asyncio.sleep(self.max_delay)
+            batch = self._get_batch()
+            if not batch:
+                # All pending frames were cancelled or are from streams in a
+                # running batch
+                if self._running:
+                    await asyncio.wait(self._running,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                continue
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _get_batch(self) -> List[tuple]:
+        """
+        Remove the next batch of frames from pending frames. Frames are
+        skipped if an earlier frame of the same stream is pending or running.
+        Streams in the returned batch are marked busy until it has run.
+        """
+        batch = list()
+        skipped = list()
+        streams = set(self._busy)
+        while self._pending and len(batch) < self.max_batch:
+            request = self._pending.popleft()
+            if id(request[0]) in streams:
+                skipped.append(request)
+                continue
+            streams.add(id(request[0]))
+            if not request[2].cancelled():
+                batch.append(request)
+        self._pending.extendleft(reversed(skipped))
+        self._busy.update(id(request[0]) for request in batch)
+        return batch
+
+    async def _run_batch(self, batch: List[tuple]):
+        """
+        Process a batch of frames and set the result of each frame
+        """
+        streams = {id(stream) for stream, _, _ in batch}
+        start = time()
+        try:
+            results = await asyncio.get_event_loop().run_in_executor(
+                self._executor, self.model.predict_batch,
+                [(stream, audio) for stream, audio, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._busy.difference_update(streams)
+            self._batch_size.observe(len(batch))
+            self._batch_seconds.observe(time() - start)
@@ -25,23 +25,23 @@
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from os import makedirs
-from os.path import isfile, join, isdir
+from os.path import join, isdir, splitext
 from time import time
 from typing import List, Dict, Tuple
 from uuid import uuid4
 
 import gradio
 
-from threading import Event
 from ovos_bus_client import Message
 from ovos_config import Configuration
 from ovos_utils import LOG
 from ovos_utils.json_helper import merge_dict
 
-from neon_utils.file_utils import decode_base64_string_to_file
 from ovos_utils.xdg_utils import xdg_data_home
 
 from neon_iris.client import NeonAIClient
+from neon_iris.futures import get_response_text, get_transcription
+from neon_iris.profiler import profiled
 
 
 class GradIOClient(NeonAIClient):
@@ -49,9 +49,6 @@ class GradIOClient(NeonAIClient):
         config = Configuration()
         self.config = config.get('iris') or dict()
         NeonAIClient.__init__(self, config.get("MQ"))
-        self._await_response = Event()
-        self._response = None
-        self._transcribed = None
         self._current_tts = dict()
         self._profiles: Dict[str, dict] = dict()
         self._audio_path = join(xdg_data_home(), "iris", "stt")
@@ -73,10 +70,29 @@ class GradIOClient(NeonAIClient):
         """
         return self.config.get('languages') or [self.default_lang]
 
+    def _get_language_choices(self) -> Tuple[List[str], List[str]]:
+        """
+        Get the languages users may select
+        @returns: list of input languages, list of response languages
+        """
+        return (self._languages.get("stt") or self.supported_languages,
+                self._languages.get("tts") or self.supported_languages)
+
+    def _update_language_choices(self) -> tuple:
+        """
+        Get updates for the language selection components with the current
+        supported languages
+        @returns: updates for input, response, and second response languages
+        """
+        stt_choices, tts_choices = self._get_language_choices()
+        return (gradio.Radio.update(choices=stt_choices),
+                gradio.Radio.update(choices=tts_choices),
+                gradio.Radio.update(choices=[None] + tts_choices))
+
     def _start_session(self):
         sid = uuid4().hex
         self._current_tts[sid] = None
-        self._profiles[sid] = self.user_config
+        self._profiles[sid] = self.user_config.to_dict()
         self._profiles[sid]['user']['username'] = sid
         return sid
 
@@ -110,11 +126,13 @@ class GradIOClient(NeonAIClient):
                           "user": {"first_name": first, "middle_name": middle,
                                    "last_name": last,
                                    "preferred_name": pref_name, "email": email}}
-        old_profile = self._profiles.get(session_id) or self.user_config
+        old_profile = self._profiles.get(session_id) or \
+            self.user_config.to_dict()
         self._profiles[session_id] = merge_dict(old_profile, profile_update)
         LOG.info(f"Updated profile for: {session_id}")
         return session_id
 
+    @profiled("gradio.on_user_input")
     def on_user_input(self, utterance: str,
                       chat_history: List[Tuple[str, str]],
                       audio_input: str,
@@ -124,43 +142,40 @@ class GradIOClient(NeonAIClient):
         @param utterance: String utterance submitted by the user
         @returns: Input box contents, Updated chat history, Gradio session ID, audio input, audio output
         """
-        input_time = time()
         LOG.debug("Input received")
-        if not self._await_response.wait(30):
-            LOG.error("Previous response not completed after 30 seconds")
-        in_queue = time() - input_time
-        self._await_response.clear()
-        self._response = None
-        self._transcribed = None
         gradio_id = client_session
         lang = self.get_lang(gradio_id)
-        if utterance:
-            LOG.info(f"Sending utterance: {utterance} with lang: {lang}")
-            self.send_utterance(utterance, lang, username=gradio_id,
-                                user_profiles=[self._profiles[gradio_id]],
-                                context={"gradio": {"session": gradio_id},
-                                         "timing": {"wait_in_queue": in_queue,
-                                                    "gradio_sent": time()}})
-        else:
-            LOG.info(f"Sending audio: {audio_input} with lang: {lang}")
-            self.send_audio(audio_input, lang, username=gradio_id,
-                            user_profiles=[self._profiles[gradio_id]],
-                            context={"gradio": {"session": gradio_id},
-                                     "timing": {"wait_in_queue": in_queue,
-                                                "gradio_sent": time()}})
-            chat_history.append(((audio_input, None), None))
-        if not self._await_response.wait(30):
-            LOG.error("No response received after 30s")
-            self._await_response.set()
-        self._response = self._response or "ERROR"
-        LOG.info(f"Got response={self._response}")
-        if utterance:
-            chat_history.append((utterance, self._response))
-        elif isinstance(self._transcribed, str):
-            LOG.info(f"Got transcript: {self._transcribed}")
-            chat_history.append((self._transcribed,  self._response))
-        chat_history.append((None, (self._current_tts[gradio_id], None)))
-        return chat_history, gradio_id, "", None, self._current_tts[gradio_id]
+        with self.tracer.span("gradio.user_input", None,
+                              {"session": gradio_id}):
+            if utterance:
+                LOG.info(f"Sending utterance: {utterance} with lang: {lang}")
+                future = self.send_utterance(
+                    utterance, lang, username=gradio_id,
+                    user_profiles=[self._profiles[gradio_id]],
+                    context={"gradio": {"session": gradio_id},
+                             "timing": {"gradio_sent": time()}})
+            else:
+                LOG.info(f"Sending audio: {audio_input} with lang: {lang}")
+                future = self.send_audio(
+                    audio_input, lang, username=gradio_id,
+                    user_profiles=[self._profiles[gradio_id]],
+                    context={"gradio": {"session": gradio_id},
+                             "timing": {"gradio_sent": time()}})
+                chat_history.append(((audio_input, None), None))
+            response = future.wait_for_response(30)
+            if not response:
+                LOG.error("No response received after 30s")
+            response_text = get_response_text(response)
+            LOG.info(f"Got response={response_text}")
+            if utterance:
+                chat_history.append((utterance, response_text))
+            else:
+                transcribed = get_transcription(future.responses)
+                if isinstance(transcribed, str):
+                    LOG.info(f"Got transcript: {transcribed}")
+                    chat_history.append((transcribed, response_text))
+            chat_history.append((None, (self._current_tts[gradio_id], None)))
+            return chat_history, gradio_id, "", None, self._current_tts[gradio_id]
 
     # def play_tts(self, session_id: str):
     #     LOG.info(f"Playing most recent TTS file {self._current_tts}")
@@ -170,7 +185,6 @@ class GradIOClient(NeonAIClient):
         """
         Blocking method to start the web server
         """
-        self._await_response.set()
         title = self.config.get("webui_title", "Neon AI")
         description = self.config.get("webui_description", "Chat With Neon")
         chatbot_label = self.config.get("webui_chatbot_label") or description
@@ -217,19 +231,20 @@ class GradIOClient(NeonAIClient):
             with gradio.Row():
                 with gradio.Column():
                     lang = self.get_lang(client_session.value).split('-')[0]
+                    stt_choices, tts_choices = self._get_language_choices()
                     stt_lang = gradio.Radio(label="Input Language",
-                                            choices=self._languages.get("stt")
-                                            or self.supported_languages,
+                                            choices=stt_choices,
                                             value=lang)
                     tts_lang = gradio.Radio(label="Response Language",
-                                            choices=self._languages.get("tts")
-                                            or self.supported_languages,
+                                            choices=tts_choices,
                                             value=lang)
                     tts_lang_2 = gradio.Radio(label="Second Response Language",
-                                              choices=[None] +
-                                              (self._languages.get("tts") or
-                                               self.supported_languages),
+                                              choices=[None] + tts_choices,
                                               value=None)
+                    # Supported languages may be received after the UI is
+                    # built; refresh choices whenever the page is loaded
+                    blocks.load(self._update_language_choices, None,
+                                [stt_lang, tts_lang, tts_lang_2])
                 with gradio.Column():
                     time_format = gradio.Radio(label="Time Format",
                                                choices=[12, 24],
@@ -271,22 +286,18 @@ class GradIOClient(NeonAIClient):
         LOG.debug(f"gradio context={message.context['gradio']}")
         resp_data = message.data["responses"]
         files = []
-        sentences = []
         session = message.context['gradio']['session']
         for lang, response in resp_data.items():
-            sentences.append(response.get("sentence"))
             if response.get("audio"):
                 for gender, data in response["audio"].items():
-                    filepath = "/".join([self.audio_cache_dir] +
-                                        response[gender].split('/')[-4:])
+                    with self.tracer.span("iris.audio_decode"):
+                        filepath = self.audio_cache.put(
+                            lang, gender, response.get("sentence"), data,
+                            splitext(response[gender])[1], session)
                     # TODO: This only plays the most recent, so it doesn't
                     #  support multiple languages or multi-utterance responses
                     self._current_tts[session] = filepath
                     files.append(filepath)
-                    if not isfile(filepath):
-                        decode_base64_string_to_file(data, filepath)
-        self._response = "\n".join(sentences)
-        self._await_response.set()
 
     def handle_complete_intent_failure(self, message: Message):
         """
@@ -294,8 +305,7 @@ class GradIOClient(NeonAIClient):
         indicates the Neon service is probably not yet ready.
         @param message: Neon intent failure response message
         """
-        self._response = "ERROR"
-        self._await_response.set()
+        LOG.warning(f"Intent failure for: {message.data.get('utterances')}")
 
     def handle_api_response(self, message: Message):
         """
@@ -304,8 +314,6 @@ class GradIOClient(NeonAIClient):
         @param message: Response message to something emitted by this client
         """
         LOG.debug(f"Got {message.msg_type}: {message.data}")
-        if message.msg_type == "neon.audio_input.response":
-            self._transcribed = message.data.get("transcripts", [""])[0]
 
     def _handle_profile_update(self, message: Message):
         updated_profile = message.data["profile"]
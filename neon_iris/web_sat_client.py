@@ -25,31 +25,40 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
 from os import makedirs
 from os.path import isdir, join
-from threading import Event
 from time import time
-from typing import Dict, Optional, Sequence
+from typing import Dict, List, MutableMapping, Optional, Sequence
 from uuid import uuid4
+from weakref import WeakValueDictionary
 
 import numpy as np
-import resampy
 from fastapi import APIRouter, FastAPI, Request, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from neon_utils.file_utils import decode_base64_string_to_file
-from openwakeword import Model
 from ovos_bus_client import Message
 from ovos_config import Configuration
 from ovos_utils import LOG
 from ovos_utils.xdg_utils import xdg_data_home
 
-from neon_iris.client import NeonAIClient
+from neon_iris.async_client import AsyncNeonAIClient
+from neon_iris.futures import ResponseFuture, get_response_text, \
+    get_transcription
+from neon_iris.metrics import REGISTRY
 from neon_iris.models.web_sat import UserInput, UserInputResponse
+from neon_iris.profiler import PROFILER, profiled
+from neon_iris.resample import StreamResampler
+from neon_iris.wakeword import AudioFrame, FrameQueue, SAMPLE_RATE, \
+    WakeWordBatcher, WakeWordModel, WakeWordStream
+from neon_iris.serialization import audio_to_b64
 
 
-class WebSatNeonClient(NeonAIClient):
+class WebSatNeonClient(AsyncNeonAIClient):
     """Neon AI Web UI and Voice Satellite client."""
 
     def __init__(self, lang: str = ""):
@@ -60,12 +69,12 @@ class WebSatNeonClient(NeonAIClient):
             raise ValueError(
                 "Missing MQ configuration, please set it in ~/.config/neon/neon.yaml"
             )
-        NeonAIClient.__init__(self, self.mq_config)
+        AsyncNeonAIClient.__init__(self, self.mq_config)
         self.router = APIRouter()
-        self._await_response = Event()
-        self._response = None
-        self._transcribed = None
-        self._current_tts = dict()
+        # Requests are handled in order within a session and concurrently
+        # across sessions. Locks are removed once no request holds them.
+        self._session_locks: MutableMapping[str, asyncio.Lock] = \
+            WeakValueDictionary()
         self._profiles: Dict[str, dict] = dict()
         self._audio_path = join(
             xdg_data_home(), "iris", "stt"
@@ -77,10 +86,19 @@ class WebSatNeonClient(NeonAIClient):
         LOG.init(self.config.get("logs"))
         # OpenWW
         # TODO: Allow for arbitrary models, or pre-existing OpenWW models
-        self.oww_model = Model(
-            wakeword_models=["neon_iris/wakeword_models/hey_neon/hey_neon_high.tflite"],
-            inference_framework="tflite",
-        )
+        self.ww_model = WakeWordModel(
+            ["neon_iris/wakeword_models/hey_neon/hey_neon_high.onnx"])
+        # Model weights are shared and streaming state is kept per
+        # connection, so frames from different connections may be processed
+        # together in batches, off of the event loop
+        ww_workers = self.config.get("ww_workers", 2)
+        self._ww_executor = ThreadPoolExecutor(max_workers=ww_workers,
+                                               thread_name_prefix="iris_ww")
+        self.ww_batcher = WakeWordBatcher(
+            self.ww_model, self._ww_executor,
+            max_batch=self.config.get("ww_batch_size", 64),
+            max_delay=self.config.get("ww_batch_delay", 0.005),
+            max_concurrent=ww_workers)
         # FastAPI
         self.templates = Jinja2Templates(directory="neon_iris/templates")
         self.build_routes()
@@ -98,35 +116,23 @@ class WebSatNeonClient(NeonAIClient):
         @param message: Response message to something emitted by this client
         """
         LOG.debug(f"Got {message.msg_type}: {message.data}")
-        if message.msg_type == "neon.audio_input.response":
-            self._transcribed = message.data.get("transcripts", [""])[0]
 
     def handle_klat_response(self, message: Message):
         """
-        Handle a valid response from Neon. This includes text and base64-encoded
-        audio in all requested languages.
+        Handle a valid response from Neon. Responses are returned to the
+        requesting session by `wait_for_response`.
         @param message: Neon response message
         """
         LOG.debug(f"gradio context={message.context['gradio']}")
-        resp_data = message.data["responses"]
-        sentences = []
-        session = message.context["gradio"]["session"]
-        for _, response in resp_data.items():  # lang, response
-            sentences.append(response.get("sentence"))
-            if response.get("audio"):
-                for _, data in response["audio"].items():
-                    self._current_tts[session] = data
-        self._response = "\n".join(sentences)
-        self._await_response.set()
-
-    def send_audio( # pylint: disable=arguments-renamed
+
+    async def send_audio( # pylint: disable=arguments-renamed
         self,
         audio_b64_string: str,
         lang: str = "en-us",
         username: Optional[str] = None,
         user_profiles: Optional[list] = None,
         context: Optional[dict] = None,
-    ):
+    ) -> ResponseFuture:
         """
         Optionally override this to queue audio inputs or do any pre-parsing
         :param audio_file: path to audio file to send to speech module
@@ -134,12 +140,15 @@ class WebSatNeonClient(NeonAIClient):
         :param username: username associated with request
         :param user_profiles: user profiles expecting a response
         :param context: Optional dict context to add to emitted message
+        :returns: ResponseFuture resolved with the response to this request
         """
-        audio_path = decode_base64_string_to_file(
+        audio_path = await self._run_in_publisher(
+            decode_base64_string_to_file,
             audio_b64_string,
             join(f"{self._audio_path}/{time()}.wav"),
         )
-        self._send_audio(
+        return await AsyncNeonAIClient.send_audio(
+            self,
             audio_file=audio_path,
             lang=lang,
             username=username,
@@ -160,10 +169,106 @@ class WebSatNeonClient(NeonAIClient):
             raise TypeError("Expected a list of languages in the configuration")
         return languages
 
+    @staticmethod
+    def _get_tts_audio(message: Optional[Message]) -> Optional[str]:
+        """
+        Get TTS audio from the response to a user input
+        @param message: final response to a user input, if one was received
+        @returns: base64-encoded audio of the last response, if any
+        """
+        audio = None
+        if message and message.msg_type == "klat.response":
+            for response in message.data["responses"].values():
+                for data in (response.get("audio") or {}).values():
+                    audio = audio_to_b64(data)
+        return audio
+
+    async def _detect_wakeword(self, websocket: WebSocket,
+                               frames: FrameQueue, stream: WakeWordStream):
+        """
+        Run wake word detection on frames received from a websocket and send
+        activations back to the browser client
+        @param websocket: connection frames are received from
+        @param frames: FrameQueue of frames received from `websocket`
+        @param stream: WakeWordStream with detection state of `websocket`
+        """
+        resampler = None
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            try:
+                if not frame.sample_rate or frame.sample_rate == SAMPLE_RATE:
+                    resampler = None
+                elif not resampler or resampler.src_rate != frame.sample_rate:
+                    # Resampling state is kept for the connection so audio
+                    # is continuous across frames
+                    resampler = StreamResampler(frame.sample_rate,
+                                                SAMPLE_RATE)
+                activations = await self._predict_frame(frame, stream,
+                                                        resampler)
+                if activations:
+                    await websocket.send_text(
+                        json.dumps({"activations": activations})
+                    )
+            except Exception as e:
+                LOG.error(f"Wake word detection failed: {e}")
+
+    async def _predict_frame(self, frame: AudioFrame, stream: WakeWordStream,
+                             resampler: Optional[StreamResampler] = None) \
+            -> List[str]:
+        """
+        Get wake word activations for a frame of audio. Detection is run on
+        worker threads, batched across connections.
+        @param frame: AudioFrame received from a browser client
+        @param stream: WakeWordStream the frame belongs to
+        @param resampler: StreamResampler for the frame's sample rate, if it
+            is not 16kHz
+        @returns: list of activated wake word models
+        """
+        audio_bytes = frame.audio
+        with PROFILER.timer("websat.ww_frame"), \
+                self.tracer.span("websat.ww_frame", None, {
+                    "bytes": len(audio_bytes),
+                    "sample_rate": frame.sample_rate}) as span:
+            # Add extra bytes of silence if needed
+            if len(audio_bytes) % 2 == 1:
+                audio_bytes += b"\x00"
+
+            # Convert audio to correct format and sample rate
+            audio_data = np.frombuffer(audio_bytes, dtype=np.int16)
+            if resampler:
+                audio_data = resampler.process(audio_data)
+
+            # Get openWakeWord predictions
+            predictions = await self.ww_batcher.predict(stream, audio_data)
+
+            activations = [
+                key for key, value in predictions.items() if value >= 0.5
+            ]
+            span.set_attribute("activations", len(activations))
+            span.set_attribute("queue_seconds", time() - frame.received)
+        return activations
+
+    def shutdown(self):
+        AsyncNeonAIClient.shutdown(self)
+        self._ww_executor.shutdown(wait=False)
+
+    def _get_session_lock(self, session_id: str) -> asyncio.Lock:
+        """
+        Get the lock that orders requests within a session
+        @param session_id: session to get the lock for
+        @returns: asyncio.Lock shared by concurrent requests in the session
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+
     def _start_session(self):
         sid = uuid4().hex
-        self._current_tts[sid] = None
-        self._profiles[sid] = self.user_config
+        self._profiles[sid] = self.user_config.to_dict()
         self._profiles[sid]["user"]["username"] = sid
         return sid
 
@@ -187,54 +292,50 @@ class WebSatNeonClient(NeonAIClient):
             }
             return self.templates.TemplateResponse("index.html", context)
 
+        @self.router.get("/metrics", response_class=PlainTextResponse)
+        async def metrics():
+            """Export client metrics in Prometheus text format."""
+            return PlainTextResponse(REGISTRY.to_prometheus(),
+                                     media_type="text/plain; version=0.0.4")
+
         @self.router.websocket("/ws")
         async def websocket_endpoint(websocket: WebSocket):
             """Handles websocket connections to OpenWakeWord, which runs as part of this service."""
             await websocket.accept()
             # Send loaded models
             await websocket.send_text(
-                json.dumps({"loaded_models": list(self.oww_model.models.keys())})
+                json.dumps({"loaded_models": list(self.ww_model.models.keys())})
             )
+            frames = FrameQueue(self.config.get("ww_queue_size", 4),
+                                self.config.get("ww_max_frame_age", 1.0))
+            # Detection state is only referenced by this connection and is
+            # released when it disconnects
+            stream = self.ww_model.create_stream()
+            detector = asyncio.ensure_future(
+                self._detect_wakeword(websocket, frames, stream))
             sample_rate = None
 
-            while True:
-                message = await websocket.receive()
+            try:
+                while True:
+                    message = await websocket.receive()
 
-                if message["type"] == "websocket.disconnect":
-                    break
+                    if message["type"] == "websocket.disconnect":
+                        break
 
-                if message["type"] == "websocket.receive":
-                    if "text" in message:
-                        # Process text message
-                        sample_rate = int(message["text"])
-                    elif "bytes" in message:
-                        # Process bytes message
-                        audio_bytes = message["bytes"]
-
-                        # Add extra bytes of silence if needed
-                        if len(audio_bytes) % 2 == 1:
-                            audio_bytes += b"\x00"
-
-                        # Convert audio to correct format and sample rate
-                        audio_data = np.frombuffer(audio_bytes, dtype=np.int16)
-                        if sample_rate and sample_rate != 16000:
-                            audio_data = resampy.resample(
-                                audio_data, sample_rate, 16000
-                            )
-
-                        # Get openWakeWord predictions and send to browser client
-                        predictions = self.oww_model.predict(audio_data)
-
-                        activations = [
-                            key for key, value in predictions.items() if value >= 0.5
-                        ]
-
-                        if activations:
-                            await websocket.send_text(
-                                json.dumps({"activations": activations})
-                            )
+                    if message["type"] == "websocket.receive":
+                        if "text" in message:
+                            # Process text message
+                            sample_rate = int(message["text"])
+                        elif "bytes" in message:
+                            # Queue audio for wake word detection without
+                            # blocking the event loop
+                            frames.put(message["bytes"], sample_rate)
+            finally:
+                frames.close()
+                await detector
 
         @self.router.post("/user_input")
+        @profiled("websat.on_user_input")
         async def on_user_input_worker(
             req: UserInput,
         ):
@@ -250,60 +351,61 @@ class WebSatNeonClient(NeonAIClient):
             chat_history = []
             input_time = time()
             LOG.debug("Input received")
-            if not self._profiles.get("session_id"):
+            if session_id not in self._profiles:
                 self._profiles[session_id] = {
                     "speech": {"stt_language": self.default_lang}
                 }
-                self._current_tts[session_id] = None
-            if not self._await_response.wait(30):
-                LOG.error("Previous response not completed after 30 seconds")
-            in_queue = time() - input_time
-            self._await_response.clear()
-            self._response = None
-            self._transcribed = None
-            lang = self.get_lang(session_id)
-            if utterance:
-                LOG.info(f"Sending utterance: {utterance} with lang: {lang}")
-                self.send_utterance(
-                    utterance,
-                    lang or "en-us",
-                    username=session_id,
-                    user_profiles=[self._profiles[session_id]],
-                    context={
-                        "gradio": {"session": session_id},
-                        "timing": {"wait_in_queue": in_queue, "gradio_sent": time()},
-                    },
-                )
-            else:
-                LOG.info(f"Sending audio with length of {len(audio_input)} with lang: {lang}")
-                self.send_audio(
-                    audio_input,
-                    lang or "en-us",
-                    username=session_id,
-                    user_profiles=[self._profiles[session_id]],
-                    context={
-                        "gradio": {"session": session_id},
-                        "timing": {"wait_in_queue": in_queue, "gradio_sent": time()},
-                    },
-                )
-                chat_history.append(((audio_input, None), None))
-            if not self._await_response.wait(30):
-                LOG.error("No response received after 30s")
-                self._await_response.set()
-            self._response = self._response or "ERROR"
-            LOG.info(f"Got response={self._response}")
+            with self.tracer.span("websat.user_input", None,
+                                  {"session": session_id}):
+                async with self._get_session_lock(session_id):
+                    in_queue = time() - input_time
+                    self.tracer.record_span("websat.queue", input_time,
+                                            input_time + in_queue)
+                    lang = self.get_lang(session_id)
+                    if utterance:
+                        LOG.info(f"Sending utterance: {utterance} with lang: {lang}")
+                        future = await self.send_utterance(
+                            utterance,
+                            lang or "en-us",
+                            username=session_id,
+                            user_profiles=[self._profiles[session_id]],
+                            context={
+                                "gradio": {"session": session_id},
+                                "timing": {"wait_in_queue": in_queue, "gradio_sent": time()},
+                            },
+                        )
+                    else:
+                        LOG.info(f"Sending audio with length of {len(audio_input)} with lang: {lang}")
+                        future = await self.send_audio(
+                            audio_input,
+                            lang or "en-us",
+                            username=session_id,
+                            user_profiles=[self._profiles[session_id]],
+                            context={
+                                "gradio": {"session": session_id},
+                                "timing": {"wait_in_queue": in_queue, "gradio_sent": time()},
+                            },
+                        )
+                        chat_history.append(((audio_input, None), None))
+                    message = await self.wait_for_response(future, 30)
+                    if not message:
+                        LOG.error("No response received after 30s")
+                    response = get_response_text(message)
+                    transcribed = get_transcription(future.responses)
+                    audio_output = self._get_tts_audio(message)
+            LOG.info(f"Got response={response}")
             if utterance:
-                chat_history.append((utterance, self._response))
-            elif isinstance(self._transcribed, str):
-                LOG.info(f"Got transcript: {self._transcribed}")
-                chat_history.append((self._transcribed, self._response))
-                utterance = self._transcribed
+                chat_history.append((utterance, response))
+            elif isinstance(transcribed, str):
+                LOG.info(f"Got transcript: {transcribed}")
+                chat_history.append((transcribed, response))
+                utterance = transcribed
             resp = UserInputResponse(
                 **{
                     "utterance": utterance,
-                    "audio_output": self._current_tts[session_id],
+                    "audio_output": audio_output,
                     "session_id": session_id,
-                    "transcription": self._response,
+                    "transcription": response,
                 }
             )
             return resp
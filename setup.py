@@ -72,7 +72,8 @@ setuptools.setup(
     ],
     python_requires='>=3.7',
     install_requires=get_requirements("requirements.txt"),
-    extras_require={"gradio": get_requirements("gradio.txt"), "web_sat": get_requirements("web_sat.txt")},
+    extras_require={"gradio": get_requirements("gradio.txt"), "web_sat": get_requirements("web_sat.txt"),
+                    "msgpack": get_requirements("msgpack.txt")},
     entry_points={
         'console_scripts': ['iris=neon_iris.cli:neon_iris_cli']
     },
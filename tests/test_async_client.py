@@ -0,0 +1,119 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+from contextlib import ExitStack
+from tempfile import mkdtemp
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.async_client import AsyncNeonAIClient
+from neon_iris.futures import get_message_id
+from neon_iris.testing.fake_mq import FakeNeonCore, fake_mq_connection
+
+
+class _TestClient(AsyncNeonAIClient):
+    def __init__(self, *args, **kwargs):
+        self.handled = list()
+        AsyncNeonAIClient.__init__(self, *args, **kwargs)
+
+    async def handle_klat_response(self, message):
+        await asyncio.sleep(0.01)
+        self.handled.append(get_message_id(message))
+
+
+class TestAsyncNeonAIClient(unittest.TestCase):
+    def setUp(self):
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        broker = stack.enter_context(fake_mq_connection())
+        stack.enter_context(FakeNeonCore(
+            broker, latency={"recognizer_loop:utterance": 0.1}))
+        with patch("neon_iris.client.Configuration",
+                   Mock(return_value={"iris": {}})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=mkdtemp())):
+            self.client = _TestClient({"server": "localhost"}, mkdtemp())
+        self.addCleanup(self.client.shutdown)
+
+    def test_concurrent_requests(self):
+        async def _request(utterance):
+            future = await self.client.send_utterance(utterance)
+            return future, await self.client.wait_for_response(future, 5)
+
+        async def _run():
+            return await asyncio.gather(*(_request(str(i))
+                                          for i in range(10)))
+
+        results = asyncio.run(_run())
+        for i, (future, response) in enumerate(results):
+            self.assertEqual(get_message_id(response), future.message_id)
+            self.assertEqual(
+                response.data["responses"]["en-us"]["sentence"],
+                f"You said {i}")
+        # Coroutine handlers complete before responses are returned
+        self.assertEqual(sorted(self.client.handled),
+                         sorted(f.message_id for f, _ in results))
+        self.assertEqual(len(self.client._pending), 0)
+
+    def test_timeout(self):
+        timeouts = self.client._metrics.timeouts.get()
+
+        async def _run():
+            future = await self.client.send_utterance("hello")
+            self.assertIn(future.message_id, self.client._pending)
+            return future, await self.client.wait_for_response(future, 0.01)
+
+        future, response = asyncio.run(_run())
+        self.assertIsNone(response)
+        self.assertNotIn(future.message_id, self.client._pending)
+        self.assertEqual(self.client._metrics.timeouts.get(), timeouts + 1)
+
+    def test_cancel(self):
+        async def _run():
+            future = await self.client.send_utterance("hello")
+            task = asyncio.create_task(
+                self.client.wait_for_response(future, 5))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return future
+
+        future = asyncio.run(_run())
+        self.assertTrue(future.cancelled())
+        self.assertNotIn(future.message_id, self.client._pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+from base64 import b64encode
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.audio_cache import AudioCache
+
+
+class TestAudioCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+
+    def test_put_get(self):
+        cache = AudioCache(self.cache_dir)
+        self.assertIsNone(cache.get("en-us", "female", "hello"))
+        audio = b"RIFF" + bytes(100)
+        path = cache.put("en-us", "female", "hello",
+                         b64encode(audio).decode(), ".wav", "user")
+        self.assertTrue(path.endswith(".wav"))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), audio)
+        self.assertEqual(cache.size, len(audio))
+        self.assertEqual(cache.get("en-us", "female", "hello"), path)
+        self.assertIsNone(cache.get("en-us", "male", "hello"))
+
+        # Cached audio is not decoded again
+        with patch("neon_iris.audio_cache.audio_to_bytes") as decode:
+            self.assertEqual(cache.put("en-us", "female", "hello", "invalid"),
+                             path)
+            decode.assert_not_called()
+
+        # Index is restored
+        cache = AudioCache(self.cache_dir)
+        self.assertEqual(cache.get("en-us", "female", "hello"), path)
+        self.assertEqual(cache.size, len(audio))
+
+        # Removed files are not returned
+        os.remove(path)
+        self.assertIsNone(cache.get("en-us", "female", "hello"))
+        self.assertEqual(cache.size, 0)
+
+    def test_lru_eviction(self):
+        cache = AudioCache(self.cache_dir, max_bytes=250)
+        first = cache.put("en-us", "female", "one", bytes(100))
+        second = cache.put("en-us", "female", "two", bytes(100))
+        self.assertEqual(cache.get("en-us", "female", "one"), first)
+        third = cache.put("en-us", "female", "three", bytes(100))
+        self.assertEqual(cache.size, 200)
+        self.assertFalse(os.path.isfile(second))
+        self.assertIsNone(cache.get("en-us", "female", "two"))
+        self.assertTrue(os.path.isfile(first))
+        self.assertTrue(os.path.isfile(third))
+
+        # Budget is applied to an existing cache
+        cache = AudioCache(self.cache_dir, max_bytes=100)
+        self.assertEqual(cache.size, 100)
+        self.assertIsNone(cache.get("en-us", "female", "one"))
+        self.assertEqual(cache.get("en-us", "female", "three"), third)
+
+    def test_clear(self):
+        cache = AudioCache(self.cache_dir)
+        shared = cache.put("en-us", "female", "shared", bytes(10), ".wav",
+                           "user_1")
+        cache.put("en-us", "female", "shared", bytes(10), ".wav", "user_2")
+        private = cache.put("en-us", "female", "private", bytes(10), ".wav",
+                            "user_1")
+        other = cache.put("en-us", "female", "other", bytes(10), ".wav",
+                          "user_2")
+        cache.clear("user_1")
+        self.assertTrue(os.path.isfile(shared))
+        self.assertFalse(os.path.isfile(private))
+        self.assertTrue(os.path.isfile(other))
+        cache.clear("user_2")
+        self.assertFalse(os.path.isfile(shared))
+        self.assertFalse(os.path.isfile(other))
+
+        cache.put("en-us", "female", "text", bytes(10))
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(os.listdir(self.cache_dir), [AudioCache.index_file])
+
+
+if __name__ == '__main__':
+    unittest.main()
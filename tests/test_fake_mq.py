@@ -0,0 +1,342 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+from tempfile import mkdtemp
+from threading import Event
+from time import time
+from unittest.mock import Mock, patch
+
+import pika
+
+from pika.exceptions import ChannelClosedByBroker
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.client import NeonAIClient
+from neon_iris.testing.fake_mq import FakeConnection, FakeMQBroker, \
+    FakeNeonCore, fake_mq_connection
+from neon_iris.mq_connection import MQConnectionHub
+
+
+class TestFakeMQBroker(unittest.TestCase):
+    def test_publish_consume(self):
+        broker = FakeMQBroker()
+        connection = FakeConnection(broker.get_connection_params("/test"))
+        channel = connection.channel()
+        with self.assertRaises(ChannelClosedByBroker):
+            channel.queue_declare("test_queue", passive=True)
+        self.assertFalse(channel.is_open)
+
+        channel = connection.channel()
+        channel.queue_declare("test_queue")
+        channel.basic_publish('', "test_queue", b"one")
+        channel.basic_publish('', "test_queue", b"two")
+        self.assertEqual(channel.queue_declare(
+            "test_queue", passive=True).method.message_count, 2)
+        self.assertEqual(broker.message_count("/other", "test_queue"), 0)
+
+        received = list()
+
+        def _on_message(ch, method, _, body):
+            received.append((body, method.redelivered))
+            if body == b"one" and not method.redelivered:
+                ch.basic_nack(delivery_tag=method.delivery_tag)
+            else:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            if len(received) == 3:
+                ch.stop_consuming()
+
+        channel.basic_consume("test_queue", _on_message)
+        # Deliveries are handled on the thread consuming the connection
+        self.assertEqual(received, [])
+        channel.start_consuming()
+        self.assertEqual(received, [(b"one", False), (b"two", False),
+                                    (b"one", True)])
+        self.assertEqual(broker.message_count("/test", "test_queue"), 0)
+
+        # Unacknowledged messages are requeued when the channel closes
+        channel.basic_publish('', "test_queue", b"three")
+        consumer = connection.channel()
+        consumer.basic_consume("test_queue", lambda *_: consumer.close())
+        connection.process_data_events()
+        self.assertEqual(broker.message_count("/test", "test_queue"), 1)
+
+    def test_publisher_confirms(self):
+        broker = FakeMQBroker()
+        connection = FakeConnection(broker.get_connection_params())
+        confirms = list()
+        selected = Event()
+        channel = connection.channel()
+        channel._impl.confirm_delivery(confirms.append,
+                                       lambda _: selected.set())
+        connection.process_data_events()
+        self.assertTrue(selected.is_set())
+        channel._impl.basic_publish('', "test_queue", b"test",
+                                    pika.BasicProperties())
+        connection.process_data_events()
+        self.assertEqual(confirms[0].method.delivery_tag, 1)
+        self.assertEqual(broker.message_count("/", "test_queue"), 1)
+
+    def test_send_mq_request(self):
+        broker = FakeMQBroker()
+        with FakeNeonCore(broker):
+            response = broker.send_mq_request(
+                "/neon_chat_api", {"msg_type": "neon.get_stt", "data": {},
+                                   "context": {}},
+                "neon_chat_api_request", timeout=5)
+        self.assertEqual(response["msg_type"], "neon.get_stt.response")
+        self.assertEqual(response["data"]["transcripts"], ["what time is it"])
+
+
+class TestFakeNeonCore(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.config_dir = mkdtemp()
+
+    def _get_client(self, iris_config: dict = None,
+                    hub: MQConnectionHub = None) -> NeonAIClient:
+        with patch("neon_iris.client.Configuration",
+                   Mock(return_value={"iris": iris_config or dict()})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=self.cache_dir)):
+            client = NeonAIClient({"server": "localhost"}, self.config_dir,
+                                  hub)
+        self.addCleanup(client.shutdown)
+        return client
+
+    def test_client_requests(self):
+        with fake_mq_connection() as broker, \
+                FakeNeonCore(broker, genders=("female", "male")) as core:
+            client = self._get_client()
+            response = client.send_utterance("hello").wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.response")
+            en_response = response.data["responses"]["en-us"]
+            self.assertEqual(en_response["sentence"], "You said hello")
+            self.assertEqual(set(en_response["audio"]), {"female", "male"})
+
+            audio_file = os.path.join(self.cache_dir, "test.wav")
+            with open(audio_file, "wb") as f:
+                f.write(core.tts_audio)
+            future = client.send_audio(audio_file)
+            response = future.wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.response")
+            self.assertEqual([m.msg_type for m in future.responses],
+                             ["neon.audio_input.response", "klat.response"])
+            self.assertEqual(core.received["recognizer_loop:utterance"], 1)
+            self.assertEqual(core.received["neon.audio_input"], 1)
+
+            # Unhandled requests are answered on the error queue
+            message = client._build_message("neon.unknown", {})
+            response = client._send_message(message).wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.error")
+
+            futures = client.send_utterances(["one", "two", "three"])
+            self.assertTrue(all(f.accepted for f in futures))
+            responses = [f.wait_for_response(5) for f in futures]
+            self.assertEqual([r.data["responses"]["en-us"]["sentence"]
+                              for r in responses],
+                             ["You said one", "You said two",
+                              "You said three"])
+            self.assertEqual(client.get_queue_depths(),
+                             {"request": 0, "response": 0})
+
+    def test_languages_and_latency(self):
+        with fake_mq_connection() as broker, \
+                FakeNeonCore(broker, latency={"neon.languages.get": 0.2},
+                             languages=["uk-ua", "en-us"]):
+            start = time()
+            client = self._get_client({"enable_lang_api": True})
+            self.assertTrue(client._language_init.wait(5))
+            self.assertGreaterEqual(time() - start, 0.2)
+            self.assertEqual(client._languages["stt"], ["en-us", "uk-ua"])
+
+    def test_hub(self):
+        with fake_mq_connection() as broker, FakeNeonCore(broker):
+            hub = MQConnectionHub({"server": "localhost"})
+            self.addCleanup(hub.shutdown)
+            self.assertTrue(hub.wait_for_connection(5))
+            clients = [self._get_client(hub=hub) for _ in range(3)]
+            futures = [c.send_utterance(c.uid) for c in clients]
+            for client, future in zip(clients, futures):
+                response = future.wait_for_response(5)
+                self.assertEqual(
+                    response.data["responses"]["en-us"]["sentence"],
+                    f"You said {client.uid}")
+
+    def test_error_routing(self):
+        with fake_mq_connection() as broker, FakeNeonCore(broker):
+            self._check_error_routing(broker)
+
+    def test_error_routing_without_header(self):
+        from neon_iris import mq_connection
+        get_error_routing_key = mq_connection.get_error_routing_key
+        forwarded = list()
+
+        def _get_error_routing_key(properties, body):
+            routing_key = get_error_routing_key(properties, body)
+            forwarded.append(routing_key)
+            return routing_key
+
+        with fake_mq_connection() as broker, FakeNeonCore(broker) as core, \
+                patch("neon_iris.mq_connection.get_error_routing_key",
+                      _get_error_routing_key):
+            publish = core._publish
+
+            def _publish(queue, response, codec, headers=None):
+                # Neon Core does not set a `routing_key` header on errors, so
+                # clients must find the routing key in the message body
+                if queue == core.error_queue:
+                    headers = None
+                publish(queue, response, codec, headers)
+
+            core._publish = _publish
+            clients = self._check_error_routing(broker)
+        # Errors for other clients were decoded to find their owner
+        self.assertTrue(forwarded)
+        self.assertTrue(set(forwarded) <= {c.uid for c in clients})
+
+    def _check_error_routing(self, broker) -> list:
+        """
+        Send unhandled requests from several clients and check that every
+        error response reaches the client that sent the request
+        :param broker: FakeMQBroker the clients connect to
+        :returns: list of clients that sent requests
+        """
+        hub = MQConnectionHub({"server": "localhost"})
+        self.addCleanup(hub.shutdown)
+        self.assertTrue(hub.wait_for_connection(5))
+        # Clients with their own connection and clients sharing a hub
+        # all consume the shared error queue
+        clients = [self._get_client() for _ in range(3)] + \
+            [self._get_client(hub=hub) for _ in range(2)]
+        for client in clients:
+            client.handle_error_response = Mock()
+        futures = list()
+        for client in clients:
+            for _ in range(5):
+                message = client._build_message("neon.unknown", {})
+                futures.append((client, client._send_message(message)))
+        for client, future in futures:
+            response = future.wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.error")
+            self.assertEqual(response.context["routing_key"],
+                             client.uid)
+        for client in clients:
+            self.assertEqual(client.handle_error_response.call_count, 5)
+        self.assertEqual(broker.message_count("/neon_chat_api",
+                                              "neon_chat_api_error"), 0)
+        return clients
+
+    def test_profile_by_reference(self):
+        with fake_mq_connection() as broker, FakeNeonCore(broker) as core:
+            contexts = list()
+            cached = set()
+            respond_utterance = core.responders["recognizer_loop:utterance"]
+
+            def _respond(request):
+                # Request profiles that are referenced but not cached
+                context = request["context"]
+                contexts.append(context)
+                cached.update(p["user"]["username"]
+                              for p in context["user_profiles"])
+                if any(ref["username"] not in cached
+                       for ref in context["user_profile_refs"]):
+                    return [("neon.profile.request", {})]
+                return respond_utterance(request)
+
+            core.responders["recognizer_loop:utterance"] = _respond
+            client = self._get_client({"profile_by_reference": True})
+            username = client.user_config["user"]["username"]
+            ref = {"username": username, "digest": client.user_config.digest}
+
+            response = client.send_utterance("one").wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.response")
+            self.assertEqual(contexts[0]["user_profiles"],
+                             [client.user_config])
+            self.assertEqual(contexts[0]["user_profile_refs"], [ref])
+
+            # Repeat requests only reference the profile
+            response = client.send_utterance("two").wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.response")
+            self.assertEqual(contexts[1]["user_profiles"], [])
+            self.assertEqual(contexts[1]["user_profile_refs"], [ref])
+
+            # A request for the profile re-sends the request in full, and the
+            # response resolves the original request
+            cached.clear()
+            future = client.send_utterance("three")
+            response = future.wait_for_response(5)
+            self.assertEqual(response.msg_type, "klat.response")
+            self.assertEqual(response.data["responses"]["en-us"]["sentence"],
+                             "You said three")
+            self.assertEqual([m.msg_type for m in future.responses],
+                             ["neon.profile.request", "klat.response"])
+            self.assertEqual(len(contexts), 4)
+            self.assertEqual(contexts[2]["user_profiles"], [])
+            self.assertEqual(contexts[3]["user_profiles"],
+                             [client.user_config])
+            self.assertEqual(contexts[3]["mq"]["message_id"],
+                             future.message_id)
+            self.assertNotIn(future.message_id, client._pending)
+
+    def test_update_user_config(self):
+        from neon_utils.configuration_utils import get_neon_user_config
+        with fake_mq_connection():
+            client = self._get_client()
+        with self.assertRaises(TypeError):
+            client.user_config["speech"]["stt_language"] = "fr-fr"
+
+        profile = client.user_config.to_dict()
+        profile["speech"]["stt_language"] = "fr-fr"
+        profile["user"]["username"] = "session_user"
+        client.update_user_config(profile, persist=False)
+        self.assertEqual(client.user_config["speech"]["stt_language"],
+                         "fr-fr")
+        self.assertEqual(client.default_username, "session_user")
+        on_disk = get_neon_user_config(self.config_dir)
+        self.assertNotEqual(on_disk["speech"]["stt_language"], "fr-fr")
+        self.assertNotEqual(on_disk["user"]["username"], "session_user")
+
+        client.update_user_config(profile)
+        self.assertEqual(get_neon_user_config(self.config_dir)
+                         ["speech"]["stt_language"], "fr-fr")
+
+    def test_query_neon(self):
+        from neon_iris.util import get_tts
+        with fake_mq_connection() as broker, FakeNeonCore(broker):
+            response = get_tts("hello")
+        self.assertEqual(response["msg_type"], "neon.get_tts.response")
+        self.assertEqual(response["data"]["en-us"]["sentence"], "hello")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import unittest
+
+from concurrent.futures import TimeoutError
+from threading import Timer
+from time import sleep
+from ovos_bus_client.message import Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.futures import PendingRequests, ResponseFuture, \
+    get_response_text, get_transcription
+
+
+def _response(msg_type: str, message_id: str) -> Message:
+    return Message(msg_type, {}, {"mq": {"routing_key": "test",
+                                         "message_id": message_id}})
+
+
+class TestPendingRequests(unittest.TestCase):
+    def test_resolve_utterance(self):
+        pending = PendingRequests()
+        first = pending.add("first", "recognizer_loop:utterance")
+        second = pending.add("second", "recognizer_loop:utterance")
+        self.assertIsInstance(first, ResponseFuture)
+        self.assertEqual(len(pending), 2)
+
+        # Responses are correlated by message_id, regardless of order
+        response = _response("klat.response", "second")
+        self.assertEqual(pending.resolve(response), second)
+        self.assertEqual(second.result(0), response)
+        self.assertFalse(first.done())
+        self.assertEqual(len(pending), 1)
+
+        # Unknown and uncorrelated responses are ignored
+        self.assertIsNone(pending.resolve(_response("klat.response", "other")))
+        self.assertIsNone(pending.resolve(Message("klat.response", {}, {})))
+        self.assertFalse(first.done())
+
+    def test_resolve_audio_input(self):
+        pending = PendingRequests()
+        future = pending.add("audio", "neon.audio_input")
+        transcription = _response("neon.audio_input.response", "audio")
+        pending.resolve(transcription)
+        self.assertFalse(future.done())
+        response = _response("klat.response", "audio")
+        pending.resolve(response)
+        self.assertEqual(future.wait_for_response(0), response)
+        self.assertEqual(future.responses, [transcription, response])
+
+    def test_resolve_api_request(self):
+        pending = PendingRequests()
+        future = pending.add("langs", "neon.languages.get")
+        response = _response("neon.languages.get.response", "langs")
+        pending.resolve(response)
+        self.assertEqual(future.result(0), response)
+
+    def test_fail_and_expire(self):
+        pending = PendingRequests(timeout=0.1)
+        failed = pending.add("failed", "recognizer_loop:utterance")
+        pending.fail("failed", ConnectionError("test"))
+        self.assertIsInstance(failed.exception(0), ConnectionError)
+        self.assertIsNone(failed.wait_for_response(0))
+
+        stale = pending.add("stale", "recognizer_loop:utterance")
+        sleep(0.2)
+        pending.add("new", "recognizer_loop:utterance")
+        self.assertIsInstance(stale.exception(0), TimeoutError)
+        self.assertNotIn("stale", pending)
+        self.assertIn("new", pending)
+
+        # Requests are expired when a caller stops waiting for them
+        self.assertIsNone(pending.get("new").wait_for_response(0))
+        self.assertNotIn("new", pending)
+        self.assertEqual(len(pending), 0)
+
+    def test_expire_without_add(self):
+        pending = PendingRequests(timeout=0.1)
+        stale = [pending.add(f"stale_{i}", "recognizer_loop:utterance")
+                 for i in range(3)]
+        # Done callbacks run without the lock held, so they may use the table
+        reentered = list()
+        stale[0].add_done_callback(
+            lambda f: reentered.append(pending.get("stale_1")))
+        sleep(0.2)
+        self.assertIsNone(pending.get("stale_1"))
+        self.assertIsInstance(stale[0].exception(0), TimeoutError)
+        self.assertEqual(reentered, [None])
+        self.assertEqual(len(pending), 0)
+
+        stale = pending.add("stale", "recognizer_loop:utterance")
+        sleep(0.2)
+        self.assertIsNone(pending.resolve(_response("klat.response",
+                                                    "other")))
+        self.assertIsInstance(stale.exception(0), TimeoutError)
+
+        stale = pending.add("stale", "recognizer_loop:utterance")
+        sleep(0.2)
+        pending.expire_stale()
+        self.assertIsInstance(stale.exception(0), TimeoutError)
+
+    def test_cancel(self):
+        pending = PendingRequests()
+        future = pending.add("cancelled", "recognizer_loop:utterance")
+        future.cancel()
+        self.assertNotIn("cancelled", pending)
+        self.assertIsNone(pending.resolve(_response("klat.response",
+                                                    "cancelled")))
+
+        pending.cancel_all()
+        self.assertEqual(len(pending), 0)
+
+    def test_max_in_flight(self):
+        pending = PendingRequests(max_in_flight=2)
+        self.assertEqual(pending.occupancy, 0)
+        pending.add("first", "recognizer_loop:utterance")
+        pending.add("second", "recognizer_loop:utterance")
+        self.assertEqual(pending.occupancy, 1)
+        with self.assertRaises(BufferError):
+            pending.add("third", "recognizer_loop:utterance")
+
+        # Waiting requests are added when a pending request completes
+        Timer(0.1, pending.resolve,
+              (_response("klat.response", "first"),)).start()
+        third = pending.add("third", "recognizer_loop:utterance", wait=5)
+        self.assertIn("third", pending)
+        self.assertNotIn("first", pending)
+        with self.assertRaises(BufferError):
+            pending.add("fourth", "recognizer_loop:utterance", wait=0.1)
+        pending.fail("third", ConnectionError("test"))
+        self.assertIsInstance(third.exception(0), ConnectionError)
+        self.assertEqual(pending.occupancy, 0.5)
+
+
+class TestResponseHelpers(unittest.TestCase):
+    def test_get_response_text(self):
+        self.assertEqual(get_response_text(None), "ERROR")
+        self.assertEqual(get_response_text(Message("klat.error")), "ERROR")
+        response = Message("klat.response", {"responses": {
+            "en-us": {"sentence": "hello"}, "uk-ua": {"sentence": "привіт"}}})
+        self.assertEqual(get_response_text(response), "hello\nпривіт")
+
+    def test_get_transcription(self):
+        self.assertIsNone(get_transcription([Message("klat.response")]))
+        transcript = Message("neon.audio_input.response",
+                             {"transcripts": ["hello", "hollow"]})
+        self.assertEqual(get_transcription([transcript,
+                                            Message("klat.response")]),
+                         "hello")
+
+
+if __name__ == '__main__':
+    unittest.main()
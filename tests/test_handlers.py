@@ -0,0 +1,126 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+from concurrent.futures import Future
+from threading import Event
+from unittest.mock import Mock, patch
+from ovos_bus_client.message import Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.handlers import MessageHandlerRegistry
+
+
+class TestMessageHandlerRegistry(unittest.TestCase):
+    def test_register_dispatch(self):
+        registry = MessageHandlerRegistry()
+        exact = Mock(return_value="exact")
+        suffix = Mock(return_value="suffix")
+        long_suffix = Mock(return_value="long_suffix")
+        prefix = Mock(return_value="prefix")
+        registry.register(exact, "neon.languages.get.response")
+        registry.register(suffix, suffix=".response")
+        registry.register(long_suffix, suffix=".get.response")
+        registry.register(prefix, prefix="neon.")
+
+        # Exact matches take precedence, then the longest prefix or suffix
+        self.assertEqual(registry.dispatch(
+            Message("neon.languages.get.response")), "exact")
+        self.assertEqual(registry.dispatch(Message("neon.get_stt.response")),
+                         "suffix")
+        self.assertEqual(registry.dispatch(Message("neon.get.response")),
+                         "long_suffix")
+        self.assertEqual(registry.dispatch(Message("neon.get_stt")),
+                         "prefix")
+        self.assertEqual(registry.dispatch(Message("test.get.response")),
+                         "long_suffix")
+        self.assertEqual(registry.dispatch(Message("test.response")),
+                         "suffix")
+        self.assertIsNone(registry.dispatch(Message("unhandled")))
+        self.assertIs(registry.get_handler("test.response"), suffix)
+
+        # Registering replaces cached pattern lookups
+        replacement = Mock(return_value="replaced")
+        registry.register(replacement, suffix=".response")
+        self.assertEqual(registry.dispatch(Message("test.response")),
+                         "replaced")
+        registry.unregister(suffix=".response")
+        self.assertIsNone(registry.dispatch(Message("test.response")))
+        registry.unregister(msg_type="neon.languages.get.response")
+        self.assertEqual(registry.dispatch(
+            Message("neon.languages.get.response")), "long_suffix")
+        self.assertEqual(registry.dispatch(Message("neon.get_stt.response")),
+                         "prefix")
+
+        # Prefixes take precedence over suffixes of the same length
+        registry.register(replacement, suffix="stt.response")
+        registry.register(prefix, prefix="neon.get_stt")
+        self.assertEqual(registry.dispatch(Message("neon.get_stt.response")),
+                         "prefix")
+
+        with self.assertRaises(ValueError):
+            registry.register(exact)
+        with self.assertRaises(ValueError):
+            registry.register(exact, "test", prefix="test")
+
+    @patch("neon_iris.handlers._MAX_RESOLVED", 2)
+    def test_resolved_cache_size(self):
+        registry = MessageHandlerRegistry()
+        handler = Mock(return_value="suffix")
+        registry.register(handler, suffix=".response")
+        for msg_type in ("a.response", "b.response", "c"):
+            registry.dispatch(Message(msg_type))
+        self.assertEqual(list(registry._resolved), ["b.response", "c"])
+        self.assertEqual(registry.dispatch(Message("a.response")), "suffix")
+
+    def test_threaded_dispatch(self):
+        registry = MessageHandlerRegistry(max_workers=1)
+        started = Event()
+        release = Event()
+
+        def _blocking_handler(message):
+            started.set()
+            release.wait(5)
+            return message.msg_type
+
+        registry.register(_blocking_handler, "klat.response", threaded=True)
+        future = registry.dispatch(Message("klat.response"))
+        self.assertIsInstance(future, Future)
+        self.assertTrue(started.wait(5))
+        self.assertFalse(future.done())
+        release.set()
+        self.assertEqual(future.result(5), "klat.response")
+        registry.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
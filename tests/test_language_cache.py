@@ -0,0 +1,110 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+import os
+import sys
+import unittest
+
+from tempfile import mkdtemp
+from time import time
+from unittest.mock import Mock, patch
+from ovos_bus_client.message import Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.client import NeonAIClient
+
+
+class TestLanguageCache(unittest.TestCase):
+    mq_config = {"server": "localhost", "port": 5672}
+
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.config_dir = mkdtemp()
+        self.cache_file = os.path.join(self.cache_dir, "neon", "neon_iris",
+                                       "languages.json")
+
+    def _get_client(self, iris_config: dict) -> NeonAIClient:
+        with patch("neon_iris.client.Configuration",
+                   Mock(return_value={"iris": iris_config})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=self.cache_dir)), \
+                patch.object(NeonAIClient, "_init_mq_connection"), \
+                patch("neon_iris.client.Thread") as thread:
+            client = NeonAIClient(self.mq_config, self.config_dir)
+        client.request_thread = thread
+        self.addCleanup(client.shutdown)
+        return client
+
+    def test_no_language_api(self):
+        client = self._get_client({"languages": ["en-us"]})
+        client.request_thread.assert_not_called()
+        self.assertEqual(client._languages, {"stt": ["en-us"],
+                                             "tts": ["en-us"]})
+
+    def test_language_cache(self):
+        config = {"enable_lang_api": True, "languages": ["en-us"],
+                  "language_cache_ttl": 60}
+
+        # Configured languages are used until Neon responds
+        client = self._get_client(config)
+        client.request_thread.assert_called_once_with(
+            target=client._request_languages, daemon=True)
+        client.request_thread.return_value.start.assert_called_once()
+        self.assertFalse(client._language_init.is_set())
+        self.assertEqual(client._languages["stt"], ["en-us"])
+        languages = {"stt": ["uk-ua", "en-us"], "tts": ["en-us"]}
+        client._handle_supported_languages(
+            Message("neon.languages.get.response", languages))
+        self.assertTrue(client._language_init.is_set())
+        self.assertEqual(client._languages["stt"], ["en-us", "uk-ua"])
+        self.assertTrue(os.path.isfile(self.cache_file))
+
+        # Cached languages are used immediately and refreshed
+        client = self._get_client(config)
+        client.request_thread.assert_called_once_with(
+            target=client._request_languages, daemon=True)
+        client.request_thread.return_value.start.assert_called_once()
+        self.assertTrue(client._language_init.is_set())
+        self.assertEqual(client._languages["stt"], ["en-us", "uk-ua"])
+
+        # Expired cache is ignored
+        with open(self.cache_file) as f:
+            cache = json.load(f)
+        for entry in cache.values():
+            entry["time"] = time() - 120
+        with open(self.cache_file, "w") as f:
+            json.dump(cache, f)
+        client = self._get_client(config)
+        self.assertFalse(client._language_init.is_set())
+        self.assertEqual(client._languages["stt"], ["en-us"])
+
+
+if __name__ == '__main__':
+    unittest.main()
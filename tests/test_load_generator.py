@@ -0,0 +1,167 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+import os
+import sys
+import unittest
+
+from tempfile import mkdtemp
+from unittest.mock import Mock, patch
+
+from click.testing import CliRunner
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.client import NeonAIClient
+from neon_iris.testing.fake_mq import FakeNeonCore, fake_mq_connection, \
+    make_wav
+from neon_iris.load_generator import LoadGenerator, compare_summaries, \
+    get_inputs, percentiles, summarize
+
+
+class TestLoadGenerator(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        config = patch("neon_iris.client.Configuration",
+                       Mock(return_value={"iris": {}}))
+        cache = patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=self.cache_dir))
+        for p in (config, cache):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _get_clients(self, count: int) -> list:
+        clients = list()
+        for _ in range(count):
+            clients.append(NeonAIClient({"server": "localhost"}, mkdtemp()))
+            self.addCleanup(clients[-1].shutdown)
+        return clients
+
+    def test_percentiles(self):
+        self.assertEqual(percentiles([]), {"count": 0})
+        stats = percentiles([float(i) for i in range(100, 0, -1)])
+        self.assertEqual(stats["count"], 100)
+        self.assertEqual(stats["p50"], 50)
+        self.assertEqual(stats["p95"], 95)
+        self.assertEqual(stats["p99"], 99)
+        self.assertEqual(stats["max"], 100)
+        self.assertEqual(percentiles([1.0])["p99"], 1.0)
+
+    def test_summarize(self):
+        records = [{"input": "text", "status": "ok", "latency": 0.1,
+                    "msg_type": "klat.response",
+                    "timing": {"client_from_core": 0.01}},
+                   {"input": "audio", "status": "ok", "latency": 0.3,
+                    "msg_type": "complete.intent.failure", "timing": {}},
+                   {"input": "text", "status": "timeout", "latency": None,
+                    "msg_type": None, "timing": {}}]
+        summary = summarize(records, 2)
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["completed"], 2)
+        self.assertEqual(summary["timeouts"], 1)
+        self.assertEqual(summary["intent_failures"], 1)
+        self.assertEqual(summary["throughput"], 1)
+        self.assertEqual(summary["latency"]["all"]["count"], 2)
+        self.assertEqual(summary["latency"]["audio"]["p50"], 0.3)
+        self.assertEqual(summary["timing"]["client_from_core"]["count"], 1)
+
+        slower = summarize([dict(r, latency=r["latency"] * 2)
+                            for r in records[:2]], 2)
+        changes = compare_summaries(summary, slower)
+        self.assertIn("latency all: p50 0.1000->0.2000 (+100.0%)",
+                      changes[0])
+
+    def test_closed_loop(self):
+        with fake_mq_connection() as broker, \
+                FakeNeonCore(broker, latency=0.05) as core:
+            clients = self._get_clients(2)
+            generator = LoadGenerator(clients, get_inputs(["hello"]),
+                                      max_requests=6)
+            results = generator.run()
+        summary = results["summary"]
+        self.assertEqual(summary["completed"], 6)
+        self.assertEqual(core.received["recognizer_loop:utterance"], 6)
+        self.assertGreaterEqual(summary["latency"]["all"]["p50"], 0.05)
+        self.assertEqual({r["user"] for r in results["records"]}, {0, 1})
+        self.assertIn("client_from_core", summary["timing"])
+
+    def test_open_loop(self):
+        audio_file = os.path.join(self.cache_dir, "input.wav")
+        with open(audio_file, "wb") as f:
+            f.write(make_wav(1))
+        with self.assertRaises(FileNotFoundError):
+            get_inputs(["hello"], [audio_file + ".missing"])
+        with self.assertRaises(ValueError):
+            LoadGenerator([], get_inputs(["hello"]))
+
+        with fake_mq_connection() as broker, \
+                FakeNeonCore(broker, latency={"neon.audio_input": 0.1}):
+            clients = self._get_clients(2)
+            generator = LoadGenerator(
+                clients, get_inputs(["hello"], [audio_file]), rate=40,
+                duration=0.25, timeout=5)
+            summary = generator.run()["summary"]
+        # Inputs are sent on schedule, not when responses are received
+        self.assertGreaterEqual(summary["requests"], 9)
+        self.assertLessEqual(summary["requests"], 11)
+        self.assertEqual(summary["completed"], summary["requests"])
+        self.assertGreaterEqual(summary["latency"]["audio"]["p50"], 0.1)
+        self.assertLess(summary["latency"]["text"]["p50"], 0.1)
+
+    def test_timeout(self):
+        with fake_mq_connection() as broker, FakeNeonCore(broker, latency=1):
+            generator = LoadGenerator(self._get_clients(1),
+                                      get_inputs(["hello"]),
+                                      max_requests=1, timeout=0.1)
+            summary = generator.run()["summary"]
+        self.assertEqual(summary["timeouts"], 1)
+        self.assertEqual(generator.clients[0].pending_requests, 0)
+
+    def test_cli(self):
+        from neon_iris.cli import neon_iris_cli
+        output = os.path.join(self.cache_dir, "results.json")
+        result = CliRunner().invoke(neon_iris_cli, [
+            "bench", "--fake", "-n", "2", "--requests", "4", "-u", "hello",
+            "-o", output])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("4 completed", result.output)
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(results["summary"]["completed"], 4)
+        self.assertEqual(results["config"]["users"], 2)
+        self.assertEqual(len(results["records"]), 4)
+
+        result = CliRunner().invoke(neon_iris_cli, [
+            "bench", "--fake", "--requests", "2", "-c", output])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("latency all: p50", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from tempfile import mkdtemp
+from unittest.mock import Mock, patch
+
+from click.testing import CliRunner
+from ovos_bus_client.message import Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.futures import PendingRequests
+from neon_iris.metrics import ClientMetrics, MetricsRegistry, REGISTRY, \
+    get_timing_durations
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test count", ("kind",))
+        self.assertIs(registry.counter("test_total", "Test count",
+                                       ("kind",)), counter)
+        with self.assertRaises(ValueError):
+            registry.gauge("test_total", "Test count")
+        with self.assertRaises(ValueError):
+            counter.inc()
+        with self.assertRaises(ValueError):
+            counter.inc(-1, kind="a")
+        counter.inc(kind="a")
+        counter.inc(2, kind='b"')
+        self.assertEqual(counter.get(kind="a"), 1)
+        self.assertEqual(registry.to_prometheus(),
+                         '# HELP test_total Test count\n'
+                         '# TYPE test_total counter\n'
+                         'test_total{kind="a"} 1\n'
+                         'test_total{kind="b\\""} 2\n')
+
+    def test_gauge(self):
+        registry = MetricsRegistry()
+        gauge = registry.gauge("test_gauge", "Test gauge")
+        gauge.set(2)
+        gauge.dec()
+        sources = [Mock(return_value=3), Mock(return_value=4)]
+        for source in sources:
+            gauge.add_function(source)
+        self.assertEqual(gauge.get(), 8)
+        gauge.remove_function(sources[0])
+        self.assertIn("test_gauge 5\n", registry.to_prometheus())
+        labeled = registry.gauge("test_labeled", "Test", ("kind",))
+        with self.assertRaises(ValueError):
+            labeled.add_function(sources[1])
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test", ("stage",),
+                                       (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, stage="a")
+        self.assertEqual(histogram.get(stage="a"), ([2, 3, 4], 5.65, 4))
+        self.assertEqual(histogram.get(stage="b"), ([0, 0, 0], 0.0, 0))
+        text = registry.to_prometheus()
+        self.assertIn('# TYPE test_seconds histogram\n', text)
+        self.assertIn('test_seconds_bucket{stage="a",le="0.1"} 2\n', text)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 4\n', text)
+        self.assertIn('test_seconds_sum{stage="a"} 5.65\n', text)
+        self.assertIn('test_seconds_count{stage="a"} 4\n', text)
+
+    def test_timing_durations(self):
+        timing = {"client_sent": 1700000000.0, "client_from_core": 0.01,
+                  "wait_in_queue": 0.2, "transcribed": True, "note": "x"}
+        self.assertEqual(get_timing_durations(timing),
+                         {"client_from_core": 0.01, "wait_in_queue": 0.2})
+        self.assertEqual(get_timing_durations(None), dict())
+
+
+class TestClientMetrics(unittest.TestCase):
+    def test_requests(self):
+        metrics = ClientMetrics(MetricsRegistry())
+        pending = PendingRequests(timeout=60)
+        futures = list()
+        for idx in range(5):
+            future = pending.add(str(idx), "recognizer_loop:utterance")
+            metrics.on_request(future, future.msg_type)
+            futures.append(future)
+        pending.resolve(Message("klat.response", {},
+                                {"mq": {"message_id": "0"}}))
+        pending.fail("2", ConnectionError())
+        futures[3].cancel()
+        # Requests time out when the caller stops waiting or when expired
+        self.assertIsNone(futures[4].wait_for_response(0))
+        futures[1].created = 0
+        pending.add("new", "recognizer_loop:utterance")
+        self.assertIsInstance(futures[1].exception(0), FutureTimeoutError)
+        self.assertEqual(metrics.requests.get(
+            msg_type="recognizer_loop:utterance"), 5)
+        self.assertEqual(metrics.request_seconds.get(
+            msg_type="recognizer_loop:utterance")[2], 1)
+        self.assertEqual(metrics.timeouts.get(), 2)
+        self.assertEqual(metrics.errors.get(reason="ConnectionError"), 1)
+        self.assertEqual(metrics.errors.get(reason="TimeoutError"), 0)
+        self.assertEqual(len(pending), 1)
+
+    def test_responses(self):
+        metrics = ClientMetrics(MetricsRegistry())
+        metrics.on_response(Message("klat.response", {}, {"timing": {
+            "client_from_core": 0.02}}), 0.5)
+        metrics.on_response(Message("complete.intent.failure"), 0.1)
+        metrics.on_response(Message("klat.error"), error=True)
+        metrics.on_response(Message("neon.profile_update"))
+        self.assertEqual(metrics.response_seconds.get(
+            msg_type="klat.response")[1:], (0.5, 1))
+        self.assertEqual(metrics.response_seconds.get(
+            msg_type="neon.profile_update")[2], 0)
+        self.assertEqual(metrics.stage_seconds.get(
+            stage="client_from_core")[2], 1)
+        self.assertEqual(metrics.intent_failures.get(), 1)
+        self.assertEqual(metrics.errors.get(reason="error_response"), 1)
+
+    def test_client(self):
+        from neon_iris.client import NeonAIClient
+        from neon_iris.testing.fake_mq import FakeNeonCore, \
+            fake_mq_connection
+        metrics = ClientMetrics()
+        sent = metrics.requests.get(msg_type="recognizer_loop:utterance")
+        errors = metrics.errors.get(reason="error_response")
+        with fake_mq_connection() as broker, FakeNeonCore(broker), \
+                patch("neon_iris.client.Configuration",
+                      Mock(return_value={"iris": {}})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=mkdtemp())):
+            client = NeonAIClient({"server": "localhost"}, mkdtemp())
+            future = client.send_utterance("hello")
+            self.assertIsNotNone(future.wait_for_response(5))
+            message = client._build_message("neon.unknown", {})
+            self.assertEqual(client._send_message(message)
+                             .wait_for_response(5).msg_type, "klat.error")
+            self.assertGreaterEqual(metrics.in_flight.get(), 0)
+            client.shutdown()
+        self.assertEqual(metrics.requests.get(
+            msg_type="recognizer_loop:utterance"), sent + 1)
+        self.assertEqual(metrics.errors.get(reason="error_response"),
+                         errors + 1)
+        self.assertIn("iris_response_stage_seconds_bucket{"
+                      "stage=\"client_from_core\"", REGISTRY.to_prometheus())
+
+    def test_cli_dump(self):
+        from neon_iris.cli import neon_iris_cli
+        path = os.path.join(mkdtemp(), "metrics.prom")
+        with patch("neon_iris.client.Configuration",
+                   Mock(return_value={"iris": {}})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=mkdtemp())):
+            result = CliRunner().invoke(neon_iris_cli, [
+                "bench", "--fake", "--requests", "2", "--metrics", path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(path) as f:
+            self.assertIn("# TYPE iris_request_seconds histogram", f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
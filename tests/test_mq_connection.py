@@ -0,0 +1,277 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import os
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+from neon_utils.socket_utils import dict_to_b64
+from pika.exceptions import ChannelClosedByBroker, StreamLostError
+from pika.spec import Basic
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.mq_connection import MQConnectionHub, MQConnectionManager, \
+    PrefetchConsumerThread, PrefetchMQHandler, PrefetchSelectConsumerThread, \
+    is_forwarded_error, set_consumer_prefetch
+
+
+def _mock_handler():
+    handler = MagicMock()
+    handler.connection.is_open = True
+    handler.connection.channel.side_effect = lambda: MagicMock(is_open=True)
+    return handler
+
+
+class TestMQConnectionManager(unittest.TestCase):
+    def test_publish_reuses_channel(self):
+        handler = _mock_handler()
+        manager = MQConnectionManager(lambda: handler)
+        self.assertTrue(manager.healthy)
+        message = {"msg_type": "test", "data": {},
+                   "context": {"mq": {"message_id": "test_id"}}}
+        self.assertEqual(manager.publish("test_queue", message), "test_id")
+        self.assertEqual(manager.publish("test_queue", message), "test_id")
+        handler.connection.channel.assert_called_once()
+        self.assertEqual(manager.open_channels, 1)
+        channel = manager._publish_channel
+        channel.queue_declare.assert_called_once_with(queue="test_queue",
+                                                      auto_delete=False)
+        self.assertEqual(channel.basic_publish.call_count, 2)
+        self.assertNotIn("message_id", message)
+
+        # Accessing the handler does not open channels
+        self.assertEqual(manager.get_handler(), handler)
+        handler.connection.channel.assert_called_once()
+
+    def test_publish_reconnects(self):
+        handlers = [_mock_handler(), _mock_handler()]
+        manager = MQConnectionManager(lambda: handlers.pop(0))
+        failed = manager.mq_handler
+        manager.publish("test_queue", {"msg_type": "test"})
+        manager._publish_channel.basic_publish.side_effect = \
+            StreamLostError("test")
+        manager.publish("test_queue", {"msg_type": "test"})
+        failed.stop.assert_called_once()
+        self.assertNotEqual(manager.mq_handler, failed)
+        self.assertTrue(manager.healthy)
+        manager._publish_channel.basic_publish.assert_called_once()
+
+    def test_publish_batch(self):
+        handler = _mock_handler()
+        channel = MagicMock(is_open=True)
+        handler.connection.channel.side_effect = None
+        handler.connection.channel.return_value = channel
+        impl = channel._impl
+        callbacks = dict()
+
+        def _confirm_delivery(on_confirm, on_select_ok):
+            callbacks['confirm'] = on_confirm
+            on_select_ok(None)
+
+        def _process_data_events(**_):
+            # Ack 1 and 2 together, nack 3, and never confirm 4
+            confirm = callbacks['confirm']
+            confirm(MagicMock(method=Basic.Ack(delivery_tag=2,
+                                               multiple=True)))
+            confirm(MagicMock(method=Basic.Nack(delivery_tag=3)))
+
+        impl.confirm_delivery.side_effect = _confirm_delivery
+        handler.connection.process_data_events.side_effect = \
+            _process_data_events
+        manager = MQConnectionManager(lambda: handler)
+        messages = [{"msg_type": "test", "data": {"index": i}}
+                    for i in range(4)]
+        self.assertEqual(manager.publish_batch("test_queue", messages,
+                                               timeout=0.1),
+                         [True, True, False, False])
+        self.assertEqual(impl.basic_publish.call_count, 4)
+        channel.queue_declare.assert_called_once_with(queue="test_queue",
+                                                      auto_delete=False)
+        channel.close.assert_called_once()
+        self.assertEqual(manager.open_channels, 0)
+
+    def test_get_queue_depth(self):
+        manager = MQConnectionManager(_mock_handler)
+        channel = manager._get_publish_channel()
+        channel.queue_declare.return_value.method.message_count = 5
+        self.assertEqual(manager.get_queue_depth("test_queue"), 5)
+        channel.queue_declare.assert_called_once_with(queue="test_queue",
+                                                      passive=True)
+        channel.queue_declare.side_effect = \
+            ChannelClosedByBroker(404, "NOT_FOUND")
+        self.assertEqual(manager.get_queue_depth("missing"), 0)
+
+    def test_channel_limit(self):
+        manager = MQConnectionManager(_mock_handler, max_channels=2)
+        channel = manager.open_channel()
+        manager.open_channel()
+        with self.assertRaises(RuntimeError):
+            manager.open_channel()
+        manager.close_channel(channel)
+        self.assertEqual(manager.open_channels, 1)
+        manager.open_channel()
+        manager.stop()
+        self.assertEqual(manager.open_channels, 0)
+        self.assertFalse(manager.healthy)
+
+
+class TestPrefetchConsumer(unittest.TestCase):
+    @patch("pika.BlockingConnection")
+    def _init_handler(self, _) -> PrefetchMQHandler:
+        config = {"server": "localhost",
+                  "users": {"mq_handler": {"user": "test",
+                                           "password": "test"}}}
+        return PrefetchMQHandler(config, "mq_handler", "/test")
+
+    def test_consumer_thread_cls(self):
+        handler = self._init_handler()
+        handler.async_consumers_enabled = True
+        self.assertEqual(handler.consumer_thread_cls,
+                         PrefetchSelectConsumerThread)
+        handler.async_consumers_enabled = False
+        self.assertEqual(handler.consumer_thread_cls, PrefetchConsumerThread)
+
+    @patch("neon_mq_connector.consumers.blocking_consumer.pika")
+    def test_set_consumer_prefetch(self, _):
+        handler = self._init_handler()
+        handler.async_consumers_enabled = False
+        callback = MagicMock()
+        handler.register_consumer("test", "/test", "test_queue", callback,
+                                  auto_ack=False)
+        set_consumer_prefetch(handler, "test", 5)
+        consumer = handler.consumers["test"]
+        self.assertIsInstance(consumer, PrefetchConsumerThread)
+        self.assertEqual(consumer.prefetch_count, 5)
+
+        consumer._create_connection()
+        channel = consumer.channel
+        channel.basic_qos.assert_called_with(prefetch_count=5)
+        channel.basic_consume.assert_called_with(on_message_callback=callback,
+                                                 queue="test_queue",
+                                                 auto_ack=False)
+
+        # Consumers are rebuilt from their saved properties on restart
+        properties = handler.consumer_properties["test"]["properties"]
+        restarted = handler.consumer_thread_cls(**properties)
+        self.assertEqual(restarted.prefetch_count, 5)
+
+    def test_select_consumer_prefetch(self):
+        # SelectConsumerThread blocks on init if there is no event loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(loop.close)
+        handler = self._init_handler()
+        handler.async_consumers_enabled = True
+        handler.register_consumer("test", "/test", "test_queue", MagicMock())
+        set_consumer_prefetch(handler, "test", 5)
+        consumer = handler.consumers["test"]
+        self.assertIsInstance(consumer, PrefetchSelectConsumerThread)
+
+        consumer.channel = MagicMock()
+        consumer.set_qos()
+        consumer.channel.basic_qos.assert_called_once_with(
+            prefetch_count=5, callback=consumer.start_consuming)
+
+
+@patch("neon_iris.mq_connection.NeonMQHandler")
+@patch("neon_iris.mq_connection.pika.BlockingConnection")
+class TestMQConnectionHub(unittest.TestCase):
+    def _init_hub(self, connection) -> MQConnectionHub:
+        channel = connection.return_value.channel.return_value
+        connection.return_value.add_callback_threadsafe.side_effect = \
+            lambda callback: callback()
+        channel.basic_consume.side_effect = lambda queue, *_, **__: queue
+        hub = MQConnectionHub({"server": "localhost"})
+        channel.start_consuming.side_effect = hub._stopping.wait
+        self.assertTrue(hub.wait_for_connection(5))
+        return hub
+
+    def test_register_and_route(self, connection, _):
+        hub = self._init_hub(connection)
+        channel = connection.return_value.channel.return_value
+        on_response = [MagicMock(), MagicMock()]
+        on_error = [MagicMock(), MagicMock()]
+        hub.register("client_0", on_response[0], on_error[0])
+        hub.register("client_1", on_response[1], on_error[1])
+        self.assertEqual(len(hub), 2)
+        channel.queue_declare.assert_any_call(queue="client_0",
+                                              auto_delete=False)
+
+        method = MagicMock(routing_key="client_1")
+        hub._on_message(channel, method, None, b"body")
+        on_response[1].assert_called_once_with(channel, method, None, b"body")
+        on_response[0].assert_not_called()
+
+        # Responses for unregistered routing keys are dropped
+        method = MagicMock(routing_key="other", delivery_tag=3)
+        hub._on_message(channel, method, None, b"body")
+        channel.basic_ack.assert_called_once_with(delivery_tag=3)
+        channel.basic_nack.assert_not_called()
+        channel.basic_ack.reset_mock()
+        method = MagicMock(routing_key="client_1")
+
+        error = {"msg_type": "klat.error", "data": {"error": "test"},
+                 "context": {"routing_key": "client_0"}}
+        hub._on_error_message(channel, method, None, dict_to_b64(error))
+        on_error[0].assert_called_once()
+        self.assertEqual(on_error[0].call_args[0][0].data, error["data"])
+        on_error[1].assert_not_called()
+
+        # Errors for unknown clients are forwarded to their response queue
+        error["context"]["routing_key"] = "other"
+        method = MagicMock(routing_key="", redelivered=False, delivery_tag=1)
+        hub._on_error_message(channel, method, None, dict_to_b64(error))
+        channel.basic_ack.assert_called_with(delivery_tag=1)
+        forwarded = channel.basic_publish.call_args[1]
+        self.assertEqual(forwarded["routing_key"], "other")
+        self.assertEqual(forwarded["body"], dict_to_b64(error))
+        self.assertTrue(is_forwarded_error(forwarded["properties"]))
+        channel.basic_nack.assert_not_called()
+
+        # Errors with a routing key header are not decoded if unknown
+        method = MagicMock(routing_key="", redelivered=True, delivery_tag=2)
+        hub._on_error_message(channel, method,
+                              MagicMock(headers={"routing_key": "other"},
+                                        content_type=None), b"invalid")
+        channel.basic_ack.assert_called_with(delivery_tag=2)
+        forwarded = channel.basic_publish.call_args[1]
+        self.assertEqual(forwarded["routing_key"], "other")
+        self.assertEqual(forwarded["body"], b"invalid")
+
+        hub.unregister("client_0")
+        self.assertNotIn("client_0", hub)
+        channel.basic_cancel.assert_called_once_with("client_0")
+        hub.shutdown()
+        self.assertFalse(hub.connected)
+
+
+if __name__ == '__main__':
+    unittest.main()
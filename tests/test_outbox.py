@@ -0,0 +1,144 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+from tempfile import mkdtemp
+from threading import Event
+from time import sleep
+from unittest.mock import Mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.outbox import Outbox
+
+
+class _FlakyPublisher:
+    def __init__(self):
+        self.published = list()
+        self.connected = Event()
+        self.connected.set()
+
+    def __call__(self, message: dict):
+        if not self.connected.is_set():
+            raise ConnectionError("Broker down")
+        self.published.append(message['id'])
+
+
+class TestOutbox(unittest.TestCase):
+    def _wait_for(self, check, timeout=5):
+        for _ in range(int(timeout / 0.05)):
+            if check():
+                return True
+            sleep(0.05)
+        return False
+
+    def test_send_buffer_and_drain(self):
+        publisher = _FlakyPublisher()
+        on_drop = Mock()
+        outbox = Outbox(publisher, on_drop, max_size=10, max_backoff=0.1)
+        self.addCleanup(outbox.shutdown)
+
+        outbox.send({"id": 0})
+        self.assertEqual(publisher.published, [0])
+        self.assertEqual(len(outbox), 0)
+
+        # Messages are buffered while disconnected and sent in order
+        publisher.connected.clear()
+        for i in range(1, 5):
+            outbox.send({"id": i})
+        self.assertEqual(len(outbox), 4)
+        publisher.connected.set()
+        self.assertTrue(self._wait_for(lambda: len(outbox) == 0))
+        self.assertEqual(publisher.published, [0, 1, 2, 3, 4])
+        on_drop.assert_not_called()
+
+        # New messages are sent directly once the outbox is drained
+        outbox.send({"id": 5})
+        self.assertEqual(publisher.published[-1], 5)
+
+    def test_deadline_and_limit(self):
+        publisher = _FlakyPublisher()
+        on_drop = Mock()
+        outbox = Outbox(publisher, on_drop, max_size=2, timeout=0.2,
+                        max_backoff=0.05)
+        self.addCleanup(outbox.shutdown)
+        publisher.connected.clear()
+        outbox.send({"id": 1})
+        outbox.send({"id": 2}, timeout=10)
+        with self.assertRaises(BufferError):
+            outbox.send({"id": 3})
+
+        # Expired messages are dropped instead of replayed
+        self.assertTrue(self._wait_for(lambda: on_drop.called))
+        message, error = on_drop.call_args[0]
+        self.assertEqual(message, {"id": 1})
+        self.assertIsInstance(error, TimeoutError)
+        publisher.connected.set()
+        self.assertTrue(self._wait_for(lambda: len(outbox) == 0))
+        self.assertEqual(publisher.published, [2])
+
+    def test_non_retryable_error(self):
+        publisher = Mock(side_effect=ValueError("Invalid message"))
+        outbox = Outbox(publisher, retry_exceptions=(ConnectionError,))
+        self.addCleanup(outbox.shutdown)
+        with self.assertRaises(ValueError):
+            outbox.send({"id": 1})
+        self.assertEqual(len(outbox), 0)
+
+    def test_spill_to_disk(self):
+        publisher = _FlakyPublisher()
+        spill_dir = os.path.join(mkdtemp(), "outbox")
+        outbox = Outbox(publisher, max_size=2, spill_dir=spill_dir,
+                        max_backoff=0.05)
+        publisher.connected.clear()
+        for i in range(6):
+            outbox.send({"id": i, "audio": bytes(4)})
+        self.assertEqual(len(outbox), 6)
+        self.assertEqual(len(os.listdir(spill_dir)), 4)
+        publisher.connected.set()
+        self.assertTrue(self._wait_for(lambda: len(outbox) == 0))
+        self.assertEqual(publisher.published, list(range(6)))
+        self.assertEqual(os.listdir(spill_dir), [])
+
+        # Buffered messages are dropped on shutdown
+        on_drop = Mock()
+        outbox._on_drop = on_drop
+        publisher.connected.clear()
+        outbox.send({"id": 6})
+        outbox.shutdown()
+        self.assertIsInstance(on_drop.call_args[0][1], ConnectionError)
+        self.assertFalse(os.path.exists(spill_dir))
+        with self.assertRaises(RuntimeError):
+            outbox.send({"id": 7})
+
+
+if __name__ == '__main__':
+    unittest.main()
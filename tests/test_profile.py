@@ -0,0 +1,125 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import copy
+import json
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.profile import FrozenDict, FrozenList, ProfileReferences, \
+    ProfileSnapshot, profile_digest
+
+
+class TestProfileSnapshot(unittest.TestCase):
+    profile = {"user": {"username": "test", "email": ""},
+               "speech": {"stt_language": "en-us",
+                          "alt_languages": ["en", "uk"]}}
+
+    def test_snapshot_read_only(self):
+        snapshot = ProfileSnapshot(self.profile)
+        self.assertEqual(snapshot, self.profile)
+        self.assertIsInstance(snapshot["user"], FrozenDict)
+        self.assertIsInstance(snapshot["speech"]["alt_languages"], FrozenList)
+        with self.assertRaises(TypeError):
+            snapshot["user"] = {}
+        with self.assertRaises(TypeError):
+            snapshot["user"]["username"] = "other"
+        with self.assertRaises(TypeError):
+            snapshot["speech"]["alt_languages"].append("pl")
+        with self.assertRaises(TypeError):
+            snapshot.update({})
+
+        # Copies are cheap and share the same object
+        self.assertIs(copy.copy(snapshot), snapshot)
+        self.assertIs(copy.deepcopy(snapshot), snapshot)
+
+        # Mutable copies do not modify the snapshot
+        mutable = snapshot.to_dict()
+        self.assertEqual(type(mutable["speech"]["alt_languages"]), list)
+        mutable["user"]["username"] = "other"
+        self.assertEqual(snapshot["user"]["username"], "test")
+
+    def test_snapshot_serialization(self):
+        snapshot = ProfileSnapshot(self.profile)
+        self.assertEqual(json.dumps(snapshot), json.dumps(self.profile))
+        self.assertEqual(eval(str(snapshot)), self.profile)
+        restored = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(restored, snapshot)
+        self.assertEqual(restored.version, snapshot.version)
+        self.assertEqual(restored.digest, snapshot.digest)
+
+    def test_snapshot_version(self):
+        first = ProfileSnapshot(self.profile)
+        second = ProfileSnapshot(self.profile)
+        self.assertGreater(second.version, first.version)
+        self.assertEqual(first.digest, second.digest)
+
+        updated = first.to_dict()
+        updated["user"]["email"] = "test@neon.ai"
+        self.assertNotEqual(ProfileSnapshot(updated).digest, first.digest)
+
+
+class TestProfileReferences(unittest.TestCase):
+    def test_get_context(self):
+        refs = ProfileReferences()
+        profile = ProfileSnapshot({"user": {"username": "test"}})
+        session = {"user": {"username": "session"}}
+        ref = {"username": "test", "digest": profile.digest}
+        session_ref = {"username": "session",
+                       "digest": profile_digest(session)}
+        self.assertEqual(profile_digest(profile.to_dict()), profile.digest)
+
+        # Profiles are only sent in full the first time
+        self.assertEqual(refs.get_context([profile, session]),
+                         ([profile, session], [ref, session_ref]))
+        self.assertEqual(refs.get_context([profile]), ([], [ref]))
+        self.assertEqual(refs.get_profiles([ref, session_ref]),
+                         [profile, session])
+
+        # Changed profiles are sent in full
+        session["user"]["email"] = "test@neon.ai"
+        full, session_refs = refs.get_context([session])
+        self.assertEqual(full, [session])
+        self.assertNotEqual(session_refs, [session_ref])
+        self.assertEqual(refs.get_context([session]), ([], session_refs))
+
+        # Forgotten profiles are sent in full
+        refs.forget(["test"])
+        self.assertEqual(refs.get_context([profile, session]),
+                         ([profile], [ref] + session_refs))
+        refs.forget()
+        self.assertEqual(refs.get_profiles([ref]), [])
+        self.assertEqual(refs.get_context([profile])[0], [profile])
+
+
+if __name__ == '__main__':
+    unittest.main()
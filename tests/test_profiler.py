@@ -0,0 +1,163 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import os
+import pstats
+import sys
+import threading
+import unittest
+
+from tempfile import mkdtemp
+from time import time
+from urllib.request import urlopen
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.metrics import MetricsRegistry
+from neon_iris.profiler import Profiler, SamplingProfiler, profiled
+
+
+def _busy_loop(seconds: float):
+    start = time()
+    while time() - start < seconds:
+        sum(range(1000))
+
+
+def _run_busy_thread(seconds: float = 0.3):
+    thread = threading.Thread(target=_busy_loop, args=(seconds,),
+                              name="busy")
+    thread.start()
+    thread.join()
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_sample(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        _run_busy_thread()
+        profiler.stop()
+        self.assertFalse(profiler.running)
+        self.assertGreater(profiler.sample_count, 0)
+        self.assertGreaterEqual(profiler.sample_interval, 0.001)
+
+        collapsed = profiler.get_collapsed().splitlines()
+        busy = [line for line in collapsed if line.startswith("busy;")]
+        self.assertTrue(busy)
+        self.assertIn("_busy_loop (test_profiler.py:", busy[0])
+        self.assertTrue(busy[0].rsplit(" ", 1)[1].isdigit())
+        # Waiting threads are not sampled by default
+        self.assertFalse([line for line in collapsed
+                          if line.startswith("MainThread;")])
+
+        path = os.path.join(mkdtemp(), "test.prof")
+        with open(path, "wb") as f:
+            f.write(profiler.get_pstats())
+        stats = pstats.Stats(path).stats
+        busy_loop = [v for k, v in stats.items() if k[2] == "_busy_loop"][0]
+        cc, nc, tt, ct, callers = busy_loop
+        self.assertGreater(ct, 0.1)
+        self.assertLessEqual(tt, ct)
+        self.assertTrue(any(k[2] == "run" for k in callers))
+
+        profiler.reset()
+        self.assertEqual(profiler.sample_count, 0)
+        self.assertEqual(profiler.get_collapsed(), "")
+
+
+class TestProfiler(unittest.TestCase):
+    def test_timers(self):
+        profiler = Profiler(0.001, MetricsRegistry())
+        with profiler.timer("test"):
+            pass
+        self.assertEqual(profiler.handler_seconds.get(handler="test")[2], 0)
+
+        profiler.enable()
+        with profiler.timer("test"):
+            pass
+        self.assertEqual(profiler.handler_seconds.get(handler="test")[2], 1)
+        profiler.disable()
+        self.assertFalse(profiler.running)
+
+    def test_profiled(self):
+        from neon_iris.profiler import PROFILER
+        calls = PROFILER.handler_seconds.get(handler="sync")[2]
+
+        @profiled("sync")
+        def _sync(value):
+            return value
+
+        @profiled("async")
+        async def _async(value):
+            return value
+
+        PROFILER.enabled = True
+        try:
+            self.assertEqual(_sync(1), 1)
+            self.assertEqual(asyncio.run(_async(2)), 2)
+        finally:
+            PROFILER.enabled = False
+        _sync(1)
+        self.assertEqual(PROFILER.handler_seconds.get(handler="sync")[2],
+                         calls + 1)
+        self.assertGreaterEqual(
+            PROFILER.handler_seconds.get(handler="async")[2], 1)
+
+    def test_dump_and_serve(self):
+        profiler = Profiler(0.001, MetricsRegistry())
+        profiler.enable()
+        _run_busy_thread(0.1)
+        with profiler.timer("test"):
+            pass
+        pstats_path, collapsed_path = profiler.dump(mkdtemp())
+        self.assertIsInstance(pstats.Stats(pstats_path), pstats.Stats)
+        with open(collapsed_path) as f:
+            self.assertIn("_busy_loop", f.read())
+
+        port = profiler.serve(0)
+        url = f"http://127.0.0.1:{port}"
+        with urlopen(f"{url}/profile") as resp:
+            self.assertIn(b"_busy_loop", resp.read())
+        with urlopen(f"{url}/metrics") as resp:
+            self.assertIn(b'iris_handler_seconds_count{handler="test"} 1',
+                          resp.read())
+        thread = threading.Thread(target=_busy_loop, args=(0.3,), name="busy")
+        thread.start()
+        with urlopen(f"{url}/profile?seconds=0.2&format=pstats") as resp:
+            path = os.path.join(mkdtemp(), "window.prof")
+            with open(path, "wb") as f:
+                f.write(resp.read())
+        thread.join()
+        self.assertTrue(any(k[2] == "_busy_loop"
+                            for k in pstats.Stats(path).stats))
+        profiler.disable()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.resample import StreamResampler, get_filter_table
+
+
+def _sine(rate: int, seconds: float, freq: float = 440.0) -> np.ndarray:
+    return np.sin(2 * np.pi * freq * np.arange(int(rate * seconds)) / rate) \
+        * 10000
+
+
+class TestStreamResampler(unittest.TestCase):
+    def test_get_filter_table(self):
+        up, down, table = get_filter_table(44100, 16000)
+        self.assertEqual((up, down), (160, 441))
+        self.assertEqual(table.shape[0], 160)
+        self.assertEqual(table.dtype, np.float32)
+        # Each phase passes low frequencies with unity gain
+        np.testing.assert_allclose(table.sum(axis=1), 1, atol=1e-3)
+        self.assertIs(get_filter_table(44100, 16000)[2], table)
+        with self.assertRaises(ValueError):
+            get_filter_table(0, 16000)
+
+    def test_resample(self):
+        for rate in (8000, 22050, 44100, 48000):
+            resampler = StreamResampler(rate)
+            audio = _sine(rate, 1).astype(np.int16)
+            output = np.concatenate([resampler.process(audio[i:i + 4096])
+                                     .copy()
+                                     for i in range(0, len(audio), 4096)])
+            # Output is delayed by a few milliseconds
+            self.assertLessEqual(16000 - len(output), 48)
+            self.assertEqual(output.dtype, np.float32)
+            expected = _sine(16000, 1)[:len(output)]
+            # No artifacts at frame boundaries after the start of the stream
+            np.testing.assert_allclose(output[100:], expected[100:], atol=5)
+
+    def test_frame_sizes(self):
+        audio = _sine(44100, 0.5)
+        expected = StreamResampler(44100).process(audio).copy()
+        resampler = StreamResampler(44100)
+        sizes = [1, 0, 4096, 10, 441, 3000]
+        frames = list()
+        start = 0
+        for size in sizes * 10:
+            frames.append(resampler.process(audio[start:start + size])
+                          .copy())
+            start += size
+        frames.append(resampler.process(audio[start:]).copy())
+        np.testing.assert_allclose(np.concatenate(frames), expected,
+                                   atol=0.1)
+
+        resampler.reset()
+        np.testing.assert_allclose(resampler.process(audio), expected,
+                                   atol=0.1)
+
+    def test_int16_output(self):
+        resampler = StreamResampler(48000, dtype=np.int16)
+        output = resampler.process(_sine(48000, 0.1) * 4)
+        self.assertEqual(output.dtype, np.int16)
+        self.assertEqual(output.max(), 32767)
+        self.assertEqual(output.min(), -32768)
+        # Output buffers are reused between frames
+        self.assertTrue(np.shares_memory(
+            output, resampler.process(_sine(48000, 0.1))))
+        with self.assertRaises(ValueError):
+            StreamResampler(48000, dtype=np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
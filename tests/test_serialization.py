@@ -0,0 +1,109 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import unittest
+
+from base64 import b64encode
+from tempfile import mkdtemp
+from uuid import uuid4
+from neon_utils.socket_utils import b64_to_dict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.serialization import LEGACY_CODEC, MSGPACK_CONTENT_TYPE, \
+    audio_to_b64, decode_audio_to_file, get_body_patterns, get_codec, \
+    get_codec_by_name
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_audio = b"RIFF\x00\x01\x02\xff" * 64
+_message = {"msg_type": "neon.audio_input",
+            "data": {"lang": "en-us", "audio_data": _audio, "utterances": []},
+            "context": {"mq": {"message_id": "test"}}}
+
+
+class TestSerialization(unittest.TestCase):
+    def test_legacy_codec(self):
+        self.assertEqual(get_codec(None), LEGACY_CODEC)
+        self.assertEqual(get_codec("application/unknown"), LEGACY_CODEC)
+        body = LEGACY_CODEC.encode(_message)
+        decoded = LEGACY_CODEC.decode(body)
+        self.assertEqual(decoded, b64_to_dict(body))
+        self.assertEqual(decoded["data"]["audio_data"],
+                         b64encode(_audio).decode("utf-8"))
+        self.assertEqual(decoded["context"], _message["context"])
+        # Input is not modified
+        self.assertIsInstance(_message["data"]["audio_data"], bytes)
+
+    @unittest.skipUnless(msgpack, "msgpack not installed")
+    def test_msgpack_codec(self):
+        codec = get_codec(MSGPACK_CONTENT_TYPE)
+        self.assertEqual(codec, get_codec_by_name("msgpack"))
+        self.assertTrue(codec.binary)
+        body = codec.encode(_message)
+        self.assertEqual(codec.decode(body), _message)
+        self.assertLess(len(body), len(LEGACY_CODEC.encode(_message)))
+
+    def test_audio_helpers(self):
+        encoded = b64encode(_audio).decode("utf-8")
+        self.assertEqual(audio_to_b64(_audio), encoded)
+        self.assertEqual(audio_to_b64(encoded), encoded)
+        test_dir = mkdtemp()
+        for audio_data in (_audio, encoded):
+            path = os.path.join(test_dir, str(type(audio_data)), "out.wav")
+            self.assertEqual(decode_audio_to_file(audio_data, path), path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), _audio)
+            with self.assertRaises(FileExistsError):
+                decode_audio_to_file(audio_data, path)
+
+    def test_body_patterns(self):
+        routing_key = str(uuid4())
+        patterns = get_body_patterns(routing_key)
+        codecs = [LEGACY_CODEC]
+        if msgpack:
+            codecs.append(get_codec(MSGPACK_CONTENT_TYPE))
+        for codec in codecs:
+            # Check every offset of the routing key in a base64 body
+            for padding in range(3):
+                message = {"msg_type": "klat.error" + "_" * padding,
+                           "data": {}, "context": {}}
+                message["context"]["routing_key"] = routing_key
+                body = codec.encode(message)
+                self.assertTrue(any(p in body for p in patterns))
+                message["context"]["routing_key"] = str(uuid4())
+                body = codec.encode(message)
+                self.assertFalse(any(p in body for p in patterns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+import os
+import sys
+import unittest
+
+from tempfile import mkdtemp
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.tracing import JsonLinesExporter, MemoryExporter, NOOP_SPAN, \
+    Tracer, get_current_span, get_exporter, parse_traceparent, to_otlp
+
+
+class TestTracer(unittest.TestCase):
+    def test_spans(self):
+        exporter = MemoryExporter()
+        tracer = Tracer(exporter)
+        with tracer.span("root", None, {"input": "text"}) as root:
+            self.assertIs(get_current_span(), root)
+            child = tracer.start_span("child")
+            tracer.record_span("recorded", 1.0, 2.0)
+            child.end()
+            child.end(child.end_time + 1)
+        self.assertIsNone(get_current_span())
+        self.assertEqual([s.name for s in exporter.spans],
+                         ["recorded", "child", "root"])
+        for span in exporter.spans:
+            self.assertEqual(span.trace_id, root.trace_id)
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(exporter.get_spans("recorded")[0].duration, 1.0)
+        self.assertEqual(root.attributes, {"input": "text"})
+
+        # Continue a trace from a `traceparent`
+        remote = tracer.start_span("remote", root.traceparent)
+        self.assertEqual(remote.trace_id, root.trace_id)
+        self.assertEqual(remote.parent_id, root.span_id)
+        self.assertEqual(parse_traceparent(root.traceparent),
+                         (root.trace_id, root.span_id, True))
+        self.assertIsNone(parse_traceparent("invalid"))
+
+        # Errors are recorded and raised
+        with self.assertRaises(ValueError):
+            with tracer.span("error"):
+                raise ValueError("test")
+        self.assertIn("ValueError", exporter.get_spans("error")[0].error)
+
+    def test_sampling(self):
+        exporter = MemoryExporter()
+        with Tracer().span("disabled") as span:
+            self.assertIs(span, NOOP_SPAN)
+            self.assertIsNone(span.traceparent)
+        tracer = Tracer(exporter, sample_rate=0)
+        with tracer.span("root") as root:
+            self.assertFalse(root.recording)
+            self.assertFalse(tracer.start_span("child").recording)
+        self.assertFalse(tracer.start_span(
+            "remote", f"00-{'1' * 32}-{'2' * 16}-00").recording)
+        # Sampled parents are always recorded
+        self.assertTrue(tracer.start_span(
+            "remote", f"00-{'1' * 32}-{'2' * 16}-01").recording)
+        root.end()
+        self.assertEqual(exporter.spans, [])
+
+    def test_exporters(self):
+        path = os.path.join(mkdtemp(), "traces", "spans.jsonl")
+        exporter = get_exporter({"trace_file": path})
+        self.assertIsInstance(exporter, JsonLinesExporter)
+        self.assertIs(get_exporter({"trace_file": path}), exporter)
+        self.assertIsNone(get_exporter({}))
+        tracer = Tracer(exporter)
+        with tracer.span("root", None, {"count": 2}):
+            tracer.record_span("child", 1.0, 2.0)
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([s["name"] for s in spans], ["child", "root"])
+        self.assertEqual(spans[0]["parent_id"], spans[1]["span_id"])
+        self.assertEqual(spans[1]["attributes"], {"count": 2})
+
+        memory = MemoryExporter()
+        Tracer(memory).record_span("test", 1.0, 2.5, None,
+                                   {"ok": True, "lang": "en-us"})
+        otlp = to_otlp(memory.spans)
+        span = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertEqual(span["startTimeUnixNano"], "1000000000")
+        self.assertEqual(span["endTimeUnixNano"], "2500000000")
+        self.assertNotIn("parentSpanId", span)
+        self.assertEqual(span["attributes"][0],
+                         {"key": "ok", "value": {"boolValue": True}})
+
+
+class TestClientTracing(unittest.TestCase):
+    def test_client(self):
+        from neon_iris.client import NeonAIClient
+        from neon_iris.testing.fake_mq import FakeNeonCore, \
+            fake_mq_connection
+        exporter = MemoryExporter()
+        with fake_mq_connection() as broker, \
+                FakeNeonCore(broker, latency=0.05), \
+                patch("neon_iris.client.Configuration",
+                      Mock(return_value={"iris": {}})), \
+                patch("neon_iris.client.xdg_cache_home",
+                      Mock(return_value=mkdtemp())), \
+                patch("neon_iris.client.get_tracer",
+                      Mock(return_value=Tracer(exporter))):
+            client = NeonAIClient({"server": "localhost"}, mkdtemp())
+            with client.tracer.span("test.input", None) as root:
+                future = client.send_utterance("hello")
+                response = future.wait_for_response(5)
+            self.assertIsNotNone(response)
+            self.assertEqual(response.context["traceparent"],
+                             future.span.traceparent)
+            client.send_utterances(["one", "two"])[1].wait_for_response(5)
+            client.shutdown()
+        spans = [s for s in exporter.spans if s.trace_id == root.trace_id]
+        names = {s.name for s in spans}
+        self.assertEqual(names, {"test.input", "iris.request",
+                                 "iris.serialize", "iris.queue", "mq.publish",
+                                 "neon.core", "mq.response", "iris.decode",
+                                 "iris.handle"})
+        request = future.span
+        self.assertEqual(request.parent_id, root.span_id)
+        self.assertIsNotNone(request.end_time)
+        for span in spans:
+            if span not in (root, request):
+                self.assertEqual(span.parent_id, request.span_id, span.name)
+        core = [s for s in spans if s.name == "neon.core"][0]
+        self.assertIn("client_from_core", core.attributes)
+
+        batch = exporter.get_spans("iris.request")[1:]
+        self.assertEqual(len(batch), 2)
+        self.assertNotEqual(batch[0].trace_id, batch[1].trace_id)
+        self.assertEqual(len(exporter.get_spans("mq.publish")), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,315 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.metrics import MetricsRegistry
+from neon_iris.wakeword import CHUNK_SAMPLES, FrameQueue, WakeWordBatcher, \
+    WakeWordModel, WakeWordStream
+
+WW_MODEL = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "neon_iris", "wakeword_models", "hey_neon",
+    "hey_neon_high.onnx")
+
+
+class TestFrameQueue(unittest.TestCase):
+    def test_drop_oldest(self):
+        async def _test():
+            registry = MetricsRegistry()
+            frames = FrameQueue(max_size=2, max_age=0, registry=registry)
+            for i in range(4):
+                frames.put(bytes([i]), 48000)
+            self.assertEqual(len(frames), 2)
+            self.assertEqual(frames.dropped, 2)
+            frame = await frames.get()
+            self.assertEqual(frame.audio, b"\x02")
+            self.assertEqual(frame.sample_rate, 48000)
+            self.assertEqual((await frames.get()).audio, b"\x03")
+            self.assertEqual(registry.counter(
+                "iris_ww_frames_dropped_total", "",
+                ("reason",)).get(reason="full"), 2)
+
+        asyncio.run(_test())
+
+    def test_drop_stale(self):
+        async def _test():
+            frames = FrameQueue(max_size=4, max_age=1.0,
+                                registry=MetricsRegistry())
+            with patch("neon_iris.wakeword.time", return_value=0):
+                frames.put(b"old")
+            with patch("neon_iris.wakeword.time", return_value=1.5):
+                frames.put(b"new")
+                self.assertEqual((await frames.get()).audio, b"new")
+            self.assertEqual(frames.dropped, 1)
+
+        asyncio.run(_test())
+
+    def test_wait_and_close(self):
+        async def _test():
+            frames = FrameQueue(registry=MetricsRegistry())
+            getter = asyncio.ensure_future(frames.get())
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())
+            frames.put(b"frame")
+            self.assertEqual((await getter).audio, b"frame")
+
+            getter = asyncio.ensure_future(frames.get())
+            await asyncio.sleep(0)
+            frames.close()
+            self.assertIsNone(await getter)
+            frames.put(b"ignored")
+            self.assertEqual(len(frames), 0)
+            self.assertIsNone(await frames.get())
+
+        asyncio.run(_test())
+
+
+class TestWakeWordStream(unittest.TestCase):
+    def _get_stream(self) -> WakeWordStream:
+        model = MagicMock(labels=["test"],
+                          initial_melspectrogram=np.ones((76, 32)),
+                          initial_features=np.zeros((16, 96)))
+        return WakeWordStream(model)
+
+    def test_add_audio(self):
+        stream = self._get_stream()
+        audio = np.arange(4096, dtype=np.int16)
+        chunks = stream.add_audio(audio)
+        self.assertEqual(chunks.shape, (3, CHUNK_SAMPLES + 480))
+        self.assertEqual(chunks.dtype, np.float32)
+        # Each chunk is preceded by the end of the previous chunk
+        np.testing.assert_array_equal(chunks[0, :480], np.zeros(480))
+        np.testing.assert_array_equal(chunks[1, :480],
+                                      audio[CHUNK_SAMPLES - 480:CHUNK_SAMPLES])
+        np.testing.assert_array_equal(chunks[2, 480:],
+                                      audio[2 * CHUNK_SAMPLES:
+                                            3 * CHUNK_SAMPLES])
+
+        # Remaining samples are buffered for the next frame
+        chunks = stream.add_audio(audio[:CHUNK_SAMPLES])
+        self.assertEqual(chunks.shape[0], 1)
+        np.testing.assert_array_equal(chunks[0, 480:736], audio[3840:])
+        self.assertEqual(stream.add_audio(audio[:10]).shape[0], 0)
+
+    def test_update_predictions(self):
+        stream = self._get_stream()
+        for _ in range(5):
+            self.assertEqual(stream.update_predictions(
+                {"test": np.array([[0.9]])}), {"test": 0.0})
+        self.assertEqual(stream.update_predictions(
+            {"test": np.array([[0.2], [0.7]], dtype=np.float32)}),
+            {"test": np.float32(0.7)})
+        # Frames without a complete chunk repeat the last predictions
+        self.assertEqual(stream.update_predictions(dict()),
+                         {"test": np.float32(0.7)})
+
+
+@unittest.skipUnless(find_spec("openwakeword") and find_spec("onnxruntime"),
+                     "openwakeword and onnxruntime are required")
+class TestWakeWordModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = WakeWordModel([WW_MODEL])
+        rand = np.random.RandomState(1)
+        cls.audio = [rand.randint(-3000, 3000, 4096 * 8).astype(np.int16)
+                     for _ in range(2)]
+        cls.expected = list()
+        for samples in cls.audio:
+            stream = cls.model.create_stream()
+            cls.expected.append([cls.model.predict(stream, f)
+                                 for f in cls._frames(samples)])
+
+    @staticmethod
+    def _frames(samples):
+        return [samples[i:i + 4096] for i in range(0, len(samples), 4096)]
+
+    def _assert_predictions(self, predictions, expected):
+        # Batched inference may differ slightly from one frame at a time
+        self.assertEqual(set(predictions), set(expected))
+        for label, score in expected.items():
+            self.assertAlmostEqual(predictions[label], score, places=5)
+
+    def test_streams_are_independent(self):
+        model = self.model
+        self.assertEqual(model.labels, ["hey_neon_high"])
+        # Interleaving frames of different streams does not change results
+        streams = [model.create_stream(), model.create_stream()]
+        for idx, frames in enumerate(zip(*map(self._frames, self.audio))):
+            for stream_idx, frame in enumerate(frames):
+                self.assertEqual(model.predict(streams[stream_idx], frame),
+                                 self.expected[stream_idx][idx])
+        self.assertNotEqual(self.expected[0][-1], self.expected[1][-1])
+
+    def test_openwakeword_parity(self):
+        pytest.importorskip("openwakeword")
+        from openwakeword import Model
+        # openWakeWord initializes features from unseeded noise; seed it to
+        # match the noise WakeWordModel uses
+        np.random.seed(0)
+        reference = Model(wakeword_models=[WW_MODEL],
+                          inference_framework="onnx")
+        stream = self.model.create_stream()
+        scores = list()
+        for frame in self._frames(self.audio[0]):
+            expected = reference.predict(frame)
+            predictions = self.model.predict(stream, frame)
+            self.assertEqual(set(predictions), set(expected))
+            scores.append([(predictions[label], float(score))
+                           for label, score in expected.items()])
+        scores = np.array(scores)
+        self.assertTrue(np.any(scores > 0))
+        np.testing.assert_allclose(scores[..., 0], scores[..., 1],
+                                   rtol=1e-3, atol=1e-5)
+        # Streaming features match too
+        np.testing.assert_allclose(
+            stream._features[-16:],
+            reference.preprocessor.get_features(16)[0], atol=1e-5)
+
+    def test_predict_batch(self):
+        model = self.model
+        # Batches of frames from many streams match sequential predictions
+        streams = [model.create_stream(), model.create_stream()]
+        for idx, frames in enumerate(zip(*map(self._frames, self.audio))):
+            results = model.predict_batch(list(zip(streams, frames)))
+            for result, expected in zip(results, self.expected):
+                self._assert_predictions(result, expected[idx])
+
+        # Frames that do not complete a chunk may be batched with others
+        streams = [model.create_stream(), model.create_stream()]
+        for idx, frame in enumerate(self._frames(self.audio[0])):
+            results = model.predict_batch([(streams[1], self.audio[1][:100]),
+                                           (streams[0], frame)])
+            self._assert_predictions(results[1], self.expected[0][idx])
+
+        with self.assertRaises(ValueError):
+            model.predict_batch([(streams[0], self.audio[0]),
+                                 (streams[0], self.audio[0])])
+
+
+class TestWakeWordBatcher(unittest.TestCase):
+    def test_predict(self):
+        model = MagicMock()
+        model.predict_batch.side_effect = \
+            lambda frames: [{"test": float(audio[0])} for _, audio in frames]
+        batcher = WakeWordBatcher(model, max_batch=3, max_delay=0.01,
+                                  registry=MetricsRegistry())
+        streams = [MagicMock() for _ in range(3)]
+
+        async def _test():
+            return await asyncio.gather(
+                *[batcher.predict(streams[idx % 3], np.array([idx]))
+                  for idx in range(5)],
+                batcher.predict(streams[0], np.array([5])))
+
+        results = asyncio.run(_test())
+        self.assertEqual([r["test"] for r in results], list(range(6)))
+        # Frames are batched, with at most one frame per stream in a batch
+        batches = [[(stream, audio[0]) for stream, audio in call[0][0]]
+                   for call in model.predict_batch.call_args_list]
+        self.assertEqual(batches, [
+            [(streams[0], 0), (streams[1], 1), (streams[2], 2)],
+            [(streams[0], 3), (streams[1], 4)],
+            [(streams[0], 5)]])
+
+    def test_stream_order_without_delay(self):
+        running = set()
+        overlapped = list()
+
+        def _predict_batch(frames):
+            streams = {id(stream) for stream, _ in frames}
+            overlapped.extend(running & streams)
+            running.update(streams)
+            sleep(0.01)
+            running.difference_update(streams)
+            return [{"test": float(audio[0])} for _, audio in frames]
+
+        model = MagicMock()
+        model.predict_batch.side_effect = _predict_batch
+        executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(executor.shutdown)
+        batcher = WakeWordBatcher(model, executor, max_batch=1, max_delay=0,
+                                  max_concurrent=4,
+                                  registry=MetricsRegistry())
+        stream = MagicMock()
+
+        async def _test():
+            return await asyncio.gather(
+                *[batcher.predict(stream, np.array([idx]))
+                  for idx in range(4)])
+
+        results = asyncio.run(_test())
+        self.assertEqual([r["test"] for r in results], list(range(4)))
+        # Frames of one stream are never processed concurrently
+        self.assertEqual(overlapped, [])
+        self.assertEqual([call[0][0][0][1][0] for call in
+                          model.predict_batch.call_args_list], list(range(4)))
+
+    def test_cancelled_frames(self):
+        model = MagicMock()
+        model.predict_batch.side_effect = \
+            lambda frames: [{"test": 1.0} for _ in frames]
+        batcher = WakeWordBatcher(model, max_delay=0.01,
+                                  registry=MetricsRegistry())
+
+        async def _test():
+            task = asyncio.ensure_future(batcher.predict(MagicMock(),
+                                                         np.zeros(10)))
+            await asyncio.sleep(0)
+            task.cancel()
+            # Dispatch finds only cancelled frames with no batch running
+            await asyncio.sleep(0.05)
+            self.assertIsNone(batcher._dispatcher.exception())
+            return await batcher.predict(MagicMock(), np.zeros(10))
+
+        self.assertEqual(asyncio.run(_test()), {"test": 1.0})
+        self.assertEqual(model.predict_batch.call_count, 1)
+
+    def test_predict_error(self):
+        model = MagicMock()
+        model.predict_batch.side_effect = RuntimeError("test")
+        batcher = WakeWordBatcher(model, max_delay=0,
+                                  registry=MetricsRegistry())
+        with self.assertRaises(RuntimeError):
+            asyncio.run(batcher.predict(MagicMock(), np.zeros(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+from contextlib import ExitStack
+from importlib import import_module
+from importlib.util import find_spec
+from tempfile import mkdtemp
+from time import time
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_iris.models.web_sat import UserInput
+from neon_iris.testing.fake_mq import FakeNeonCore, fake_mq_connection
+
+LATENCY = 0.3
+
+
+@unittest.skipUnless(all(find_spec(m) for m in ("fastapi", "jinja2",
+                                               "openwakeword",
+                                               "onnxruntime")),
+                     "web_sat requirements not installed")
+class TestWebSatNeonClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.stack = ExitStack()
+        broker = cls.stack.enter_context(fake_mq_connection())
+        cls.core = cls.stack.enter_context(FakeNeonCore(
+            broker, latency={"recognizer_loop:utterance": LATENCY}))
+        config = Mock(return_value={"MQ": {"server": "localhost"},
+                                    "iris": {}})
+        cls.stack.enter_context(patch("ovos_config.Configuration", config))
+        cls.stack.enter_context(patch("neon_iris.client.Configuration",
+                                      config))
+        cls.stack.enter_context(patch("neon_iris.client.xdg_cache_home",
+                                      Mock(return_value=mkdtemp())))
+        cls.stack.enter_context(patch("neon_iris.client.xdg_config_home",
+                                      Mock(return_value=mkdtemp())))
+        cls.client = import_module("neon_iris.web_sat_client").neon_client
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.shutdown()
+        cls.stack.close()
+
+    def test_session_ordering(self):
+        route = next(r for r in self.client.router.routes
+                     if r.path == "/user_input")
+        responded = dict()
+        respond_utterance = self.core.responders["recognizer_loop:utterance"]
+
+        def _respond(request):
+            responded[request["data"]["utterances"][0]] = time()
+            return respond_utterance(request)
+
+        self.core.responders["recognizer_loop:utterance"] = _respond
+        self.addCleanup(self.core.responders.__setitem__,
+                        "recognizer_loop:utterance", respond_utterance)
+
+        async def _run():
+            return await asyncio.gather(*(
+                route.endpoint(UserInput(utterance=utterance,
+                                         session_id=session))
+                for utterance, session in (("a1", "a"), ("a2", "a"),
+                                           ("b1", "b"))))
+
+        responses = asyncio.run(_run())
+        self.assertEqual([r.transcription for r in responses],
+                         ["You said a1", "You said a2", "You said b1"])
+        self.assertEqual([r.session_id for r in responses], ["a", "a", "b"])
+        # Requests in one session are sent after the previous one completes
+        self.assertGreaterEqual(responded["a2"] - responded["a1"],
+                                LATENCY * 0.9)
+        # Requests in different sessions are handled concurrently
+        self.assertLess(abs(responded["b1"] - responded["a1"]), LATENCY / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()